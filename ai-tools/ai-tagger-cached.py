@@ -8,7 +8,6 @@ import argparse
 import hashlib
 from pathlib import Path
 from typing import List, Dict, Any, Set, Optional, Tuple
-import requests
 import numpy as np
 from sentence_transformers import SentenceTransformer
 from tqdm import tqdm
@@ -19,6 +18,29 @@ from datetime import datetime
 
 # Import the cache system
 from obsidian_cache import ObsidianCache
+from obsidian_sqlite_cache import SQLiteObsidianCache
+from obsidian_similarity import SimilarityEngine
+from obsidian_ann import IVFIndex
+from obsidian_backlinks import BacklinkIndex
+from obsidian_link_graph import LinkGraph
+from obsidian_chunker import MarkdownChunker
+from obsidian_markdown import (
+    MarkdownParser,
+    MarkdownStructure,
+    add_frontmatter_tags,
+    replace_managed_section,
+    strip_managed_section,
+)
+from obsidian_scanner import VaultScanner
+from obsidian_sidecar import SidecarStore
+from obsidian_watcher import VaultWatcher
+from obsidian_writer import DocumentWriter
+from obsidian_llm import (
+    DEFAULT_MAX_TOKENS,
+    ClaudeClient,
+    LLMResponseCache,
+    MessageBatchRunner,
+)
 
 
 class AdvancedObsidianProcessor:
@@ -72,6 +94,39 @@ class AdvancedObsidianProcessor:
         self.model = model or config.get("model", "claude-3-5-sonnet-20241022")
         self.similarity_threshold = similarity_threshold
         self.use_cache = use_cache
+        self.embedding_batch_size = int(config.get("embedding_batch_size", 32))
+        self.chunker = MarkdownChunker(int(config.get("embedding_chunk_chars", 1000)))
+        self.markdown = MarkdownParser(int(config.get("markdown_cache_entries", 4096)))
+        self.writer = DocumentWriter(
+            max_workers=int(config.get("write_workers", 8)),
+            fsync=config.get("write_fsync", "batch"),
+        )
+        self.similarity_top_k = config.get("similarity_top_k")
+        self.max_suggested_links = int(config.get("max_suggested_links", 3))
+        self.tag_batch_token_budget = int(config.get("tag_batch_token_budget", 0))
+        self.tag_group_threshold = float(config.get("tag_group_threshold", 0.8))
+        self.cache_max_bytes = int(config.get("cache_max_bytes", 0))
+        self.watch_debounce = float(config.get("watch_debounce", 0.3))
+        self.watch_poll_interval = float(config.get("watch_poll_interval", 2.0))
+        self.similarity_engine = SimilarityEngine(
+            block_size=int(config.get("similarity_block_size", 1024))
+        )
+
+        # Optional approximate nearest-neighbor search for large vaults
+        self.ann_enabled = bool(config.get("ann_index", False))
+        self.ann_nlist = config.get("ann_nlist")
+        self.ann_nprobe = int(config.get("ann_nprobe", 8))
+        self.ann_candidates = int(config.get("ann_candidates", 50))
+        self.ann_recall_sample = int(config.get("ann_recall_sample", 100))
+        self.ann_index = None
+
+        # Vault discovery honours .gitignore-style include/exclude globs
+        self.scanner = VaultScanner(
+            vault_path,
+            include=config.get("scan_include"),
+            exclude=config.get("scan_exclude"),
+            max_workers=int(config.get("scan_workers", 8)),
+        )
 
         # Initialize cache system
         if self.use_cache:
@@ -79,88 +134,193 @@ class AdvancedObsidianProcessor:
                 "cache_dir",
                 os.path.join(os.path.dirname(vault_path), ".obsidian_cache"),
             )
-            self.logger.info(f"Initializing cache in {cache_directory}")
-            self.cache = ObsidianCache(cache_directory, vault_path)
+            cache_backend = config.get("cache_backend", "pickle")
+            self.logger.info(f"Initializing {cache_backend} cache in {cache_directory}")
+            if cache_backend == "sqlite":
+                self.cache = SQLiteObsidianCache(
+                    cache_directory,
+                    vault_path,
+                    commit_every=int(config.get("cache_commit_every", 500)),
+                )
+            elif cache_backend == "pickle":
+                self.cache = ObsidianCache(cache_directory, vault_path)
+            else:
+                raise ValueError(f"Unknown cache_backend {cache_backend!r}")
         else:
             self.cache = None
             self.logger.info("Caching disabled")
 
+        # Concurrent, rate-limited Claude client shared by all generation stages
+        self.llm_client = ClaudeClient(
+            api_key=self.api_key,
+            model=self.model,
+            api_base_url=config.get("api_base_url", "https://api.anthropic.com"),
+            max_in_flight=int(config.get("max_concurrent_requests", 4)),
+            requests_per_minute=float(config.get("requests_per_minute", 50)),
+            tokens_per_minute=float(config.get("tokens_per_minute", 40000)),
+            max_retries=int(config.get("max_retries", 5)),
+            timeout=float(config.get("request_timeout", 30)),
+            pool_size=config.get("connection_pool_size"),
+            response_cache=(
+                LLMResponseCache(
+                    self.cache.cache_dir / "llm_responses.sqlite",
+                    max_bytes=int(config.get("llm_cache_max_bytes", 100 * 1024 * 1024)),
+                )
+                if self.use_cache and self.cache
+                else None
+            ),
+        )
+
+        # Offline runs answer all prompts through one Message Batches job
+        self.batch_runner = (
+            MessageBatchRunner(
+                self.llm_client,
+                self.cache.cache_dir / "pending_batch.json",
+                poll_interval=float(config.get("batch_poll_interval", 30)),
+                poll_timeout=float(config.get("batch_poll_timeout", 3600)),
+            )
+            if self.use_cache and self.cache
+            else None
+        )
+
         # Initialize embedding model for semantic analysis
-        embedding_model_name = embedding_model or config.get(
+        # (loaded on first use, so cache maintenance and no-op runs skip it)
+        self.embedding_model_name = embedding_model or config.get(
             "embedding_model", "all-MiniLM-L6-v2"
         )
-        self.logger.info(f"Loading sentence embedding model: {embedding_model_name}")
-        self.embedding_model = SentenceTransformer(embedding_model_name)
+        self._embedding_model = None
 
         # Ensure vault path exists
         if not os.path.exists(self.vault_path):
             raise ValueError(f"Vault path {self.vault_path} does not exist")
 
-        # Knowledge graph to track document relationships
-        self.knowledge_graph = {}
+        # Knowledge graph of the links between notes, kept in the cache dir
+        self.link_graph = LinkGraph(
+            vault_path,
+            (
+                self.cache.cache_dir / "link_graph.npz"
+                if self.use_cache and self.cache
+                else None
+            ),
+            self.markdown,
+        )
+        self.knowledge_graph = self.link_graph
+
+        # Generated output goes into the notes, a sidecar database, or both
+        self.output_mode = config.get("output_mode", "inline")
+        if self.output_mode not in ("inline", "sidecar", "both"):
+            raise ValueError(f"Unknown output_mode {self.output_mode!r}")
+        self.sidecar = (
+            SidecarStore(
+                config.get("sidecar_path")
+                or os.path.join(vault_path, ".obsidian", "ai-tagger.sqlite")
+            )
+            if self.output_mode != "inline"
+            else None
+        )
         self.backlinks = {}
+        # Built from every cached similarity list, then patched each run
+        self.backlink_index = BacklinkIndex()
+        self.backlink_index_file = (
+            self.cache.cache_dir / "backlinks.npz"
+            if self.use_cache and self.cache
+            else None
+        )
+        self.backlink_index_complete = (
+            self.backlink_index_file is None
+            or self.backlink_index.load(self.backlink_index_file)
+        )
 
         # Tag management
         self.document_tags = {}  # Store tags for each document
         self.tag_clusters = defaultdict(set)  # Group similar documents by tag
-        self.global_tag_map = {}  # Map content signatures to consistent tags
 
         # Track processed and changed files
         self.changed_files = []
         self.unchanged_files = []
+        self.stat_refreshed_files = 0
+        self.vault_files = None
+        self.affected_notes = {}  # Unchanged notes whose similarities changed
+        self.file_stats = {}  # Stat of each note read or written in this run
+        self.written_files = {}  # Stat of each note right after we wrote it
+
+    @property
+    def embedding_model(self) -> SentenceTransformer:
+        """Sentence embedding model, loaded on first use"""
+        if self._embedding_model is None:
+            self.logger.info(
+                f"Loading sentence embedding model: {self.embedding_model_name}"
+            )
+            self._embedding_model = SentenceTransformer(self.embedding_model_name)
+        return self._embedding_model
 
-    def read_markdown_files(self) -> List[Dict[str, str]]:
+    def read_markdown_files(
+        self, touched_paths: Optional[List[str]] = None
+    ) -> List[Dict[str, str]]:
         """
         Read all markdown files in the vault
 
+        :param touched_paths: Only check these paths (from the watcher); every
+            other note of the previous scan counts as unchanged
         :return: List of dictionaries with file info
         """
         markdown_files = []
+        known_files = self.vault_files
         self.changed_files = []
         self.unchanged_files = []
+        self.stat_refreshed_files = 0
+        self.vault_files = None
+        self.file_stats = {}
         self.logger.info(f"Scanning for markdown files in {self.vault_path}")
 
         try:
-            for root, _, files in tqdm(
-                os.walk(self.vault_path), desc="Discovering Markdown Files"
-            ):
-                for file in files:
-                    if file.endswith(".md"):
-                        full_path = os.path.join(root, file)
-                        try:
-                            with open(full_path, "r", encoding="utf-8") as f:
-                                content = f.read()
-
-                                # Check if file has changed since last processing
-                                file_changed = True
-                                if self.use_cache and self.cache:
-                                    file_changed = self.cache.is_file_changed(
-                                        full_path, content
-                                    )
-
-                                if file_changed:
-                                    self.changed_files.append(full_path)
-                                    markdown_files.append(
-                                        {
-                                            "filename": file,
-                                            "path": full_path,
-                                            "content": content,
-                                        }
-                                    )
-                                    # Update file metadata in cache
-                                    if self.use_cache and self.cache:
-                                        self.cache.update_file_metadata(
-                                            full_path, content
-                                        )
-                                else:
-                                    self.unchanged_files.append(full_path)
-                                    self.logger.debug(
-                                        f"Skipping unchanged file: {full_path}"
-                                    )
-
-                        except Exception as e:
-                            self.logger.warning(f"Failed to read {full_path}: {e}")
+            if touched_paths is None or known_files is None:
+                all_paths = self.scanner.discover()
+                paths = all_paths
+            else:
+                touched = set(touched_paths)
+                all_paths = self._apply_touched_paths(known_files, touched)
+                paths = [path for path in all_paths if path in touched]
+                self.unchanged_files = [
+                    path for path in all_paths if path not in touched
+                ]
+
+            results = self.scanner.map(
+                self._read_markdown_file, paths, desc="Reading Markdown Files"
+            )
+
+            for full_path, result in zip(paths, results):
+                if result is None:
+                    continue
+                content, content_hash, stat, file_changed = result
+                self.file_stats[full_path] = stat
 
+                if file_changed:
+                    self.changed_files.append(full_path)
+                    markdown_files.append(
+                        {
+                            "filename": os.path.basename(full_path),
+                            "path": full_path,
+                            "content": content,
+                            "content_hash": content_hash,
+                            "links": self.build_link_index(content, content_hash),
+                        }
+                    )
+                    # Update file metadata in cache
+                    if self.use_cache and self.cache:
+                        self.cache.invalidate_note(os.path.basename(full_path))
+                        self.cache.update_file_metadata(
+                            full_path, content, stat, content_hash
+                        )
+                else:
+                    # Touched but identical: remember the new stat to skip the read
+                    if content is not None:
+                        self.cache.refresh_file_stat(full_path, stat, content_hash)
+                        self.stat_refreshed_files += 1
+                    self.unchanged_files.append(full_path)
+                    self.logger.debug(f"Skipping unchanged file: {full_path}")
+
+            self.vault_files = all_paths
             total_files = len(markdown_files) + len(self.unchanged_files)
             self.logger.info(f"Found {total_files} markdown files total")
             self.logger.info(f"Processing {len(markdown_files)} changed files")
@@ -171,32 +331,84 @@ class AdvancedObsidianProcessor:
             self.logger.error(f"Error scanning vault: {e}")
             return []
 
-    def extract_existing_links(self, content: str) -> List[str]:
+    def _apply_touched_paths(
+        self, known_files: List[str], touched: Set[str]
+    ) -> List[str]:
+        """
+        Update the list of vault notes for paths reported by the watcher
+
+        :param known_files: Notes of the previous scan
+        :param touched: Created, modified or removed notes and removed directories
+        :return: Notes of the vault in scan order
+        """
+        removed_directories = tuple(
+            path.rstrip(os.sep) + os.sep for path in touched if not os.path.exists(path)
+        )
+        files = {
+            path
+            for path in known_files
+            if path not in touched and not path.startswith(removed_directories)
+        }
+        files.update(
+            path
+            for path in touched
+            if os.path.isfile(path) and self.scanner.accepts(path)
+        )
+        return sorted(files, key=self.scanner.sort_key)
+
+    def _read_markdown_file(
+        self, full_path: str
+    ) -> Optional[Tuple[Optional[str], Optional[str], List[int], bool]]:
+        """
+        Stat, and if needed read and hash, one file; runs on the scanner's thread pool
+
+        Files whose (size, mtime_ns, inode) match the cache are not opened.
+
+        :param full_path: Path to the file
+        :return: Tuple of (content, content hash, stat, changed flag), with no
+            content or hash when the stat matched; None on error
+        """
+        try:
+            stat = ObsidianCache.get_file_stat(full_path)
+            if (
+                self.use_cache
+                and self.cache
+                and self.cache.is_file_stat_unchanged(full_path, stat)
+            ):
+                return None, None, stat, False
+
+            with open(full_path, "r", encoding="utf-8") as f:
+                content = f.read()
+            content_hash = ObsidianCache.get_content_hash(content)
+
+            # Only a different content hash counts as a change
+            file_changed = True
+            if self.use_cache and self.cache:
+                file_changed = self.cache.is_file_changed(
+                    full_path, content, content_hash
+                )
+            return content, content_hash, stat, file_changed
+        except Exception as e:
+            self.logger.warning(f"Failed to read {full_path}: {e}")
+            return None
+
+    def extract_existing_links(
+        self, content: str, content_hash: Optional[str] = None
+    ) -> List[str]:
         """
         Extract existing links from markdown content
 
         :param content: Document content
+        :param content_hash: Optional precomputed content hash
         :return: List of existing links
         """
-        # Extract links in various markdown formats
-        link_patterns = [
-            r"\[\[([^\]|]+)(?:\|[^\]]+)?\]\]",  # Obsidian wiki-style links with optional alias
-            r"\[([^\]]+)\]\(([^\)]+)\)",  # Markdown standard links
-        ]
+        structure = self.markdown.parse(content, content_hash)
 
-        existing_links = []
-        for pattern in link_patterns:
-            matches = re.findall(pattern, content)
-
-            # Handle different match formats
-            for match in matches:
-                if isinstance(match, tuple):
-                    # For standard markdown links, use the URL part
-                    if len(match) > 1:
-                        existing_links.append(match[1])  # URL part
-                    existing_links.append(match[0])  # Text part
-                else:
-                    existing_links.append(match)
+        # Wiki-style targets, then the URL and text of standard markdown links
+        existing_links = list(structure.wiki_links)
+        for text, url in structure.markdown_links:
+            existing_links.append(url)
+            existing_links.append(text)
 
         # Debug output
         if existing_links:
@@ -204,53 +416,42 @@ class AdvancedObsidianProcessor:
 
         return existing_links
 
-    def extract_existing_tags(self, content: str) -> Set[str]:
+    def build_link_index(
+        self, content: str, content_hash: Optional[str] = None
+    ) -> Set[str]:
+        """
+        Build the set of normalized link targets for a document, once per content
+
+        :param content: Document content
+        :param content_hash: Optional precomputed content hash
+        :return: Set of link target basenames
+        """
+        content_hash = content_hash or ObsidianCache.get_content_hash(content)
+        if self.use_cache and self.cache:
+            cached_links = self.cache.get_links(content_hash)
+            if cached_links is not None:
+                return cached_links
+
+        links = {
+            os.path.basename(link)
+            for link in self.extract_existing_links(content, content_hash)
+        }
+        if self.use_cache and self.cache:
+            self.cache.set_links(content_hash, links)
+        return links
+
+    def extract_existing_tags(
+        self, content: str, content_hash: Optional[str] = None
+    ) -> Set[str]:
         """
         Extract existing Obsidian tags from markdown content
 
         :param content: Document content
+        :param content_hash: Optional precomputed content hash
         :return: Set of existing tags (without the # symbol)
         """
-        # Extract Obsidian tags (both inline and YAML frontmatter)
-        tags = set()
-
-        # Extract inline tags (#tag format, but not within code blocks)
-        # Split content by code blocks first
-        code_block_pattern = r"```.*?```"
-        content_parts = re.split(code_block_pattern, content, flags=re.DOTALL)
-
-        # Process non-code parts
-        for part in content_parts[::2]:  # Skip code blocks (odd indices)
-            # Find inline tags
-            inline_tags = re.findall(r"(?<!\S)#([a-zA-Z0-9_/-]+)", part)
-            tags.update(inline_tags)
-
-        # Extract YAML frontmatter tags
-        frontmatter_match = re.search(r"^---\s*\n(.*?)\n---", content, re.DOTALL)
-        if frontmatter_match:
-            frontmatter = frontmatter_match.group(1)
-            # Look for tags: or tag: in the frontmatter
-            tag_lines = re.findall(r"tags?:\s*(.*?)(?:\n|$)", frontmatter)
-
-            for line in tag_lines:
-                # Handle array format: tags: [tag1, tag2]
-                if "[" in line and "]" in line:
-                    array_tags = re.findall(r"\[(.*?)\]", line)
-                    if array_tags:
-                        for tag_list in array_tags:
-                            # Split by comma and clean up
-                            for tag in tag_list.split(","):
-                                clean_tag = tag.strip().strip("\"'")
-                                if clean_tag:
-                                    tags.add(clean_tag)
-                # Handle YAML list format with dashes
-                elif "-" in line:
-                    yaml_tags = re.findall(r"-\s*([^\s,]+)", line)
-                    tags.update(yaml_tags)
-                # Handle simple format: tags: tag1 tag2
-                else:
-                    simple_tags = line.strip().split()
-                    tags.update(simple_tags)
+        # Inline tags outside code, plus the tags of the YAML frontmatter
+        tags = set(self.markdown.parse(content, content_hash).tags)
 
         # Debug output
         if tags:
@@ -258,37 +459,112 @@ class AdvancedObsidianProcessor:
 
         return tags
 
-    def semantic_similarity_tagging(
-        self, documents: List[Dict[str, str]]
-    ) -> Dict[str, List[Dict[str, Any]]]:
+    def _embed_documents(
+        self,
+        documents: List[Dict[str, str]],
+        desc: str = "Computing Embeddings",
+    ) -> Dict[str, np.ndarray]:
         """
-        Compute semantic relationships between documents with comprehensive linking
+        Embed documents as the length-weighted mean of their chunk embeddings
+
+        Chunk embeddings of long notes are cached by chunk content hash, so an
+        edit only re-encodes the chunks it touched. Missing chunks are encoded
+        in length-sorted batches. Generated sections are not embedded.
 
         :param documents: List of documents
-        :return: Dictionary of document similarities with link metadata
+        :param desc: Progress bar description
+        :return: Dictionary mapping filenames to embeddings, in document order
         """
-        self.logger.info("Generating document embeddings...")
-        # Generate embeddings for all documents
+        use_cache = self.use_cache and self.cache
         embeddings = {}
-        for doc in tqdm(documents, desc="Computing Embeddings"):
+        note_chunks = []
+        chunk_vectors = {}
+        missing = {}
+        for doc in documents:
             # Check if we have a cached embedding
-            cached_embedding = None
-            if self.use_cache and self.cache:
-                cached_embedding = self.cache.get_embedding(doc["filename"])
-
+            cached_embedding = (
+                self.cache.get_embedding(doc["filename"]) if use_cache else None
+            )
             if cached_embedding is not None:
                 embeddings[doc["filename"]] = cached_embedding
                 self.logger.debug(f"Using cached embedding for {doc['filename']}")
+                continue
+
+            chunks = [
+                (ObsidianCache.get_content_hash(text), text)
+                for text in self.chunker.split(strip_managed_section(doc["content"]))
+            ]
+            note_chunks.append((doc, chunks))
+            for chunk_hash, text in chunks:
+                if chunk_hash in chunk_vectors or chunk_hash in missing:
+                    continue
+                cached_chunk = (
+                    self.cache.get_chunk_embedding(chunk_hash)
+                    if use_cache and len(chunks) > 1
+                    else None
+                )
+                if cached_chunk is not None:
+                    chunk_vectors[chunk_hash] = cached_chunk
+                else:
+                    missing[chunk_hash] = text
+
+        if missing:
+            # Sort by length so each batch pads to a similar sequence length
+            pending = sorted(
+                missing.items(), key=lambda item: len(item[1]), reverse=True
+            )
+            batch_size = max(1, self.embedding_batch_size)
+
+            with tqdm(total=len(pending), desc=desc) as progress:
+                for start in range(0, len(pending), batch_size):
+                    batch = pending[start : start + batch_size]
+                    vectors = self.embedding_model.encode(
+                        [text for _, text in batch],
+                        batch_size=batch_size,
+                        show_progress_bar=False,
+                    )
+                    for (chunk_hash, _), vector in zip(batch, vectors):
+                        chunk_vectors[chunk_hash] = vector
+                    progress.update(len(batch))
+
+        for doc, chunks in note_chunks:
+            if len(chunks) == 1:
+                vector = chunk_vectors[chunks[0][0]]
             else:
-                # Generate new embedding
-                embeddings[doc["filename"]] = self.embedding_model.encode(
-                    doc["content"][:10000]
+                vector = np.average(
+                    np.stack([chunk_vectors[chunk_hash] for chunk_hash, _ in chunks]),
+                    axis=0,
+                    weights=[len(text) for _, text in chunks],
+                ).astype(np.float32)
+            embeddings[doc["filename"]] = vector
+
+            # Cache the embedding, and the chunks of long notes for later edits
+            if use_cache:
+                self.cache.set_embedding(doc["filename"], vector)
+                cached_chunks = (
+                    [chunk_hash for chunk_hash, _ in chunks] if len(chunks) > 1 else []
                 )
-                # Cache the embedding
-                if self.use_cache and self.cache:
-                    self.cache.set_embedding(
-                        doc["filename"], embeddings[doc["filename"]]
+                for chunk_hash in cached_chunks:
+                    self.cache.set_chunk_embedding(
+                        chunk_hash, chunk_vectors[chunk_hash]
                     )
+                self.cache.set_note_chunks(doc["path"], cached_chunks)
+
+        # Restore document order
+        return {doc["filename"]: embeddings[doc["filename"]] for doc in documents}
+
+    def semantic_similarity_tagging(
+        self, documents: List[Dict[str, str]]
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Compute semantic relationships between documents with comprehensive linking
+
+        :param documents: List of documents
+        :return: Dictionary of document similarities with link metadata
+        """
+        self.logger.info("Generating document embeddings...")
+        # Generate embeddings for all documents
+        embeddings = self._embed_documents(documents, desc="Computing Embeddings")
 
         # Compute pairwise similarities with detailed link information
         document_similarities = {}
@@ -298,98 +574,660 @@ class AdvancedObsidianProcessor:
 
         total_similarities_found = 0
 
-        for doc1 in tqdm(documents, desc="Semantic Linking"):
-            # Check if we have cached similarities
+        # Reuse cached similarities; only the remaining documents are scored
+        pending = []
+        for doc in documents:
             cached_similarities = None
             if self.use_cache and self.cache:
-                cached_similarities = self.cache.get_similarities(doc1["filename"])
+                cached_similarities = self.cache.get_similarities(doc["filename"])
 
             if cached_similarities is not None:
-                document_similarities[doc1["filename"]] = cached_similarities
-                self.logger.debug(f"Using cached similarities for {doc1['filename']}")
+                document_similarities[doc["filename"]] = cached_similarities
+                self.logger.debug(f"Using cached similarities for {doc['filename']}")
                 total_similarities_found += len(cached_similarities)
-                continue
+            else:
+                pending.append(doc)
+
+        # Changed notes are compared against every note of the vault, not
+        # just against each other
+        corpus_docs = self._similarity_corpus(documents)
+        corpus_embeddings = dict(embeddings)
+        corpus_embeddings.update(
+            self._embed_documents(
+                [doc for doc in corpus_docs if doc["filename"] not in embeddings],
+                desc="Embedding Unchanged Notes",
+            )
+        )
+        # Unchanged notes that had to be read were embedded in this run too
+        fresh_embeddings = {
+            doc["filename"]: corpus_embeddings[doc["filename"]]
+            for doc in corpus_docs
+            if "content" in doc
+        }
+        filename_rows = defaultdict(set)
+        for row, doc in enumerate(corpus_docs):
+            filename_rows[doc["filename"]].add(row)
 
-            similarities = []
-            doc1_basename = os.path.basename(doc1["filename"])
-
-            for doc2 in documents:
-                if doc1["filename"] != doc2["filename"]:
-                    # Compute similarity score
-                    sim_score = np.dot(
-                        embeddings[doc1["filename"]], embeddings[doc2["filename"]]
-                    ) / (
-                        np.linalg.norm(embeddings[doc1["filename"]])
-                        * np.linalg.norm(embeddings[doc2["filename"]])
+        if self.ann_enabled:
+            self._sync_ann_index(fresh_embeddings)
+        if self.use_cache and self.cache:
+            # Saved embeddings are scored straight from the mapped matrix
+            self.cache.embeddings_cache.save()
+        corpus_matrix = None
+
+        def find_neighbors(query_docs: List[Dict[str, Any]]) -> List[List[str]]:
+            nonlocal corpus_matrix
+            # Skip each document itself and everything it already links to
+            exclude = []
+            for doc in query_docs:
+                links = doc.get("links")
+                if links is None:
+                    links = self.build_link_index(
+                        doc["content"], doc.get("content_hash")
                     )
+                excluded_rows = set(filename_rows[doc["filename"]])
+                for link in links:
+                    excluded_rows.update(filename_rows.get(link, ()))
+                exclude.append(excluded_rows)
 
-                    # Extract existing links to avoid duplicates
-                    existing_links = self.extract_existing_links(doc1["content"])
-
-                    # Normalize existing links and current filename for comparison
-                    normalized_existing_links = [
-                        os.path.basename(link) for link in existing_links
-                    ]
-                    doc2_basename = os.path.basename(doc2["filename"])
-
-                    # Debug information
-                    if sim_score > self.similarity_threshold:
-                        self.logger.debug(
-                            f"High similarity ({sim_score:.2f}) between: {doc1_basename} and {doc2_basename}"
-                        )
-                        if doc2_basename in normalized_existing_links:
-                            self.logger.debug(
-                                f"  - Skipping: {doc2_basename} already linked in {doc1_basename}"
-                            )
-
-                    # Add similar documents as potential links with improved filename comparison
-                    if (
-                        sim_score > self.similarity_threshold
-                        and doc2_basename not in normalized_existing_links
-                    ):
-                        total_similarities_found += 1
-                        similarities.append(
-                            {
-                                "filename": doc2["filename"],
-                                "similarity_score": float(sim_score),
-                                "suggested_link_text": self._generate_link_text(
-                                    doc1, doc2
-                                ),
-                            }
-                        )
-
-            # Sort similarities by score in descending order
-            sorted_similarities = sorted(
-                similarities, key=lambda x: x["similarity_score"], reverse=True
+            queries = self._embedding_matrix(
+                [doc["filename"] for doc in query_docs], corpus_embeddings
             )
-            document_similarities[doc1["filename"]] = sorted_similarities
+            if self.ann_enabled:
+                neighbor_lists = self._ann_neighbors(queries, filename_rows, exclude)
+            else:
+                if corpus_matrix is None:
+                    corpus_matrix = self._embedding_matrix(
+                        [doc["filename"] for doc in corpus_docs], corpus_embeddings
+                    )
+                neighbor_lists = self.similarity_engine.neighbors(
+                    queries,
+                    corpus_matrix,
+                    self.similarity_threshold,
+                    top_k=self.similarity_top_k,
+                    exclude=exclude,
+                )
+            # Link texts are generated later, only for the links that get written
+            return [
+                [
+                    {
+                        "filename": corpus_docs[row]["filename"],
+                        "similarity_score": sim_score,
+                    }
+                    for row, sim_score in neighbors
+                ]
+                for neighbors in neighbor_lists
+            ]
+
+        for doc1, similarities in zip(pending, find_neighbors(pending)):
+            total_similarities_found += len(similarities)
+            document_similarities[doc1["filename"]] = similarities
 
             # Cache the similarities
             if self.use_cache and self.cache:
-                self.cache.set_similarities(doc1["filename"], sorted_similarities)
+                self.cache.set_similarities(doc1["filename"], similarities)
 
             # Debug output for each document
             self.logger.debug(
-                f"Found {len(similarities)} similar documents for {doc1_basename}"
+                f"Found {len(similarities)} similar documents for {doc1['filename']}"
             )
 
+        self._patch_unchanged_similarities(
+            documents, corpus_docs, corpus_embeddings, find_neighbors
+        )
+
+        # Keep results in document order
+        document_similarities = {
+            doc["filename"]: document_similarities[doc["filename"]] for doc in documents
+        }
+
         self.logger.info(
             f"Total similarities found across all documents: {total_similarities_found}"
         )
         return document_similarities
 
-    def _generate_link_text(
+    def _embedding_matrix(
+        self, filenames: List[str], embeddings: Dict[str, np.ndarray]
+    ) -> np.ndarray:
+        """
+        Stack the embeddings of notes into one matrix
+
+        Saved embeddings are read from the cache's memory-mapped matrix by row,
+        as a view when the rows are contiguous.
+
+        :param filenames: Filenames in the order of the matrix rows
+        :param embeddings: Embeddings keyed by filename, for unsaved ones
+        :return: Matrix with one row per filename
+        """
+        if self.use_cache and self.cache:
+            store = self.cache.embeddings_cache
+            rows = [store.row(filename) for filename in filenames]
+            if store.matrix is not None and None not in rows:
+                return self.similarity_engine.gather(store.matrix, rows)
+        return self.similarity_engine.stack(
+            [embeddings[filename] for filename in filenames]
+        )
+
+    def _similarity_corpus(
+        self, documents: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Combine the changed documents with the unchanged notes of the last scan
+
+        Unchanged notes are described from the cache; they are only read from
+        disk when their links or embedding are not cached.
+
+        :param documents: Changed documents
+        :return: All notes in scan order
+        """
+        if not (self.use_cache and self.cache) or self.vault_files is None:
+            return list(documents)
+
+        notes = list(documents)
+        for path in self.unchanged_files:
+            filename = os.path.basename(path)
+            metadata = self.cache.file_metadata.get(
+                os.path.relpath(path, self.vault_path), {}
+            )
+            note = {
+                "filename": filename,
+                "path": path,
+                "content_hash": metadata.get("content_hash"),
+                "links": (
+                    self.cache.get_links(metadata["content_hash"])
+                    if metadata.get("content_hash")
+                    else None
+                ),
+            }
+            if note["links"] is None or self.cache.get_embedding(filename) is None:
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        note["content"] = f.read()
+                except Exception as e:
+                    self.logger.warning(f"Failed to read {path}: {e}")
+                    continue
+                note["content_hash"] = ObsidianCache.get_content_hash(note["content"])
+                note["links"] = self.build_link_index(
+                    note["content"], note["content_hash"]
+                )
+            notes.append(note)
+
+        scan_order = {path: position for position, path in enumerate(self.vault_files)}
+        notes.sort(key=lambda note: scan_order.get(note["path"], len(scan_order)))
+        return notes
+
+    def _patch_unchanged_similarities(
+        self,
+        documents: List[Dict[str, Any]],
+        corpus_docs: List[Dict[str, Any]],
+        corpus_embeddings: Dict[str, np.ndarray],
+        find_neighbors,
+    ):
+        """
+        Update the cached similarity lists of unchanged notes for this run's changes
+
+        Entries for changed or deleted notes are dropped and changed notes scoring
+        above the threshold are merged in. A list that was cut at similarity_top_k
+        and lost an entry cannot be patched and is recomputed instead. Notes whose
+        list changed are recorded in self.affected_notes.
+
+        :param documents: Changed documents
+        :param corpus_docs: All notes in scan order
+        :param corpus_embeddings: Embeddings of all notes, keyed by filename
+        :param find_neighbors: Function computing fresh similarity lists for notes
+        """
+        self.affected_notes = {}
+        if not (self.use_cache and self.cache):
+            return
+
+        changed_names = {doc["filename"] for doc in documents}
+        unchanged = []
+        for doc in corpus_docs:
+            if doc["filename"] not in changed_names:
+                cached = self.cache.get_similarities(doc["filename"])
+                if cached is not None:
+                    unchanged.append((doc, cached))
+        if not unchanged:
+            return
+
+        rank = {}
+        for row, doc in enumerate(corpus_docs):
+            rank.setdefault(doc["filename"], row)
+
+        # Score every unchanged note against the changed notes only
+        additions = defaultdict(list)
+        if documents:
+            changed_matrix = self._embedding_matrix(
+                [doc["filename"] for doc in documents], corpus_embeddings
+            )
+            unchanged_matrix = self._embedding_matrix(
+                [doc["filename"] for doc, _ in unchanged], corpus_embeddings
+            )
+            for start, scores in self.similarity_engine.iter_blocks(
+                unchanged_matrix, changed_matrix
+            ):
+                for row, col in zip(*np.nonzero(scores > self.similarity_threshold)):
+                    additions[start + row].append(
+                        {
+                            "filename": documents[col]["filename"],
+                            "similarity_score": float(scores[row, col]),
+                        }
+                    )
+
+        recompute = []
+        for position, (doc, cached) in enumerate(unchanged):
+            kept = [
+                entry
+                for entry in cached
+                if entry["filename"] in rank and entry["filename"] not in changed_names
+            ]
+            excluded = {doc["filename"], *doc["links"]}
+            added = [
+                entry
+                for entry in additions[position]
+                if entry["filename"] not in excluded
+            ]
+            if not added and len(kept) == len(cached):
+                continue
+            if (
+                self.similarity_top_k is not None
+                and len(kept) < len(cached)
+                and len(cached) >= self.similarity_top_k
+            ):
+                # Entries beyond the cut are unknown; score the note again
+                recompute.append(doc)
+                continue
+
+            merged = sorted(
+                kept + added,
+                key=lambda entry: (-entry["similarity_score"], rank[entry["filename"]]),
+            )[: self.similarity_top_k]
+            merged = self._carry_link_texts(merged, cached, changed_names)
+            if merged != cached:
+                self.affected_notes[doc["path"]] = merged
+
+        cached_lists = {doc["filename"]: cached for doc, cached in unchanged}
+        for doc, similarities in zip(recompute, find_neighbors(recompute)):
+            self.affected_notes[doc["path"]] = self._carry_link_texts(
+                similarities, cached_lists[doc["filename"]], changed_names
+            )
+
+        for path, similarities in self.affected_notes.items():
+            self.cache.set_similarities(os.path.basename(path), similarities)
+        self.logger.info(
+            f"Updated similarities of {len(self.affected_notes)} unchanged notes "
+            f"({len(recompute)} recomputed)"
+        )
+
+    def _carry_link_texts(
+        self,
+        similarities: List[Dict[str, Any]],
+        cached: List[Dict[str, Any]],
+        changed_names: Set[str],
+    ) -> List[Dict[str, Any]]:
+        """
+        Reuse the link texts of a note's previous list in its patched list
+
+        A link text stays valid while neither note changes.
+
+        :param similarities: Patched similarity list
+        :param cached: Previous similarity list of the note
+        :param changed_names: Filenames of the changed documents
+        :return: Similarity list with link texts
+        """
+        link_texts = {
+            entry["filename"]: entry["suggested_link_text"]
+            for entry in cached
+            if "suggested_link_text" in entry and entry["filename"] not in changed_names
+        }
+        carried = []
+        for entry in similarities:
+            entry = {
+                "filename": entry["filename"],
+                "similarity_score": entry["similarity_score"],
+            }
+            if entry["filename"] in link_texts:
+                entry["suggested_link_text"] = link_texts[entry["filename"]]
+            carried.append(entry)
+        return carried
+
+    def _sync_ann_index(self, embeddings: Dict[str, np.ndarray]) -> IVFIndex:
+        """
+        Load the ANN index and bring it up to date with the current embeddings
+
+        :param embeddings: Embeddings computed in this run, keyed by filename
+        :return: Up-to-date index
+        """
+        index = self.cache.ann_index if self.use_cache and self.cache else None
+        index = index or self.ann_index
+
+        if index is None or index.needs_rebuild():
+            # Train on every document embedding the cache already holds
+            corpus = {}
+            if self.use_cache and self.cache:
+                corpus.update(
+                    (key, vector)
+                    for key, vector in self.cache.embeddings_cache.items()
+                    if ObsidianCache.is_document_key(key)
+                )
+            corpus.update(embeddings)
+            index = IVFIndex(nlist=self.ann_nlist, nprobe=self.ann_nprobe)
+            index.build(list(corpus), list(corpus.values()))
+        else:
+            index.nprobe = self.ann_nprobe
+            index.upsert(list(embeddings), list(embeddings.values()))
+
+        if self.ann_recall_sample > 0:
+            recall = index.estimate_recall(
+                k=10, sample_size=self.ann_recall_sample, nprobe=self.ann_nprobe
+            )
+            self.logger.info(
+                f"ANN index recall@10: {recall:.3f} "
+                f"(nprobe={self.ann_nprobe}, {len(index)} vectors)"
+            )
+
+        self.ann_index = index
+        if self.use_cache and self.cache:
+            self.cache.ann_index = index
+        return index
+
+    def _ann_neighbors(
+        self,
+        queries: np.ndarray,
+        filename_rows: Dict[str, Set[int]],
+        exclude: List[Set[int]],
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        Find similar documents through the ANN index
+
+        :param queries: Query matrix
+        :param filename_rows: Map from filename to document rows
+        :param exclude: Per-query sets of document rows to skip
+        :return: Per-query lists of (document row, score), best first
+        """
+        index = self.ann_index
+        if index is None:
+            return [[] for _ in exclude]
+        k = self.ann_candidates + max((len(rows) for rows in exclude), default=0)
+
+        neighbor_lists = []
+        for hits, excluded_rows in zip(index.search(queries, k), exclude):
+            neighbors = [
+                (row, score)
+                for key, score in hits
+                if score > self.similarity_threshold
+                for row in sorted(filename_rows.get(key, ()))
+                if row not in excluded_rows
+            ]
+            neighbors.sort(key=lambda item: (-item[1], item[0]))
+            neighbor_lists.append(neighbors[: self.similarity_top_k])
+        return neighbor_lists
+
+    def generate_link_texts(
+        self,
+        document_similarities: Dict[str, List[Dict[str, Any]]],
+        documents: List[Dict[str, str]],
+    ):
+        """
+        Generate link texts for the links written into each document
+
+        Only the links _update_documents will write are sent to Claude: the
+        top suggested links of each document and the links behind its
+        backlinks. Other links keep no link text until a note they point to
+        is written.
+
+        :param document_similarities: Semantic similarity results, updated in
+            place; cached lists of backlink sources are added to it
+        :param documents: List of documents
+        """
+        pairs, links = self._pending_link_text_pairs(document_similarities, documents)
+        if not pairs:
+            return
+
+        self.logger.info(f"Generating link texts for {len(pairs)} links...")
+        for link, link_text in zip(links, self._generate_link_texts(pairs)):
+            link["suggested_link_text"] = link_text
+
+        # Cache the similarities together with their link texts
+        if self.use_cache and self.cache:
+            for filename in dict.fromkeys(source["filename"] for source, _ in pairs):
+                self.cache.set_similarities(filename, document_similarities[filename])
+
+    def _pending_link_text_pairs(
+        self,
+        document_similarities: Dict[str, List[Dict[str, Any]]],
+        documents: List[Dict[str, str]],
+    ) -> Tuple[List[Tuple[Dict[str, str], Dict[str, str]]], List[Dict[str, Any]]]:
+        """
+        Find the written links that still need a link text
+
+        These are the top suggested links of each document and, through the
+        backlink index, the links of every note that gives it a backlink.
+        Cached lists of those notes are added to document_similarities.
+
+        :param document_similarities: Semantic similarity results
+        :param documents: List of documents
+        :return: Tuple of (source/target document pairs, matching link entries)
+        """
+        pending = {}
+        for doc in documents:
+            for link in document_similarities.get(doc["filename"], [])[
+                : self.max_suggested_links
+            ]:
+                if "suggested_link_text" not in link:
+                    pending[id(link)] = (doc["filename"], link)
+
+        for doc in documents:
+            for source, position in self.backlink_index.sources_of(doc["filename"]):
+                similarities = document_similarities.get(source)
+                if similarities is None and self.use_cache and self.cache:
+                    similarities = self.cache.get_similarities(source)
+                    if similarities is not None:
+                        document_similarities[source] = similarities
+                if (
+                    similarities is None
+                    or position >= len(similarities)
+                    or similarities[position]["filename"] != doc["filename"]
+                ):
+                    continue
+                link = similarities[position]
+                if "suggested_link_text" not in link:
+                    pending[id(link)] = (source, link)
+
+        # Notes that did not change in this run are read from disk
+        documents_by_filename = {doc["filename"]: doc for doc in documents}
+        documents_by_filename.update(
+            self._load_notes(
+                {
+                    filename
+                    for source, link in pending.values()
+                    for filename in (source, link["filename"])
+                }.difference(documents_by_filename)
+            )
+        )
+
+        pairs = []
+        links = []
+        for source, link in pending.values():
+            source_doc = documents_by_filename.get(source)
+            target_doc = documents_by_filename.get(link["filename"])
+            if source_doc is None or target_doc is None:
+                continue
+            pairs.append((source_doc, target_doc))
+            links.append(link)
+        return pairs, links
+
+    def _related_documents(
+        self,
+        documents: List[Dict[str, str]],
+        document_similarities: Dict[str, List[Dict[str, Any]]],
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, List[Dict[str, Any]]]]:
+        """
+        Read the unchanged notes whose output changed in this run
+
+        These are the notes whose similarity lists were patched and the notes
+        whose backlinks changed.
+
+        :param documents: Changed documents
+        :param document_similarities: Similarity lists of the changed documents
+        :return: Tuple of (related documents, their similarity lists keyed by
+            filename)
+        """
+        patched = {
+            os.path.basename(path): similarities
+            for path, similarities in self.affected_notes.items()
+        }
+        backlink_targets = self._sync_backlink_index(document_similarities, patched)
+
+        changed_paths = {doc["path"] for doc in documents}
+        related = self._load_documents(
+            [
+                path
+                for path in self.vault_files or []
+                if path not in changed_paths
+                and (
+                    path in self.affected_notes
+                    or os.path.basename(path) in backlink_targets
+                )
+            ]
+        )
+
+        related_similarities = {}
+        for doc in related:
+            if doc["filename"] in patched:
+                related_similarities[doc["filename"]] = patched[doc["filename"]]
+            elif self.use_cache and self.cache:
+                similarities = self.cache.get_similarities(doc["filename"])
+                if similarities is not None:
+                    related_similarities[doc["filename"]] = similarities
+        return related, related_similarities
+
+    def _sync_backlink_index(
+        self,
+        document_similarities: Dict[str, List[Dict[str, Any]]],
+        patched_similarities: Dict[str, List[Dict[str, Any]]],
+    ) -> Set[str]:
+        """
+        Bring the backlink index up to date with the similarity lists of the vault
+
+        Without a saved index it is built once from every cached list. After
+        that only the lists of changed, patched and deleted notes are replaced.
+
+        :param document_similarities: Similarity lists of the changed documents
+        :param patched_similarities: Patched lists of unchanged notes
+        :return: Filenames of the notes whose backlinks changed
+        """
+        updated = {**patched_similarities, **document_similarities}
+        live_names = (
+            dict.fromkeys(os.path.basename(path) for path in self.vault_files)
+            if self.vault_files is not None
+            else dict.fromkeys(updated)
+        )
+
+        if not self.backlink_index_complete:
+            outgoing = {}
+            for filename in live_names:
+                similarities = updated.get(filename)
+                if similarities is None:
+                    similarities = self.cache.get_similarities(filename)
+                if similarities is not None:
+                    outgoing[filename] = [link["filename"] for link in similarities]
+            self.logger.info(
+                f"Building backlink index from {len(outgoing)} similarity lists..."
+            )
+            self.backlink_index.build(list(outgoing), outgoing)
+            self.backlink_index_complete = True
+            return set()
+
+        removed = [
+            source
+            for source in self.backlink_index.source_rows
+            if source not in live_names
+        ]
+        old_targets = self.backlink_index.targets_of([*updated, *removed])
+
+        changed_targets = set()
+        for source in removed:
+            changed_targets.update(target for target, _ in old_targets.get(source, ()))
+        for source, similarities in updated.items():
+            old = {target for target, _ in old_targets.get(source, ())}
+            new = {link["filename"] for link in similarities}
+            if source in document_similarities:
+                # A changed note's scores and link texts change with it
+                changed_targets.update(old | new)
+            else:
+                # Patched lists keep the scores and link texts of kept links
+                changed_targets.update(old ^ new)
+
+        self.backlink_index.remove(removed)
+        self.backlink_index.update(
+            {
+                source: [link["filename"] for link in similarities]
+                for source, similarities in updated.items()
+            }
+        )
+        changed_targets.difference_update(document_similarities)
+        return changed_targets
+
+    def _load_notes(self, filenames: Set[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Read notes of the vault by filename
+
+        A filename shared by several notes refers to the first in scan order,
+        like the similarity lists do.
+
+        :param filenames: Filenames of the notes
+        :return: Documents keyed by filename, without notes that could not be read
+        """
+        paths = {}
+        for path in self.vault_files or []:
+            filename = os.path.basename(path)
+            if filename in filenames:
+                paths.setdefault(filename, path)
+        return {
+            doc["filename"]: doc for doc in self._load_documents(list(paths.values()))
+        }
+
+    def _load_documents(self, paths: List[str]) -> List[Dict[str, Any]]:
+        """
+        Read notes that did not change in this run, on the scanner's thread pool
+
+        :param paths: Full paths of the notes
+        :return: Documents in path order, without notes that could not be read
+        """
+        if not paths:
+            return []
+
+        def load(path: str) -> Optional[Dict[str, Any]]:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    content = f.read()
+            except Exception as e:
+                self.logger.warning(f"Failed to read {path}: {e}")
+                return None
+            content_hash = ObsidianCache.get_content_hash(content)
+            return {
+                "filename": os.path.basename(path),
+                "path": path,
+                "content": content,
+                "content_hash": content_hash,
+                "links": self.build_link_index(content, content_hash),
+            }
+
+        documents = self.scanner.map(load, paths, desc="Reading Related Notes")
+        return [doc for doc in documents if doc is not None]
+
+    def _link_text_prompt(
         self, source_doc: Dict[str, str], target_doc: Dict[str, str]
     ) -> str:
         """
-        Generate a contextual link text between two documents
+        Build the prompt asking for a link text between two documents
 
         :param source_doc: Source document
         :param target_doc: Target document
-        :return: Suggested link text
+        :return: Prompt text
         """
-        try:
-            prompt = f"""Generate a concise, descriptive link text connecting these two documents:
+        return f"""Generate a concise, descriptive link text connecting these two documents:
 
             Source Document (Filename: {source_doc["filename"]}):
             Excerpt: {source_doc["content"][:500]}
@@ -400,11 +1238,28 @@ class AdvancedObsidianProcessor:
             Provide a 3-5 word link text that captures the relationship:
             """
 
-            return self._call_claude_api(prompt).strip()
+    def _generate_link_texts(
+        self, pairs: List[Tuple[Dict[str, str], Dict[str, str]]]
+    ) -> List[str]:
+        """
+        Generate contextual link texts for many document pairs concurrently
 
-        except Exception as e:
-            self.logger.error(f"Error generating link text: {e}")
-            return f"Related: {target_doc['filename']}"
+        :param pairs: List of (source document, target document)
+        :return: Suggested link texts in pair order
+        """
+        prompts = [self._link_text_prompt(source, target) for source, target in pairs]
+        responses = self.llm_client.complete_many(
+            prompts, max_tokens=DEFAULT_MAX_TOKENS, desc="Generating Link Texts"
+        )
+
+        link_texts = []
+        for (_, target_doc), response in zip(pairs, responses):
+            link_text = response.strip()
+            if not link_text:
+                self.logger.error("Error generating link text: empty response")
+                link_text = f"Related: {target_doc['filename']}"
+            link_texts.append(link_text)
+        return link_texts
 
     def generate_backlinks(
         self,
@@ -414,41 +1269,44 @@ class AdvancedObsidianProcessor:
         """
         Generate bidirectional backlinks
 
+        Backlinks come from the backlink index, which _related_documents keeps
+        up to date with the similarity lists of every note in the vault.
+
         :param document_similarities: Semantic similarity results
-        :param documents: List of all documents
+        :param documents: List of documents to generate backlinks for
         """
         self.logger.info("Generating Backlinks...")
-        self.backlinks = {}
+        # List backlinks in scan order, whatever order the index holds them in
+        rank = {}
+        for position, path in enumerate(self.vault_files or []):
+            rank.setdefault(os.path.basename(path), position)
 
+        self.backlinks = {}
         for doc in tqdm(documents, desc="Creating Backlinks"):
-            filename = doc["filename"]
-
-            # Initialize backlinks for this document
-            self.backlinks[filename] = []
-
-            # Find documents that link to this document
-            for other_doc in documents:
-                if other_doc["filename"] == filename:
+            backlinks = []
+            for source, position in sorted(
+                self.backlink_index.sources_of(doc["filename"]),
+                key=lambda item: rank.get(item[0], len(rank)),
+            ):
+                similarities = document_similarities.get(source)
+                if similarities is None and self.use_cache and self.cache:
+                    similarities = self.cache.get_similarities(source)
+                # Skip lists evicted from the cache since the index was built
+                if (
+                    similarities is None
+                    or position >= len(similarities)
+                    or similarities[position]["filename"] != doc["filename"]
+                ):
                     continue
-
-                # Check if this document appears in other document's similarities
-                similar_docs = document_similarities.get(other_doc["filename"], [])
-                relevant_links = [
-                    link for link in similar_docs if link["filename"] == filename
-                ]
-
-                if relevant_links:
-                    self.backlinks[filename].append(
-                        {
-                            "source_document": other_doc["filename"],
-                            "link_text": relevant_links[0].get(
-                                "suggested_link_text", "Related"
-                            ),
-                            "similarity_score": relevant_links[0].get(
-                                "similarity_score", 0
-                            ),
-                        }
-                    )
+                link = similarities[position]
+                backlinks.append(
+                    {
+                        "source_document": source,
+                        "link_text": link.get("suggested_link_text", "Related"),
+                        "similarity_score": link.get("similarity_score", 0),
+                    }
+                )
+            self.backlinks[doc["filename"]] = backlinks
 
     def generate_tags(self, documents: List[Dict[str, str]]) -> Dict[str, List[str]]:
         """
@@ -461,7 +1319,9 @@ class AdvancedObsidianProcessor:
 
         # First, extract existing tags from all documents
         for doc in tqdm(documents, desc="Extracting Existing Tags"):
-            existing_tags = self.extract_existing_tags(doc["content"])
+            existing_tags = self.extract_existing_tags(
+                doc["content"], doc.get("content_hash")
+            )
             self.document_tags[doc["filename"]] = list(existing_tags)
 
             # Add documents to tag clusters based on existing tags
@@ -470,73 +1330,28 @@ class AdvancedObsidianProcessor:
 
         # Generate embeddings for content-based tag suggestions
         self.logger.info("Generating content embeddings for tag analysis...")
-        content_embeddings = {}
-        for doc in tqdm(documents, desc="Computing Content Embeddings"):
-            # Check if we have a cached embedding
-            cached_embedding = None
-            if self.use_cache and self.cache:
-                cached_embedding = self.cache.get_embedding(
-                    f"{doc['filename']}_content"
-                )
-
-            if cached_embedding is not None:
-                content_embeddings[doc["filename"]] = cached_embedding
-                self.logger.debug(
-                    f"Using cached content embedding for {doc['filename']}"
-                )
-            else:
-                # Use a larger chunk of content for better tag analysis
-                content_embeddings[doc["filename"]] = self.embedding_model.encode(
-                    doc["content"][:2000]
-                )
-                # Cache the embedding
-                if self.use_cache and self.cache:
-                    self.cache.set_embedding(
-                        f"{doc['filename']}_content",
-                        content_embeddings[doc["filename"]],
-                    )
+        # The same pooled chunk embeddings used for linking
+        content_embeddings = self._embed_documents(
+            documents, desc="Computing Content Embeddings"
+        )
 
         # Group similar documents for consistent tagging
-        similarity_groups = []
-        processed_docs = set()
-
         self.logger.info("Grouping similar documents for consistent tagging...")
-        for doc1 in tqdm(documents, desc="Creating Tag Groups"):
-            if doc1["filename"] in processed_docs:
-                continue
-
-            # Start a new group with this document
-            current_group = [doc1["filename"]]
-            processed_docs.add(doc1["filename"])
-
-            # Find similar documents
-            for doc2 in documents:
-                if (
-                    doc2["filename"] in processed_docs
-                    or doc1["filename"] == doc2["filename"]
-                ):
-                    continue
-
-                # Compute similarity score
-                sim_score = np.dot(
-                    content_embeddings[doc1["filename"]],
-                    content_embeddings[doc2["filename"]],
-                ) / (
-                    np.linalg.norm(content_embeddings[doc1["filename"]])
-                    * np.linalg.norm(content_embeddings[doc2["filename"]])
-                )
-
-                # If very similar, add to the same group
-                if sim_score > 0.8:  # Higher threshold for tag consistency
-                    current_group.append(doc2["filename"])
-                    processed_docs.add(doc2["filename"])
-
-            if len(current_group) > 1:
-                similarity_groups.append(current_group)
+        similarity_groups = self._tag_groups(content_embeddings)
+        document_groups = {
+            filename: group for group in similarity_groups for filename in group
+        }
 
         # Generate tags for each document
         self.logger.info("Generating AI tags for documents...")
-        for doc in tqdm(documents, desc="Generating Tags"):
+
+        # Submit every tag request up front; documents that end up skipped
+        # below simply ignore their result
+        generated_tags = self._generate_tags_for_documents(
+            self._documents_needing_tags(documents)
+        )
+
+        for doc in documents:
             try:
                 # Check if we have cached tags
                 cached_tags = None
@@ -553,21 +1368,18 @@ class AdvancedObsidianProcessor:
                     continue
 
                 # Generate AI tags
-                ai_tags = self._generate_document_tags(doc)
+                ai_tags = generated_tags.get(doc["filename"])
+                if ai_tags is None:
+                    ai_tags = self._generate_document_tags(doc)
 
                 # Ensure consistent tags across similar documents
-                for group in similarity_groups:
-                    if doc["filename"] in group:
-                        # Share tags with the group
-                        for filename in group:
-                            if filename != doc["filename"]:
-                                # Merge tags between similar documents
-                                existing_group_tags = self.document_tags.get(
-                                    filename, []
-                                )
-                                self.document_tags[filename] = list(
-                                    set(existing_group_tags + ai_tags)
-                                )
+                for filename in document_groups.get(doc["filename"], []):
+                    if filename != doc["filename"]:
+                        # Merge tags between similar documents
+                        existing_group_tags = self.document_tags.get(filename, [])
+                        self.document_tags[filename] = list(
+                            set(existing_group_tags + ai_tags)
+                        )
 
                 # Add AI-generated tags to document's tags
                 existing_tags = self.document_tags.get(doc["filename"], [])
@@ -582,23 +1394,60 @@ class AdvancedObsidianProcessor:
             except Exception as e:
                 self.logger.error(f"Error generating tags for {doc['filename']}: {e}")
 
-        return self.document_tags
+        return self.document_tags
+
+    def _tag_groups(self, embeddings: Dict[str, np.ndarray]) -> List[List[str]]:
+        """
+        Group documents whose embeddings are connected by similarities above
+        tag_group_threshold
+
+        Edges come from blocked matrix products, or from the ANN index when it
+        is enabled, and groups are the connected components of that graph.
+
+        :param embeddings: Embeddings keyed by filename, in document order
+        :return: Groups of two or more filenames
+        """
+        filenames = list(embeddings)
+        matrix = self._embedding_matrix(filenames, embeddings)
+        if len(filenames) < 2:
+            return []
+
+        if self.ann_enabled and self.ann_index is not None:
+            rows = {filename: row for row, filename in enumerate(filenames)}
+            edges = [], []
+            for row, hits in enumerate(
+                self.ann_index.search(matrix, self.ann_candidates)
+            ):
+                for key, score in hits:
+                    if score > self.tag_group_threshold and rows.get(key, row) != row:
+                        edges[0].append(row)
+                        edges[1].append(rows[key])
+            pairs = [edges]
+        else:
+            pairs = self.similarity_engine.threshold_pairs(
+                matrix, self.tag_group_threshold
+            )
+
+        groups = [
+            [filenames[row] for row in component]
+            for component in SimilarityEngine.connected_components(
+                len(filenames), pairs
+            )
+        ]
+        self.logger.info(
+            f"Found {len(groups)} tag groups covering "
+            f"{sum(len(group) for group in groups)} documents"
+        )
+        return groups
 
-    def _generate_document_tags(self, document: Dict[str, str]) -> List[str]:
+    def _tag_prompt(self, document: Dict[str, str]) -> str:
         """
-        Generate tags for a document using AI
+        Build the prompt asking for tags for a document
 
         :param document: Document to generate tags for
-        :return: List of generated tags
+        :return: Prompt text
         """
-        try:
-            # First check if we can reuse existing tags from similar documents
-            content_signature = document["content"][:100].lower()  # Simple signature
-            if content_signature in self.global_tag_map:
-                return self.global_tag_map[content_signature]
-
-            # Generate tags using Claude API
-            prompt = f"""Generate 3-5 relevant tags for this document in Obsidian format.
+        return f"""Generate 3-5 relevant tags for this document in Obsidian format.
             
             Document Title: {document["filename"]}
             
@@ -615,30 +1464,253 @@ class AdvancedObsidianProcessor:
             Tags:
             """
 
-            response = self._call_claude_api(prompt).strip()
+    def _parse_tag_response(self, response: str) -> List[str]:
+        """
+        Extract tags from a comma-separated response
 
-            # Process the response to extract tags
-            # Remove any # symbols if present
-            response = response.replace("#", "")
+        :param response: Raw API response
+        :return: List of tags
+        """
+        # Remove any # symbols if present
+        response = response.strip().replace("#", "")
 
-            # Split by commas and clean up
-            tags = [tag.strip().lower() for tag in response.split(",")]
+        # Split by commas and clean up
+        tags = [tag.strip().lower() for tag in response.split(",")]
 
-            # Filter out empty tags and ensure proper format
-            tags = [re.sub(r"[^a-z0-9_/-]", "", tag) for tag in tags if tag]
+        # Filter out empty tags and ensure proper format
+        return [re.sub(r"[^a-z0-9_/-]", "", tag) for tag in tags if tag]
 
-            # Store in global map for consistency
-            self.global_tag_map[content_signature] = tags
+    def _generate_document_tags(self, document: Dict[str, str]) -> List[str]:
+        """
+        Generate tags for a document using AI
 
-            return tags
+        :param document: Document to generate tags for
+        :return: List of generated tags
+        """
+        try:
+            # Generate tags using Claude API; repeated prompts are answered
+            # from the response cache
+            response = self._call_claude_api(self._tag_prompt(document))
+            return self._parse_tag_response(response)
 
         except Exception as e:
             self.logger.error(f"Error in tag generation: {e}")
             # Return some generic tags as fallback
             return ["document", "note"]
 
+    def _batch_tag_prompt(self, documents: List[Dict[str, str]]) -> str:
+        """
+        Build one prompt asking for tags for several documents at once
+
+        :param documents: Documents to generate tags for, identified as n1, n2, ...
+        :return: Prompt text
+        """
+        notes = "\n\n".join(f"""Note ID: "n{i}"
+            Document Title: {doc["filename"]}
+            Document Content:
+            {doc["content"][:1500]}
+            ---""" for i, doc in enumerate(documents, 1))
+        return f"""Generate 3-5 relevant tags for each of the following documents in Obsidian format.
+
+            Rules for tags:
+            1. Use lowercase words without spaces (e.g., #database, #system-design)
+            2. Use hyphens for multi-word tags (e.g., #distributed-systems)
+            3. Be specific but not too narrow
+            4. Don't include the # symbol in your response
+            5. Return only a JSON object mapping each Note ID to its list of tags,
+               e.g. {{"n1": ["database", "system-design"], "n2": ["networking"]}}
+
+            {notes}
+
+            JSON:
+            """
+
+    def _parse_batch_tag_response(
+        self, response: str, count: int
+    ) -> Dict[int, List[str]]:
+        """
+        Extract per-note tags from a batched JSON response
+
+        :param response: Raw API response
+        :param count: Number of notes in the batch
+        :return: Dictionary mapping note index (0-based) to tags, for valid items only
+        """
+        start, end = response.find("{"), response.rfind("}")
+        if start < 0 or end < start:
+            return {}
+        try:
+            parsed = json.loads(response[start : end + 1])
+        except json.JSONDecodeError:
+            return {}
+        if not isinstance(parsed, dict):
+            return {}
+
+        results = {}
+        for i in range(count):
+            tags = parsed.get(f"n{i + 1}")
+            if not isinstance(tags, list) or not all(
+                isinstance(tag, str) for tag in tags
+            ):
+                continue
+            tags = self._parse_tag_response(",".join(tags))
+            if tags:
+                results[i] = tags
+        return results
+
+    def _pack_tag_batches(
+        self, documents: List[Dict[str, str]]
+    ) -> List[List[Dict[str, str]]]:
+        """
+        Group documents into batches that fit the tag batch token budget
+
+        :param documents: Documents to generate tags for
+        :return: List of batches
+        """
+        overhead = self.llm_client.estimate_tokens(self._batch_tag_prompt([]))
+        batches, batch, batch_tokens = [], [], overhead
+        for doc in documents:
+            doc_tokens = (
+                self.llm_client.estimate_tokens(self._batch_tag_prompt([doc]))
+                - overhead
+            )
+            if batch and batch_tokens + doc_tokens > self.tag_batch_token_budget:
+                batches.append(batch)
+                batch, batch_tokens = [], overhead
+            batch.append(doc)
+            batch_tokens += doc_tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _documents_needing_tags(
+        self, documents: List[Dict[str, str]]
+    ) -> List[Dict[str, str]]:
+        """
+        Select documents without cached tags and with fewer than five existing tags
+
+        :param documents: List of documents
+        :return: Documents that need AI tags
+        """
+        return [
+            doc
+            for doc in documents
+            if not (
+                self.use_cache
+                and self.cache
+                and self.cache.get_tags(doc["filename"]) is not None
+            )
+            and len(self.extract_existing_tags(doc["content"], doc.get("content_hash")))
+            < 5
+        ]
+
+    def _tag_requests(self, documents: List[Dict[str, str]]) -> List[Tuple[str, int]]:
+        """
+        List the (prompt, max_tokens) requests _generate_tags_for_documents sends
+        first for these documents
+
+        :param documents: Documents to generate tags for
+        :return: List of (prompt, max_tokens)
+        """
+        if self.tag_batch_token_budget > 0 and len(documents) > 1:
+            return [
+                (self._batch_tag_prompt(batch), 100 + 50 * len(batch))
+                for batch in self._pack_tag_batches(documents)
+            ]
+        return [(self._tag_prompt(doc), DEFAULT_MAX_TOKENS) for doc in documents]
+
+    def _generate_tags_for_documents(
+        self, documents: List[Dict[str, str]]
+    ) -> Dict[str, List[str]]:
+        """
+        Generate tags for many documents concurrently
+
+        With a tag batch token budget, several documents share each request
+        and any document whose batched answer is invalid is retried on its own.
+
+        :param documents: Documents to generate tags for
+        :return: Dictionary mapping filenames to generated tags
+        """
+        generated = {}
+        pending = documents
+        if self.tag_batch_token_budget > 0 and len(pending) > 1:
+            batches = self._pack_tag_batches(pending)
+            responses = self.llm_client.complete_many(
+                [self._batch_tag_prompt(batch) for batch in batches],
+                max_tokens=[100 + 50 * len(batch) for batch in batches],
+                desc="Generating Tags (batched)",
+            )
+            for batch, response in zip(batches, responses):
+                for i, tags in self._parse_batch_tag_response(
+                    response, len(batch)
+                ).items():
+                    generated[batch[i]["path"]] = tags
+
+            pending = [doc for doc in documents if doc["path"] not in generated]
+            if pending:
+                self.logger.info(
+                    f"Falling back to single-note tagging for {len(pending)} notes"
+                )
+
+        responses = self.llm_client.complete_many(
+            [self._tag_prompt(doc) for doc in pending],
+            max_tokens=DEFAULT_MAX_TOKENS,
+            desc="Generating Tags",
+        )
+        for doc, response in zip(pending, responses):
+            generated[doc["path"]] = self._parse_tag_response(response)
+
+        return {doc["filename"]: generated[doc["path"]] for doc in documents}
+
+    def _prefetch_with_batch(
+        self,
+        documents: List[Dict[str, str]],
+        document_similarities: Dict[str, List[Dict[str, Any]]],
+        tags_only: bool,
+        links_only: bool,
+        related_documents: Optional[List[Dict[str, str]]] = None,
+    ) -> bool:
+        """
+        Answer this run's link-text and tag prompts through one batch job
+
+        Results land in the response cache, so the regular stages that follow
+        are served from it.
+
+        :param documents: List of documents
+        :param document_similarities: Semantic similarity results
+        :param tags_only: If True, only tag prompts are needed
+        :param links_only: If True, only link-text prompts are needed
+        :param related_documents: Unchanged notes that are rewritten; they
+            only need link texts
+        :return: False if the batch is still processing
+        """
+        if self.batch_runner is None:
+            self.logger.warning("Batch mode needs caching enabled; calling directly")
+            return True
+
+        requests_to_send = []
+        if not tags_only:
+            pairs, _ = self._pending_link_text_pairs(
+                document_similarities, documents + (related_documents or [])
+            )
+            requests_to_send.extend(
+                (self._link_text_prompt(source, target), DEFAULT_MAX_TOKENS)
+                for source, target in pairs
+            )
+        if not links_only:
+            requests_to_send.extend(
+                self._tag_requests(self._documents_needing_tags(documents))
+            )
+
+        return self.batch_runner.run(requests_to_send)
+
     def process_vault(
-        self, dry_run=False, tags_only=False, links_only=False, force_refresh=False
+        self,
+        dry_run=False,
+        tags_only=False,
+        links_only=False,
+        force_refresh=False,
+        batch_mode=False,
+        touched_paths=None,
     ):
         """
         Comprehensive vault processing workflow
@@ -647,19 +1719,45 @@ class AdvancedObsidianProcessor:
         :param tags_only: If True, only generate tags
         :param links_only: If True, only generate links
         :param force_refresh: If True, ignore cache and process all files
+        :param batch_mode: If True, answer prompts through the Message Batches API
+        :param touched_paths: Optional paths reported by the watcher; only these
+            are checked for changes
         :return: Dictionary with analysis results
         """
         # Clear cache if force refresh
         if force_refresh and self.use_cache and self.cache:
             self.logger.info("Force refresh requested, clearing cache...")
             self.cache.clear_cache()
+            self.link_graph.clear()
+            # Every note is processed again, so the index starts out empty
+            self.backlink_index.clear()
+            self.backlink_index_complete = True
 
         # 1. Initial document processing
         self.logger.info(f"Starting Obsidian Vault Processing for {self.vault_path}...")
-        markdown_files = self.read_markdown_files()
+        markdown_files = self.read_markdown_files(touched_paths)
+
+        # Garbage-collect entries of deleted notes (only after a complete scan)
+        removed_entries = {}
+        if self.vault_files is not None:
+            removed_entries = self.collect_cache_garbage(self.vault_files)
+            self.update_link_graph(markdown_files, touched_paths)
+            if self.sidecar is not None and not dry_run:
+                self.sidecar.prune(
+                    os.path.relpath(path, self.vault_path) for path in self.vault_files
+                )
 
-        if not markdown_files:
+        # Lists of unchanged notes may still point at deleted notes
+        notes_removed = bool(removed_entries.get("metadata"))
+        if not markdown_files and not (notes_removed and not tags_only):
             self.logger.info("No changed markdown files found. Nothing to process.")
+            self.link_graph.save()
+            if (
+                (self.stat_refreshed_files or removed_entries)
+                and self.use_cache
+                and self.cache
+            ):
+                self.cache.save_caches()
             return {}
 
         # 2. Semantic Similarity Analysis (skip if tags_only)
@@ -667,142 +1765,388 @@ class AdvancedObsidianProcessor:
         if not tags_only:
             document_similarities = self.semantic_similarity_tagging(markdown_files)
 
-        # 3. Generate Backlinks (skip if tags_only)
+        # Unchanged notes whose suggested links changed are rewritten too
+        related_documents, related_similarities = [], {}
+        if not tags_only:
+            related_documents, related_similarities = self._related_documents(
+                markdown_files, document_similarities
+            )
+        output_documents = markdown_files + related_documents
+        output_similarities = {**document_similarities, **related_similarities}
+
+        # Batch mode: wait for (or resume) the offline batch before generating
+        if batch_mode and not self._prefetch_with_batch(
+            markdown_files,
+            output_similarities,
+            tags_only,
+            links_only,
+            related_documents,
+        ):
+            # Leave the files marked as changed so the next run picks them up;
+            # the patched lists of related notes are already cached, so they
+            # are processed again as well
+            if self.use_cache and self.cache:
+                self.cache.forget_files([doc["path"] for doc in output_documents])
+                self.cache.save_caches()
+            return {}
+
+        # 3. Generate link texts for written links and backlinks (skip if tags_only)
         if not tags_only:
-            self.generate_backlinks(document_similarities, markdown_files)
+            self.generate_link_texts(output_similarities, output_documents)
 
-        # 4. Generate Tags (skip if links_only)
+        # 4. Generate Backlinks (skip if tags_only)
+        if not tags_only:
+            self.generate_backlinks(output_similarities, output_documents)
+
+        # 5. Generate Tags (skip if links_only)
         document_tags = {}
         if not links_only:
             document_tags = self.generate_tags(markdown_files)
 
-        # 5. Update documents with generated links, backlinks, and tags
+        # 6. Update documents with generated links, backlinks, and tags
+        updated_files = []
         if not dry_run:
-            self.logger.info("Updating Documents...")
-            self._update_documents(markdown_files, document_similarities)
+            if self.sidecar is not None:
+                self.logger.info("Updating Sidecar...")
+                self._update_sidecar(output_documents, output_similarities)
+            if self.output_mode != "sidecar":
+                self.logger.info("Updating Documents...")
+                updated_files = self._update_documents(
+                    output_documents, output_similarities
+                )
+            # Pick up the links just written into the notes
+            if self.vault_files is not None and updated_files:
+                self.update_link_graph(touched_paths=updated_files)
         else:
             self.logger.info("Dry run mode - skipping document updates")
 
+        self.llm_client.log_connection_stats()
+
         # Save cache
         if self.use_cache and self.cache:
             self.logger.info("Saving cache...")
             self.cache.save_caches()
+            self.link_graph.save()
+            self.backlink_index.save(self.backlink_index_file)
 
         self.logger.info("Vault Processing Complete!")
         return {
             "document_similarities": document_similarities,
             "backlinks": self.backlinks,
             "document_tags": document_tags,
+            "updated_files": [
+                os.path.relpath(path, self.vault_path) for path in updated_files
+            ],
         }
 
+    def watch(self, dry_run=False, tags_only=False, links_only=False):
+        """
+        Process the vault, then keep processing notes as they are saved
+
+        The processor, embedding model and API session stay alive between
+        edits, and only the notes reported by the watcher are checked.
+
+        :param dry_run: If True, analyze but don't modify files
+        :param tags_only: If True, only generate tags
+        :param links_only: If True, only generate links
+        """
+        self.process_vault(dry_run=dry_run, tags_only=tags_only, links_only=links_only)
+        watcher = VaultWatcher(
+            self.scanner,
+            debounce=self.watch_debounce,
+            poll_interval=self.watch_poll_interval,
+        )
+        self.logger.info(
+            f"Watching {self.vault_path} for changes ({watcher.backend_name})"
+        )
+        try:
+            while True:
+                touched = watcher.wait()
+                if touched is not None:
+                    touched = [path for path in touched if not self._is_own_write(path)]
+                    if not touched:
+                        continue
+                started = time.monotonic()
+                self.process_vault(
+                    dry_run=dry_run,
+                    tags_only=tags_only,
+                    links_only=links_only,
+                    touched_paths=touched,
+                )
+                self.logger.info(
+                    f"Processed {len(self.changed_files)} changed notes in "
+                    f"{time.monotonic() - started:.2f}s"
+                )
+        except KeyboardInterrupt:
+            self.logger.info("Stopped watching")
+        finally:
+            watcher.close()
+
+    def _is_own_write(self, path: str) -> bool:
+        """
+        Check whether a watcher event was caused by _update_documents
+
+        :param path: Touched path
+        :return: True if the file is exactly as we last wrote it
+        """
+        written_stat = self.written_files.get(path)
+        if written_stat is None:
+            return False
+        try:
+            if ObsidianCache.get_file_stat(path) == written_stat:
+                return True
+        except OSError:
+            pass
+        del self.written_files[path]
+        return False
+
+    def collect_cache_garbage(
+        self, vault_files: Optional[List[str]] = None
+    ) -> Dict[str, int]:
+        """
+        Drop cache entries of deleted or renamed notes and enforce cache_max_bytes
+
+        :param vault_files: Every note in the vault (scanned if not given)
+        :return: Number of removed entries per table
+        """
+        if not (self.use_cache and self.cache):
+            return {}
+        if vault_files is None:
+            vault_files = self.scanner.discover()
+        return self.cache.collect_garbage(vault_files, max_bytes=self.cache_max_bytes)
+
+    def update_link_graph(
+        self,
+        documents: Optional[List[Dict[str, str]]] = None,
+        touched_paths: Optional[List[str]] = None,
+    ) -> int:
+        """
+        Re-parse the links of notes whose stat changed since the graph was saved
+
+        Stats taken while reading or writing notes in this run are reused
+        instead of stat-ing those notes again.
+
+        :param documents: Documents read in this run, whose content is reused
+        :param touched_paths: Optional paths reported by the watcher; only these
+            are checked
+        :return: Number of notes parsed
+        """
+        if self.vault_files is None:
+            self.vault_files = self.scanner.discover()
+        return self.link_graph.refresh(
+            self.vault_files,
+            check=touched_paths,
+            contents={doc["path"]: doc["content"] for doc in documents or []},
+            map_paths=lambda func, items: self.scanner.map(
+                func, items, desc="Parsing Links"
+            ),
+            stats=self.file_stats,
+        )
+
     def _update_documents(
         self,
         documents: List[Dict[str, str]],
         document_similarities: Dict[str, List[Dict[str, Any]]],
-    ):
+    ) -> List[str]:
         """
         Update documents with generated links, backlinks, and tags
 
+        Notes are rendered and written on the writer's thread pool, each
+        through a temporary file that atomically replaces it. A note is only
+        written when its rendered content differs from what is on disk, and
+        the hash of what was written is recorded in the cache, so the next run
+        does not mistake our own output for an edit.
+
         :param documents: Original documents
         :param document_similarities: Semantic similarity results
+        :return: Paths of the notes written
         """
-        for doc in tqdm(documents, desc="Updating Documents"):
+        docs_by_path = {doc["path"]: doc for doc in documents}
+        written = self.writer.write(
+            list(docs_by_path),
+            lambda path, content: self._render_document(
+                docs_by_path[path], content, document_similarities
+            ),
+        )
+        for path, content in written.items():
             try:
-                # Read original content
-                with open(doc["path"], "r", encoding="utf-8") as f:
-                    content = f.read()
+                self._record_write(path, content)
+            except OSError as e:
+                self.logger.warning(f"Could not stat {path}: {e}")
 
-                # Extract existing tags to avoid duplicates
-                existing_tags = self.extract_existing_tags(content)
+        self.logger.info(
+            f"Wrote {len(written)} notes, "
+            f"{len(docs_by_path) - len(written)} already up to date or failed"
+        )
+        return list(written)
 
-                # Get AI-generated tags for this document
-                ai_tags = self.document_tags.get(doc["filename"], [])
+    def _note_output(
+        self,
+        doc: Dict[str, str],
+        structure: MarkdownStructure,
+        document_similarities: Dict[str, List[Dict[str, Any]]],
+        generated_tags: Optional[List[str]] = None,
+    ) -> Dict[str, List]:
+        """
+        Collect what is written for a note, in either output mode
 
-                # Combine existing and new tags, removing duplicates
-                all_tags = list(existing_tags)
-                for tag in ai_tags:
-                    if tag not in existing_tags:
-                        all_tags.append(tag)
+        :param doc: Document
+        :param structure: Parsed current content of the note
+        :param document_similarities: Semantic similarity results
+        :param generated_tags: AI tags of the note (default: this run's tags)
+        :return: Dictionary with the note's new tags, all its tags, its top
+            suggested links and its backlinks
+        """
+        if generated_tags is None:
+            generated_tags = self.document_tags.get(doc["filename"], [])
 
-                # Prepare to add new links
-                new_links = document_similarities.get(doc["filename"], [])
+        # Only AI-generated tags the note does not have yet are added
+        existing_tags = set(structure.tags)
+        new_tags = [
+            tag for tag in dict.fromkeys(generated_tags) if tag not in existing_tags
+        ]
 
-                # Limit to top 3 suggested links
-                new_links = new_links[:3]
+        # Limit to the top suggested links
+        new_links = document_similarities.get(doc["filename"], [])
+        new_links = new_links[: self.max_suggested_links]
 
-                # Prepare link text
-                link_texts = []
-                for link in new_links:
-                    link_text = link.get("suggested_link_text", link["filename"])
-                    link_texts.append(f"[[{link['filename']}|{link_text}]]")
+        return {
+            "new_tags": new_tags,
+            "tags": structure.tags + new_tags,
+            "suggested_links": [
+                {
+                    "filename": link["filename"],
+                    "link_text": link.get("suggested_link_text", link["filename"]),
+                    "similarity_score": link.get("similarity_score", 0),
+                }
+                for link in new_links
+            ],
+            "backlinks": self.backlinks.get(doc["filename"], []),
+        }
 
-                # Add backlinks section if not exists
-                backlink_section = "\n\n## Backlinks\n"
-                backlinks = self.backlinks.get(doc["filename"], [])
+    def _render_document(
+        self,
+        doc: Dict[str, str],
+        content: str,
+        document_similarities: Dict[str, List[Dict[str, Any]]],
+    ) -> str:
+        """
+        Render a note with its generated tags, links and backlinks
 
-                if backlinks:
-                    backlink_section += "".join(
-                        [
-                            f"- [[{bl['source_document']}|{bl['link_text']}]]\n"
-                            for bl in backlinks
-                        ]
-                    )
+        Rendering the output of a previous run with the same results returns
+        it unchanged.
 
-                # Check if the document has YAML frontmatter
-                has_frontmatter = (
-                    re.match(r"^---\s*\n.*?\n---", content, re.DOTALL) is not None
+        :param doc: Document
+        :param content: Current content of the note
+        :param document_similarities: Semantic similarity results
+        :return: New content of the note
+        """
+        # Tokenize once; tags and frontmatter come from the same pass
+        structure = self.markdown.parse(content)
+        output = self._note_output(doc, structure, document_similarities)
+        new_tags = output["new_tags"]
+
+        if new_tags and structure.frontmatter_text is not None:
+            # If it has frontmatter, add the tags to its tags list
+            new_frontmatter = add_frontmatter_tags(
+                structure.frontmatter_text, structure.frontmatter, new_tags
+            )
+            content = f"---\n{new_frontmatter}\n---{content[structure.body_start :]}"
+        elif new_tags:
+            # If no frontmatter, add the new tags at the top of the document
+            tag_section = " ".join([f"#{tag}" for tag in new_tags])
+            content = tag_section + "\n\n" + content
+
+        # Without similarity results (--tags-only) the links stay as they are
+        if doc["filename"] not in document_similarities:
+            return content
+
+        # Suggested links and backlinks live in one marker-delimited section
+        sections = []
+        if output["suggested_links"]:
+            sections.append(
+                "## Suggested Related Documents\n"
+                + "\n".join(
+                    f"[[{link['filename']}|{link['link_text']}]]"
+                    for link in output["suggested_links"]
                 )
+            )
+        if output["backlinks"]:
+            sections.append(
+                "## Backlinks\n"
+                + "\n".join(
+                    f"- [[{bl['source_document']}|{bl['link_text']}]]"
+                    for bl in output["backlinks"]
+                )
+            )
 
-                # If it has frontmatter, update the tags in the frontmatter
-                if has_frontmatter:
-                    # Extract the frontmatter
-                    frontmatter_match = re.match(
-                        r"^---\s*\n(.*?)\n---", content, re.DOTALL
-                    )
-                    if frontmatter_match:
-                        frontmatter = frontmatter_match.group(1)
-                        rest_of_content = content[frontmatter_match.end() :]
-
-                        # Check if frontmatter already has tags
-                        has_tags = re.search(r"tags?:", frontmatter) is not None
-
-                        if has_tags:
-                            # Replace existing tags
-                            new_frontmatter = re.sub(
-                                r"tags?:.*?(?=\n[^\s]|\n$|$)",
-                                f"tags: {', '.join(all_tags)}",
-                                frontmatter,
-                                flags=re.DOTALL,
-                            )
-                        else:
-                            # Add tags to frontmatter
-                            new_frontmatter = (
-                                frontmatter + f"\ntags: {', '.join(all_tags)}"
-                            )
-
-                        # Reconstruct the document
-                        content = f"---\n{new_frontmatter}\n---{rest_of_content}"
-                else:
-                    # If no frontmatter, add tags at the top of the document
-                    tag_section = " ".join([f"#{tag}" for tag in all_tags])
-                    content = tag_section + "\n\n" + content
+        return replace_managed_section(content, "\n\n".join(sections))
+
+    def _update_sidecar(
+        self,
+        documents: List[Dict[str, str]],
+        document_similarities: Dict[str, List[Dict[str, Any]]],
+    ) -> int:
+        """
+        Store generated tags, links and backlinks in the sidecar instead of the notes
 
-                # Add suggested links and backlinks
-                if link_texts or backlinks:
-                    # Suggested Links Section
-                    if link_texts:
-                        content += "\n\n## Suggested Related Documents\n"
-                        content += "\n".join(link_texts)
+        :param documents: Changed documents and the unchanged notes whose
+            links or backlinks changed
+        :param document_similarities: Semantic similarity results
+        :return: Number of sidecar entries that changed
+        """
+        changed_paths = set(self.changed_files)
+        entries = {}
+        for doc in documents:
+            rel_path = os.path.relpath(doc["path"], self.vault_path)
+            structure = self.markdown.parse(doc["content"], doc.get("content_hash"))
+            generated_tags = self.document_tags.get(doc["filename"])
+            if generated_tags is None and self.use_cache and self.cache:
+                generated_tags = self.cache.get_tags(doc["filename"])
+            output = self._note_output(
+                doc, structure, document_similarities, generated_tags
+            )
+            entry = {
+                "tags": output["tags"],
+                "suggested_links": output["suggested_links"],
+                "backlinks": output["backlinks"],
+            }
 
-                    # Add Backlinks Section
-                    content += backlink_section
+            # Keep what this run did not compute for the note
+            stored = self.sidecar.get(rel_path)
+            if stored is not None:
+                if (
+                    doc["filename"] not in self.document_tags
+                    and doc["path"] not in changed_paths
+                ):
+                    entry["tags"] = stored["tags"]
+                if doc["filename"] not in document_similarities:
+                    # No links were computed (--tags-only)
+                    entry["suggested_links"] = stored["suggested_links"]
+                    entry["backlinks"] = stored["backlinks"]
+            entries[rel_path] = entry
+        changed = self.sidecar.update(entries)
+        self.logger.info(
+            f"Sidecar: {changed} of {len(entries)} notes changed in "
+            f"{self.sidecar.path}"
+        )
+        return changed
 
-                # Write updated content
-                with open(doc["path"], "w", encoding="utf-8") as f:
-                    f.write(content)
+    def _record_write(self, path: str, content: str):
+        """
+        Remember a note as we wrote it, so it is not reprocessed as changed
 
-            except Exception as e:
-                self.logger.error(f"Could not update {doc['filename']}: {e}")
+        :param path: Path to the note
+        :param content: Content written
+        """
+        stat = ObsidianCache.get_file_stat(path)
+        self.written_files[path] = stat
+        self.file_stats[path] = stat
+        if self.use_cache and self.cache:
+            content_hash = ObsidianCache.get_content_hash(content)
+            self.cache.refresh_file_stat(path, stat, content_hash)
+            # Generated links are not the note's own, so its links are unchanged
+            self.build_link_index(content, content_hash)
 
     def _call_claude_api(self, prompt: str) -> str:
         """
@@ -811,42 +2155,7 @@ class AdvancedObsidianProcessor:
         :param prompt: Prompt to send to Claude
         :return: API response
         """
-        if not self.api_key:
-            self.logger.warning("No API key provided, using placeholder text")
-            return f"Related content for {prompt[:20]}..."
-
-        try:
-            headers = {
-                "Content-Type": "application/json",
-                "X-API-Key": self.api_key,
-                "Anthropic-Version": "2023-06-01",
-            }
-
-            payload = {
-                "model": self.model,
-                "max_tokens": 1000,
-                "messages": [{"role": "user", "content": prompt}],
-            }
-
-            self.logger.debug(f"Calling Claude API with model: {self.model}")
-            response = requests.post(
-                "https://api.anthropic.com/v1/messages",
-                headers=headers,
-                data=json.dumps(payload),
-                timeout=30,  # Add timeout to prevent hanging
-            )
-
-            if response.status_code != 200:
-                self.logger.error(
-                    f"API call failed: {response.status_code} - {response.text}"
-                )
-                return f"Related content (API error)"
-
-            return response.json()["content"][0]["text"]
-
-        except Exception as e:
-            self.logger.error(f"Error calling Claude API: {e}")
-            return f"Related content (error: {str(e)[:50]})"
+        return self.llm_client.complete(prompt)
 
 
 def setup_argparse():
@@ -911,6 +2220,115 @@ def setup_argparse():
         help="Force refresh all files, ignoring cache",
     )
 
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Send Claude prompts as one Message Batches job (for offline runs)",
+    )
+
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and process notes as they are saved",
+    )
+
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="Enable verbose logging"
+    )
+
+    return parser
+
+
+def setup_cache_argparse():
+    """Set up argument parsing for the cache maintenance subcommand"""
+    parser = argparse.ArgumentParser(
+        prog="ai-tagger-cached.py cache",
+        description="Inspect or garbage-collect the processing cache",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument(
+        "action",
+        choices=["gc", "stats"],
+        help="gc: drop entries of deleted notes and enforce cache_max_bytes; "
+        "stats: report per-table usage",
+    )
+
+    parser.add_argument("vault_path", help="Path to Obsidian vault directory")
+
+    parser.add_argument("-c", "--config", help="Path to YAML configuration file")
+
+    parser.add_argument("--cache-dir", help="Directory to store cache files")
+
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="Enable verbose logging"
+    )
+
+    return parser
+
+
+def cache_main(argv: List[str]):
+    """
+    Entry point for `ai-tagger-cached.py cache gc|stats`
+
+    :param argv: Arguments after the subcommand name
+    """
+    args = setup_cache_argparse().parse_args(argv)
+    processor = AdvancedObsidianProcessor(
+        vault_path=args.vault_path,
+        config_path=args.config,
+        verbose=args.verbose,
+        cache_dir=args.cache_dir,
+    )
+    try:
+        if args.action == "gc":
+            removed = processor.collect_cache_garbage()
+            processor.cache.save_caches()
+            for name, count in sorted(removed.items()):
+                print(f"Removed {count} {name} entries")
+            if not removed:
+                print("Nothing to remove")
+
+        stats = processor.cache.stats()
+        if processor.llm_client.response_cache is not None:
+            stats["llm_responses"] = processor.llm_client.response_cache.stats()
+        print(f"{'table':<16}{'entries':>10}{'bytes':>14}")
+        for name, table_stats in stats.items():
+            print(f"{name:<16}{table_stats['entries']:>10}{table_stats['bytes']:>14}")
+    finally:
+        processor.llm_client.close()
+        processor.cache.close()
+
+
+def setup_graph_argparse():
+    """Set up argument parsing for the link graph subcommand"""
+    parser = argparse.ArgumentParser(
+        prog="ai-tagger-cached.py graph",
+        description="Query the links between notes",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument(
+        "query",
+        choices=["backlinks", "outgoing", "neighbors", "orphans", "broken"],
+        help="backlinks/outgoing/neighbors of NOTE, notes without links, "
+        "or links to missing notes",
+    )
+
+    parser.add_argument("vault_path", help="Path to Obsidian vault directory")
+
+    parser.add_argument(
+        "note", nargs="?", help="Note path or link name (for note queries)"
+    )
+
+    parser.add_argument(
+        "--hops", type=int, default=1, help="Links followed by the neighbors query"
+    )
+
+    parser.add_argument("-c", "--config", help="Path to YAML configuration file")
+
+    parser.add_argument("--cache-dir", help="Directory to store cache files")
+
     parser.add_argument(
         "-v", "--verbose", action="store_true", help="Enable verbose logging"
     )
@@ -918,15 +2336,78 @@ def setup_argparse():
     return parser
 
 
+def graph_main(argv: List[str]):
+    """
+    Entry point for `ai-tagger-cached.py graph QUERY VAULT [NOTE]`
+
+    :param argv: Arguments after the subcommand name
+    """
+    parser = setup_graph_argparse()
+    args = parser.parse_args(argv)
+    if args.query in ("backlinks", "outgoing", "neighbors") and not args.note:
+        parser.error(f"{args.query} needs a NOTE")
+
+    processor = AdvancedObsidianProcessor(
+        vault_path=args.vault_path,
+        config_path=args.config,
+        verbose=args.verbose,
+        cache_dir=args.cache_dir,
+    )
+    try:
+        processor.update_link_graph()
+        processor.link_graph.save()
+        graph = processor.link_graph
+
+        if args.query in ("backlinks", "outgoing", "neighbors"):
+            note = graph.find(args.note)
+            if note is None:
+                print(f"No note named {args.note}")
+                sys.exit(1)
+            if args.query == "backlinks":
+                results = graph.backlinks(note)
+            elif args.query == "outgoing":
+                results = graph.outgoing(note)
+            else:
+                results = [
+                    f"{distance}\t{path}"
+                    for path, distance in graph.neighborhood(note, args.hops).items()
+                ]
+        elif args.query == "orphans":
+            results = graph.orphans()
+        else:
+            results = [
+                f"{path}\t{target}"
+                for path, targets in graph.broken_links().items()
+                for target in targets
+            ]
+
+        for line in results:
+            print(line)
+    finally:
+        processor.llm_client.close()
+        if processor.cache is not None:
+            processor.cache.close()
+
+
 def main():
     """Main entry point for the CLI application"""
+    if sys.argv[1:2] == ["cache"]:
+        cache_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["graph"]:
+        graph_main(sys.argv[2:])
+        return
+
     parser = setup_argparse()
     args = parser.parse_args()
+    if args.watch and (args.batch or args.force_refresh):
+        parser.error("--watch cannot be combined with --batch or --force-refresh")
 
     # Create output directory if it doesn't exist
     output_dir = Path(args.output)
     output_dir.mkdir(parents=True, exist_ok=True)
 
+    processor = None
     try:
         # Initialize processor
         processor = AdvancedObsidianProcessor(
@@ -941,12 +2422,21 @@ def main():
             use_cache=not args.no_cache,
         )
 
+        if args.watch:
+            processor.watch(
+                dry_run=args.dry_run,
+                tags_only=args.tags_only,
+                links_only=args.links_only,
+            )
+            return
+
         # Process vault with appropriate options
         results = processor.process_vault(
             dry_run=args.dry_run,
             tags_only=args.tags_only,
             links_only=args.links_only,
             force_refresh=args.force_refresh,
+            batch_mode=args.batch,
         )
 
         if not results:
@@ -976,6 +2466,13 @@ def main():
 
             traceback.print_exc()
         sys.exit(1)
+    finally:
+        if processor is not None:
+            processor.llm_client.close()
+            if processor.cache is not None:
+                processor.cache.close()
+            if processor.sidecar is not None:
+                processor.sidecar.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the single-pass Markdown parser against the regex scans
+it replaced: extract_existing_tags in generate_tags and _update_documents,
+extract_existing_links, and the frontmatter matches of _update_documents.
+
+Usage: python benchmark_markdown.py [--notes N] [--repeat R]
+"""
+
+import re
+import time
+import random
+import argparse
+from typing import Callable, List, Set
+
+from obsidian_markdown import MarkdownParser, parse_markdown
+
+# Stages of a run that read a note's structure: generate_tags,
+# build_link_index and _update_documents
+STAGES = 3
+
+WORDS = (
+    "vault note idea project meeting review draft summary research link "
+    "topic question answer system design cache index graph embedding"
+).split()
+
+
+def legacy_extract_tags(content: str) -> Set[str]:
+    """extract_existing_tags as it was before the single-pass parser"""
+    tags = set()
+    content_parts = re.split(r"```.*?```", content, flags=re.DOTALL)
+    for part in content_parts[::2]:
+        tags.update(re.findall(r"(?<!\S)#([a-zA-Z0-9_/-]+)", part))
+
+    frontmatter_match = re.search(r"^---\s*\n(.*?)\n---", content, re.DOTALL)
+    if frontmatter_match:
+        frontmatter = frontmatter_match.group(1)
+        for line in re.findall(r"tags?:\s*(.*?)(?:\n|$)", frontmatter):
+            if "[" in line and "]" in line:
+                for tag_list in re.findall(r"\[(.*?)\]", line):
+                    for tag in tag_list.split(","):
+                        clean_tag = tag.strip().strip("\"'")
+                        if clean_tag:
+                            tags.add(clean_tag)
+            elif "-" in line:
+                tags.update(re.findall(r"-\s*([^\s,]+)", line))
+            else:
+                tags.update(line.strip().split())
+    return tags
+
+
+def legacy_extract_links(content: str) -> List[str]:
+    """extract_existing_links as it was before the single-pass parser"""
+    existing_links = []
+    for pattern in (r"\[\[([^\]|]+)(?:\|[^\]]+)?\]\]", r"\[([^\]]+)\]\(([^\)]+)\)"):
+        for match in re.findall(pattern, content):
+            if isinstance(match, tuple):
+                existing_links.append(match[1])
+                existing_links.append(match[0])
+            else:
+                existing_links.append(match)
+    return existing_links
+
+
+def legacy_run(content: str):
+    """Every scan one note went through in a processing run"""
+    legacy_extract_tags(content)  # generate_tags
+    # Called once per compared pair before, so this undercounts the old cost
+    legacy_extract_links(content)
+    legacy_extract_tags(content)  # _update_documents
+    if re.match(r"^---\s*\n.*?\n---", content, re.DOTALL) is not None:
+        frontmatter_match = re.match(r"^---\s*\n(.*?)\n---", content, re.DOTALL)
+        re.search(r"tags?:", frontmatter_match.group(1))
+
+
+def uncached_run(content: str):
+    """The same stages tokenizing the note again at each one"""
+    for _ in range(STAGES):
+        parse_markdown(content)
+
+
+def shared_run(parser: MarkdownParser):
+    """The same stages served by one parser: one tokenizer pass per note"""
+
+    def run(content: str):
+        for _ in range(STAGES):
+            parser.parse(content)
+
+    return run
+
+
+def warm_parser(notes: List[str]) -> MarkdownParser:
+    """A parser that already holds every note, as in --watch mode"""
+    parser = MarkdownParser(max_entries=len(notes))
+    for note in notes:
+        parser.parse(note)
+    return parser
+
+
+def make_note(rng: random.Random, index: int) -> str:
+    """Build a synthetic note with frontmatter, headings, code, tags and links"""
+    lines = [
+        "---",
+        f"title: Note {index}",
+        f"tags: [{rng.choice(WORDS)}, {rng.choice(WORDS)}]",
+        "---",
+    ]
+    for section in range(rng.randint(2, 6)):
+        lines.append(f"## {rng.choice(WORDS).title()} {section}")
+        for _ in range(rng.randint(2, 5)):
+            sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 25)))
+            extras = [
+                f"[[Note {rng.randrange(10000)}]]",
+                f"#{rng.choice(WORDS)}",
+                f"[doc](Note%20{rng.randrange(10000)}.md)",
+                "`inline #code`",
+            ]
+            lines.append(f"{sentence} {rng.choice(extras)} {rng.choice(extras)}")
+            lines.append("")
+        if rng.random() < 0.3:
+            lines.extend(["```python", "# comment #notatag", "x = [[1]]", "```"])
+    return "\n".join(lines) + "\n"
+
+
+def measure(label: str, notes: List[str], make_scan: Callable, repeat: int):
+    """Run a fresh scan over every note and print the best throughput"""
+    total_bytes = sum(len(note.encode("utf-8")) for note in notes)
+    best = float("inf")
+    for _ in range(repeat):
+        scan = make_scan()
+        start = time.perf_counter()
+        for note in notes:
+            scan(note)
+        best = min(best, time.perf_counter() - start)
+    print(
+        f"{label:<32} {len(notes) / best:>10,.0f} notes/s "
+        f"{total_bytes / best / 1e6:>8.1f} MB/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--notes", type=int, default=2000, help="Synthetic notes")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per variant")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    notes = [make_note(rng, index) for index in range(args.notes)]
+
+    print("One tokenization:")
+    measure("  legacy tag scan", notes, lambda: legacy_extract_tags, args.repeat)
+    measure("  single pass", notes, lambda: parse_markdown, args.repeat)
+    print(f"Whole run ({STAGES} stages per note):")
+    measure("  legacy regex scans", notes, lambda: legacy_run, args.repeat)
+    measure("  single pass per stage", notes, lambda: uncached_run, args.repeat)
+    measure(
+        "  shared parser, cold",
+        notes,
+        lambda: shared_run(MarkdownParser(max_entries=len(notes))),
+        args.repeat,
+    )
+    measure(
+        "  shared parser, cached",
+        notes,
+        lambda: shared_run(warm_parser(notes)),
+        args.repeat,
+    )
+
+
+if __name__ == "__main__":
+    main()
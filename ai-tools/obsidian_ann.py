@@ -0,0 +1,272 @@
+import pickle
+import logging
+from pathlib import Path
+from typing import List, Dict, Optional, Sequence, Tuple
+import numpy as np
+
+
+class IVFIndex:
+    """Inverted-file approximate nearest-neighbor index for cosine similarity"""
+
+    def __init__(self, nlist: Optional[int] = None, nprobe: int = 8, seed: int = 0):
+        """
+        Initialize an empty index
+
+        :param nlist: Number of clusters (defaults to sqrt of the corpus size)
+        :param nprobe: Number of clusters searched per query; higher means
+            better recall and slower queries
+        :param seed: Random seed for centroid initialization
+        """
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.seed = seed
+
+        self.keys: List[Optional[str]] = []
+        self.key_to_row: Dict[str, int] = {}
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        self.trained_size = 0
+        self._lists = None
+
+    def __len__(self) -> int:
+        return len(self.key_to_row)
+
+    @staticmethod
+    def _normalize(vectors: Sequence[np.ndarray]) -> np.ndarray:
+        """Stack vectors into a row-normalized float32 matrix"""
+        matrix = np.array(np.vstack(vectors), dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+    def _assign(self, matrix: np.ndarray, block_size: int = 4096) -> np.ndarray:
+        """Assign each row to its most similar centroid"""
+        assignments = np.empty(matrix.shape[0], dtype=np.int32)
+        for start in range(0, matrix.shape[0], block_size):
+            block = matrix[start : start + block_size]
+            assignments[start : start + block_size] = np.argmax(
+                block @ self.centroids.T, axis=1
+            )
+        return assignments
+
+    def build(
+        self, keys: Sequence[str], vectors: Sequence[np.ndarray], iterations: int = 10
+    ):
+        """
+        Train centroids with spherical k-means and index all vectors
+
+        :param keys: Document keys
+        :param vectors: Embeddings, one per key
+        :param iterations: Number of k-means iterations
+        """
+        self.keys = list(keys)
+        self.key_to_row = {key: row for row, key in enumerate(self.keys)}
+        self._lists = None
+        if not self.keys:
+            self.trained_size = 0
+            return
+
+        matrix = self._normalize(vectors)
+        nlist = min(len(self.keys), self.nlist or max(1, int(np.sqrt(len(self.keys)))))
+        rng = np.random.default_rng(self.seed)
+        self.centroids = matrix[rng.choice(len(self.keys), nlist, replace=False)].copy()
+
+        for _ in range(iterations):
+            assignments = self._assign(matrix)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assignments, matrix)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Empty clusters keep their previous centroid
+            nonempty = norms[:, 0] > 0
+            self.centroids[nonempty] = sums[nonempty] / norms[nonempty]
+
+        self.vectors = matrix
+        self.assignments = self._assign(matrix)
+        self.trained_size = len(self.keys)
+        logging.info(
+            f"Built ANN index with {nlist} clusters over {len(self.keys)} vectors"
+        )
+
+    def upsert(self, keys: Sequence[str], vectors: Sequence[np.ndarray]):
+        """
+        Add or update vectors without retraining the centroids
+
+        :param keys: Document keys
+        :param vectors: Embeddings, one per key
+        """
+        if not keys:
+            return
+        # Later duplicates of a key win
+        latest = dict(zip(keys, vectors))
+        keys, vectors = list(latest), list(latest.values())
+        if self.trained_size == 0:
+            self.build(keys, vectors)
+            return
+
+        matrix = self._normalize(vectors)
+        assignments = self._assign(matrix)
+        new_rows = []
+        for key, vector, assignment in zip(keys, matrix, assignments):
+            row = self.key_to_row.get(key)
+            if row is None:
+                self.key_to_row[key] = len(self.keys) + len(new_rows)
+                new_rows.append((key, vector, assignment))
+            else:
+                self.vectors[row] = vector
+                self.assignments[row] = assignment
+
+        if new_rows:
+            self.keys.extend(key for key, _, _ in new_rows)
+            self.vectors = np.vstack([self.vectors, [v for _, v, _ in new_rows]])
+            self.assignments = np.concatenate(
+                [
+                    self.assignments,
+                    np.array([a for _, _, a in new_rows], dtype=np.int32),
+                ]
+            )
+        self._lists = None
+
+    def remove(self, keys: Sequence[str]):
+        """
+        Remove vectors from the index
+
+        :param keys: Document keys
+        """
+        for key in keys:
+            row = self.key_to_row.pop(key, None)
+            if row is not None:
+                self.keys[row] = None
+                self.assignments[row] = -1
+        self._lists = None
+
+    def needs_rebuild(self, growth: float = 2.0) -> bool:
+        """
+        Check whether the corpus has drifted enough to warrant retraining
+
+        :param growth: Allowed size ratio relative to the trained corpus
+        :return: True if the index should be rebuilt
+        """
+        if self.trained_size == 0:
+            return True
+        return (
+            len(self) > self.trained_size * growth
+            or len(self.keys) > max(1, len(self)) * growth
+        )
+
+    def _inverted_lists(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Return rows grouped by cluster plus per-cluster offsets"""
+        if self._lists is None:
+            valid = np.flatnonzero(self.assignments >= 0)
+            order = valid[np.argsort(self.assignments[valid], kind="stable")]
+            counts = np.bincount(
+                self.assignments[valid], minlength=self.centroids.shape[0]
+            )
+            offsets = np.concatenate([[0], np.cumsum(counts)])
+            self._lists = (order, offsets)
+        return self._lists
+
+    def search(
+        self, queries: np.ndarray, k: int, nprobe: Optional[int] = None
+    ) -> List[List[Tuple[str, float]]]:
+        """
+        Find approximate nearest neighbors
+
+        :param queries: Query matrix
+        :param k: Number of neighbors per query
+        :param nprobe: Clusters to search (defaults to the index setting)
+        :return: Per-query lists of (key, score), best first
+        """
+        if len(self) == 0 or len(queries) == 0:
+            return [[] for _ in range(len(queries))]
+
+        matrix = self._normalize(queries)
+        nprobe = max(1, min(nprobe or self.nprobe, self.centroids.shape[0]))
+        centroid_scores = matrix @ self.centroids.T
+        probes = np.argpartition(-centroid_scores, nprobe - 1, axis=1)[:, :nprobe]
+        order, offsets = self._inverted_lists()
+
+        results = []
+        for query, clusters in zip(matrix, probes):
+            rows = np.concatenate(
+                [order[offsets[c] : offsets[c + 1]] for c in clusters]
+            )
+            scores = self.vectors[rows] @ query
+            if len(rows) > k:
+                kept = np.argpartition(-scores, k - 1)[:k]
+                rows, scores = rows[kept], scores[kept]
+            best = np.argsort(-scores, kind="stable")
+            results.append([(self.keys[rows[i]], float(scores[i])) for i in best])
+        return results
+
+    def estimate_recall(
+        self, k: int = 10, sample_size: int = 100, nprobe: Optional[int] = None
+    ) -> float:
+        """
+        Measure recall@k of the index against exact search on a sample
+
+        :param k: Number of neighbors compared
+        :param sample_size: Number of indexed vectors used as queries
+        :param nprobe: Clusters to search (defaults to the index setting)
+        :return: Fraction of exact neighbors also returned by the index
+        """
+        active = np.flatnonzero(self.assignments >= 0)
+        if len(active) < 2:
+            return 1.0
+
+        rng = np.random.default_rng(self.seed)
+        sample = rng.choice(active, min(sample_size, len(active)), replace=False)
+        approximate = self.search(self.vectors[sample], k + 1, nprobe=nprobe)
+
+        found = expected = 0
+        for row, hits in zip(sample, approximate):
+            scores = self.vectors[active] @ self.vectors[row]
+            scores[active == row] = -np.inf
+            exact_rows = active[np.argsort(-scores, kind="stable")[:k]]
+            exact = {self.keys[r] for r in exact_rows}
+            returned = {key for key, _ in hits if key != self.keys[row]}
+            found += len(exact & returned)
+            expected += len(exact)
+        return found / expected if expected else 1.0
+
+    def save(self, path: Path):
+        """
+        Save the index to disk
+
+        :param path: Destination file
+        """
+        with open(path, "wb") as f:
+            pickle.dump(
+                {
+                    "nlist": self.nlist,
+                    "nprobe": self.nprobe,
+                    "seed": self.seed,
+                    "keys": self.keys,
+                    "vectors": self.vectors,
+                    "assignments": self.assignments,
+                    "centroids": self.centroids,
+                    "trained_size": self.trained_size,
+                },
+                f,
+            )
+
+    @classmethod
+    def load(cls, path: Path) -> "IVFIndex":
+        """
+        Load an index saved with save()
+
+        :param path: Source file
+        :return: Loaded index
+        """
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        index = cls(state["nlist"], state["nprobe"], state["seed"])
+        index.keys = state["keys"]
+        index.key_to_row = {
+            key: row for row, key in enumerate(index.keys) if key is not None
+        }
+        index.vectors = state["vectors"]
+        index.assignments = state["assignments"]
+        index.centroids = state["centroids"]
+        index.trained_size = state["trained_size"]
+        return index
@@ -0,0 +1,250 @@
+import os
+import logging
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+import numpy as np
+
+
+class BacklinkIndex:
+    """Reverse adjacency (target to sources) stored as CSR arrays"""
+
+    def __init__(self):
+        """Create an empty index"""
+        self.clear()
+
+    def clear(self):
+        """Remove all sources and edges"""
+        self.sources: List[Optional[str]] = []  # Source name per row
+        self.source_rows: Dict[str, List[int]] = defaultdict(list)
+        self.target_names: List[str] = []
+        self.target_ids: Dict[str, int] = {}
+
+        # One entry per edge, sorted by (target id, source row)
+        self.edge_targets = np.zeros(0, dtype=np.int32)
+        self.edge_sources = np.zeros(0, dtype=np.int32)
+        self.edge_positions = np.zeros(0, dtype=np.int32)
+        self.offsets = np.zeros(1, dtype=np.int64)
+
+    def _target_id(self, target: str) -> int:
+        """Get the id of a target, registering it on first use"""
+        target_id = self.target_ids.get(target)
+        if target_id is None:
+            target_id = self.target_ids[target] = len(self.target_names)
+            self.target_names.append(target)
+        return target_id
+
+    def _edges(
+        self, rows: Iterable[int], outgoing: Mapping[str, Sequence[str]]
+    ) -> Tuple[List[int], List[int], List[int]]:
+        """
+        Collect the edges of some source rows
+
+        Only the first link from a source to each target counts, and
+        self-links are skipped.
+
+        :param rows: Source rows
+        :param outgoing: Mapping of source name to its ordered link targets
+        :return: Target ids, source rows and link positions
+        """
+        targets, sources, positions = [], [], []
+        for row in rows:
+            source = self.sources[row]
+            seen = set()
+            for position, target in enumerate(outgoing.get(source, ())):
+                if target == source or target in seen:
+                    continue
+                seen.add(target)
+                targets.append(self._target_id(target))
+                sources.append(row)
+                positions.append(position)
+        return targets, sources, positions
+
+    def _store(self, targets: np.ndarray, sources: np.ndarray, positions: np.ndarray):
+        """Sort edges by target, then source row, and rebuild the offsets"""
+        order = np.lexsort((sources, targets))
+        self.edge_targets = targets[order].astype(np.int32)
+        self.edge_sources = sources[order].astype(np.int32)
+        self.edge_positions = positions[order].astype(np.int32)
+        self.offsets = np.searchsorted(
+            self.edge_targets, np.arange(len(self.target_names) + 1)
+        ).astype(np.int64)
+
+    def build(self, sources: Sequence[str], outgoing: Mapping[str, Sequence[str]]):
+        """
+        Build the index in one pass over the outgoing links
+
+        :param sources: Source names in the order their backlinks are listed;
+            a name may appear more than once
+        :param outgoing: Mapping of source name to its ordered link targets
+        """
+        self.clear()
+        for row, source in enumerate(sources):
+            self.sources.append(source)
+            self.source_rows[source].append(row)
+        targets, rows, positions = self._edges(range(len(sources)), outgoing)
+        self._store(np.array(targets), np.array(rows), np.array(positions))
+
+    def build_from_csr(
+        self,
+        sources: Sequence[str],
+        target_names: Sequence[str],
+        offsets: np.ndarray,
+        targets: np.ndarray,
+    ):
+        """
+        Build the index from forward adjacency arrays without a Python loop
+        over the edges
+
+        :param sources: Source names, one per row
+        :param target_names: Target name per target id
+        :param offsets: Row i links to targets[offsets[i]:offsets[i + 1]]
+        :param targets: Target ids; each row's targets must be distinct and
+            must not include the row itself
+        """
+        self.clear()
+        self.sources = list(sources)
+        for row, source in enumerate(self.sources):
+            self.source_rows[source].append(row)
+        self.target_names = list(target_names)
+        self.target_ids = dict(zip(self.target_names, range(len(self.target_names))))
+        counts = np.diff(offsets)
+        self._store(
+            np.asarray(targets),
+            np.repeat(np.arange(len(self.sources)), counts),
+            np.arange(len(targets)) - np.repeat(offsets[:-1], counts),
+        )
+
+    def update(self, outgoing: Mapping[str, Sequence[str]]):
+        """
+        Replace the outgoing links of some sources, keeping all other edges
+
+        Sources not yet in the index are appended after the existing ones.
+
+        :param outgoing: Mapping of source name to its new ordered link targets
+        """
+        for source in outgoing:
+            if source not in self.source_rows:
+                self.source_rows[source].append(len(self.sources))
+                self.sources.append(source)
+        rows = [row for source in outgoing for row in self.source_rows[source]]
+        keep = ~np.isin(self.edge_sources, rows)
+        targets, new_rows, positions = self._edges(rows, outgoing)
+        self._store(
+            np.concatenate([self.edge_targets[keep], targets]),
+            np.concatenate([self.edge_sources[keep], new_rows]),
+            np.concatenate([self.edge_positions[keep], positions]),
+        )
+
+    def remove(self, sources: Iterable[str]):
+        """
+        Drop sources and all their outgoing links
+
+        :param sources: Source names
+        """
+        rows = []
+        for source in sources:
+            for row in self.source_rows.pop(source, []):
+                self.sources[row] = None
+                rows.append(row)
+        keep = ~np.isin(self.edge_sources, rows)
+        self._store(
+            self.edge_targets[keep], self.edge_sources[keep], self.edge_positions[keep]
+        )
+
+    def targets_of(self, sources: Iterable[str]) -> Dict[str, List[Tuple[str, int]]]:
+        """
+        Get the targets some sources link to
+
+        :param sources: Source names
+        :return: Mapping of each source in the index to a list of (target name,
+            position of the link in the source's links), in link order
+        """
+        rows = {
+            row: source
+            for source in sources
+            if source in self.source_rows
+            for row in self.source_rows[source]
+        }
+        targets = {source: [] for source in rows.values()}
+        mask = np.isin(self.edge_sources, list(rows))
+        edges = sorted(
+            zip(
+                self.edge_sources[mask].tolist(),
+                self.edge_positions[mask].tolist(),
+                self.edge_targets[mask].tolist(),
+            )
+        )
+        for row, position, target_id in edges:
+            targets[rows[row]].append((self.target_names[target_id], position))
+        return targets
+
+    def save(self, index_file: Path):
+        """
+        Write the index as arrays, atomically, leaving out removed sources
+
+        :param index_file: .npz file
+        """
+        live = np.array([source is not None for source in self.sources], dtype=bool)
+        new_rows = np.cumsum(live) - 1
+        tmp_file = index_file.with_name(index_file.name + ".tmp.npz")
+        np.savez(
+            tmp_file,
+            sources=np.array(
+                [source for source in self.sources if source is not None], dtype=str
+            ),
+            target_names=np.array(self.target_names, dtype=str),
+            edge_targets=self.edge_targets,
+            edge_sources=new_rows[self.edge_sources].astype(np.int32),
+            edge_positions=self.edge_positions,
+        )
+        os.replace(tmp_file, index_file)
+
+    def load(self, index_file: Path) -> bool:
+        """
+        Replace the index with one written by save
+
+        :param index_file: .npz file
+        :return: False if the file is missing or unreadable; the index is
+            then empty
+        """
+        self.clear()
+        if not index_file.exists():
+            return False
+        try:
+            with np.load(index_file, allow_pickle=False) as data:
+                sources = data["sources"].tolist()
+                target_names = data["target_names"].tolist()
+                targets = data["edge_targets"]
+                rows = data["edge_sources"]
+                positions = data["edge_positions"]
+        except Exception as e:
+            logging.warning(f"Error loading backlink index: {e}. Rebuilding it.")
+            return False
+
+        self.sources = sources
+        for row, source in enumerate(sources):
+            self.source_rows[source].append(row)
+        self.target_names = target_names
+        self.target_ids = dict(zip(target_names, range(len(target_names))))
+        self._store(targets, rows, positions)
+        return True
+
+    def sources_of(self, target: str) -> List[Tuple[str, int]]:
+        """
+        Get the sources linking to a target
+
+        :param target: Target name
+        :return: List of (source name, position of the link in the source's
+            links), in source order
+        """
+        target_id = self.target_ids.get(target)
+        if target_id is None:
+            return []
+        start, end = self.offsets[target_id], self.offsets[target_id + 1]
+        return [
+            (self.sources[row], int(position))
+            for row, position in zip(
+                self.edge_sources[start:end], self.edge_positions[start:end]
+            )
+        ]
@@ -4,10 +4,17 @@ import hashlib
 import pickle
 import logging
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Set
 from datetime import datetime
+from collections import defaultdict
 import numpy as np
 
+from obsidian_ann import IVFIndex
+from obsidian_embedding_store import EmbeddingMatrixStore
+
+# Embedding store keys of chunk embeddings, followed by the chunk's content hash
+CHUNK_KEY_PREFIX = "chunk:"
+
 
 class ObsidianCache:
     """Cache system for Obsidian processor to avoid reprocessing the same files"""
@@ -25,26 +32,29 @@ class ObsidianCache:
 
         # Cache files
         self.embeddings_cache_file = self.cache_dir / "embeddings_cache.pkl"
+        self.embeddings_matrix_file = self.cache_dir / "embeddings.npy"
+        self.embeddings_index_file = self.cache_dir / "embeddings_index.npy"
         self.tags_cache_file = self.cache_dir / "tags_cache.pkl"
         self.similarities_cache_file = self.cache_dir / "similarities_cache.pkl"
         self.metadata_cache_file = self.cache_dir / "metadata_cache.json"
+        self.links_cache_file = self.cache_dir / "links_cache.pkl"
+        self.ann_index_file = self.cache_dir / "ann_index.pkl"
 
         # Initialize cache containers
         self.embeddings_cache = {}
         self.tags_cache = {}
         self.similarities_cache = {}
         self.file_metadata = {}
+        self.links_cache = {}
+        self.ann_index: Optional[IVFIndex] = None
 
         # Load existing caches if available
         self._load_caches()
+        self._load_embedding_store()
 
     def _load_caches(self):
         """Load all available caches from disk"""
         try:
-            if self.embeddings_cache_file.exists():
-                with open(self.embeddings_cache_file, "rb") as f:
-                    self.embeddings_cache = pickle.load(f)
-
             if self.tags_cache_file.exists():
                 with open(self.tags_cache_file, "rb") as f:
                     self.tags_cache = pickle.load(f)
@@ -56,18 +66,43 @@ class ObsidianCache:
             if self.metadata_cache_file.exists():
                 with open(self.metadata_cache_file, "r", encoding="utf-8") as f:
                     self.file_metadata = json.load(f)
+
+            if self.links_cache_file.exists():
+                with open(self.links_cache_file, "rb") as f:
+                    self.links_cache = pickle.load(f)
+
+            if self.ann_index_file.exists():
+                self.ann_index = IVFIndex.load(self.ann_index_file)
         except Exception as e:
             logging.warning(f"Error loading cache: {e}. Starting with fresh cache.")
-            self.embeddings_cache = {}
             self.tags_cache = {}
             self.similarities_cache = {}
             self.file_metadata = {}
+            self.links_cache = {}
+            self.ann_index = None
+
+    def _load_embedding_store(self):
+        """Map the embedding matrix, migrating a pickled embedding dict once"""
+        self.embeddings_cache = EmbeddingMatrixStore(
+            self.embeddings_matrix_file, self.embeddings_index_file
+        )
+        if not self.embeddings_cache_file.exists():
+            return
+        try:
+            with open(self.embeddings_cache_file, "rb") as f:
+                legacy = pickle.load(f)
+            for key, embedding in legacy.items():
+                self.embeddings_cache[key] = embedding
+            self.embeddings_cache.save()
+            self.embeddings_cache_file.unlink()
+            logging.info(f"Migrated {len(legacy)} pickled embeddings to the matrix")
+        except Exception as e:
+            logging.warning(f"Error migrating pickled embeddings: {e}")
 
     def save_caches(self):
         """Save all caches to disk"""
         try:
-            with open(self.embeddings_cache_file, "wb") as f:
-                pickle.dump(self.embeddings_cache, f)
+            self.embeddings_cache.save()
 
             with open(self.tags_cache_file, "wb") as f:
                 pickle.dump(self.tags_cache, f)
@@ -78,51 +113,316 @@ class ObsidianCache:
             with open(self.metadata_cache_file, "w", encoding="utf-8") as f:
                 json.dump(self.file_metadata, f, indent=2)
 
+            with open(self.links_cache_file, "wb") as f:
+                pickle.dump(self.links_cache, f)
+
+            if self.ann_index is not None:
+                self.ann_index.save(self.ann_index_file)
+
             logging.info(f"Cache saved to {self.cache_dir}")
         except Exception as e:
             logging.error(f"Error saving cache: {e}")
 
+    @staticmethod
+    def get_content_hash(content: str) -> str:
+        """
+        Generate a hash of a file's content alone
+
+        :param content: File content
+        :return: Hash string
+        """
+        return hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
+
+    @staticmethod
+    def get_file_stat(file_path: str) -> List[int]:
+        """
+        Get the (size, mtime_ns, inode) fingerprint of a file from one stat call
+
+        :param file_path: Path to the file
+        :return: Stat fingerprint
+        """
+        stat = os.stat(file_path)
+        return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
     def get_file_hash(self, file_path: str, content: str) -> str:
         """
-        Generate a hash for a file based on its content and modification time
+        Generate the legacy hash of a file based on its content and modification time
+
+        Only used to compare against metadata written before stat fingerprints.
 
         :param file_path: Path to the file
         :param content: File content
         :return: Hash string
         """
-        # Use content hash and modification time for cache key
         content_hash = hashlib.md5(content.encode("utf-8")).hexdigest()
         mod_time = os.path.getmtime(file_path)
         return f"{content_hash}_{mod_time}"
 
-    def is_file_changed(self, file_path: str, content: str) -> bool:
+    def is_file_stat_unchanged(self, file_path: str, stat: List[int]) -> bool:
         """
-        Check if a file has changed since last processing
+        Check whether a file's stat fingerprint matches the last processed one
+
+        :param file_path: Path to the file
+        :param stat: Fingerprint from get_file_stat
+        :return: True if the file can be skipped without reading it
+        """
+        rel_path = os.path.relpath(file_path, self.vault_path)
+        metadata = self.file_metadata.get(rel_path)
+        return metadata is not None and metadata.get("stat") == stat
+
+    def is_file_changed(
+        self, file_path: str, content: str, content_hash: Optional[str] = None
+    ) -> bool:
+        """
+        Check if a file's content has changed since last processing
 
         :param file_path: Path to the file
         :param content: File content
+        :param content_hash: Optional precomputed content hash
         :return: True if file has changed or not in cache
         """
         rel_path = os.path.relpath(file_path, self.vault_path)
-        current_hash = self.get_file_hash(file_path, content)
-
-        if rel_path not in self.file_metadata:
+        metadata = self.file_metadata.get(rel_path)
+        if metadata is None:
             return True
 
-        return self.file_metadata[rel_path]["hash"] != current_hash
-
-    def update_file_metadata(self, file_path: str, content: str):
+        if "content_hash" not in metadata:
+            return metadata["hash"] != self.get_file_hash(file_path, content)
+        return metadata["content_hash"] != (
+            content_hash or self.get_content_hash(content)
+        )
+
+    def update_file_metadata(
+        self,
+        file_path: str,
+        content: str,
+        stat: Optional[List[int]] = None,
+        content_hash: Optional[str] = None,
+    ):
         """
         Update file metadata in cache
 
         :param file_path: Path to the file
         :param content: File content
+        :param stat: Optional fingerprint from get_file_stat
+        :param content_hash: Optional precomputed content hash
         """
         rel_path = os.path.relpath(file_path, self.vault_path)
-        self.file_metadata[rel_path] = {
-            "hash": self.get_file_hash(file_path, content),
+        metadata = {
+            "content_hash": content_hash or self.get_content_hash(content),
+            "stat": stat or self.get_file_stat(file_path),
             "last_processed": datetime.now().isoformat(),
         }
+        # Keep the previous chunks alive until the note is re-embedded, so an
+        # edit can reuse the embeddings of its untouched chunks
+        previous_chunks = self.file_metadata.get(rel_path, {}).get("chunks")
+        if previous_chunks:
+            metadata["chunks"] = previous_chunks
+        self.file_metadata[rel_path] = metadata
+
+    def refresh_file_stat(self, file_path: str, stat: List[int], content_hash: str):
+        """
+        Record a new stat fingerprint for a file whose content is unchanged, or
+        was only changed by our own write
+
+        :param file_path: Path to the file
+        :param stat: Fingerprint from get_file_stat
+        :param content_hash: Content hash from get_content_hash
+        """
+        rel_path = os.path.relpath(file_path, self.vault_path)
+        metadata = dict(self.file_metadata.get(rel_path, {}))
+        metadata.pop("hash", None)
+        metadata["content_hash"] = content_hash
+        metadata["stat"] = stat
+        self.file_metadata[rel_path] = metadata
+
+    def forget_files(self, file_paths: List[str]):
+        """
+        Drop file metadata so the files count as changed on the next run
+
+        :param file_paths: Paths to the files
+        """
+        for file_path in file_paths:
+            self.file_metadata.pop(os.path.relpath(file_path, self.vault_path), None)
+
+    def _tables(self) -> Dict[str, Any]:
+        """Map table names to the cache containers"""
+        return {
+            "embeddings": self.embeddings_cache,
+            "tags": self.tags_cache,
+            "similarities": self.similarities_cache,
+            "metadata": self.file_metadata,
+            "links": self.links_cache,
+        }
+
+    def _entry_sizes(self, name: str, table: Any) -> Dict[str, int]:
+        """
+        Estimate the stored size of every entry of a table
+
+        :param name: Table name from _tables
+        :param table: Cache container
+        :return: Mapping of key to bytes
+        """
+        if name == "embeddings":
+            row_bytes = (table.dim or 0) * np.dtype(np.float32).itemsize
+            return {key: row_bytes for key in table}
+        if name == "metadata":
+            return {key: len(json.dumps(value)) for key, value in table.items()}
+        return {key: len(pickle.dumps(value)) for key, value in table.items()}
+
+    @staticmethod
+    def is_document_key(key: str) -> bool:
+        """
+        Check whether an embedding key holds a document vector
+
+        :param key: Embedding store key
+        :return: False for chunk embeddings and obsolete "_content" embeddings
+        """
+        return not key.startswith(CHUNK_KEY_PREFIX) and not key.endswith("_content")
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Report per-table cache usage
+
+        :return: Entry count and bytes for every table
+        """
+        stats = {}
+        for name, table in self._tables().items():
+            sizes = self._entry_sizes(name, table)
+            stats[name] = {"entries": len(sizes), "bytes": sum(sizes.values())}
+        if self.ann_index is not None:
+            stats["ann_index"] = {
+                "entries": len(self.ann_index),
+                "bytes": (
+                    self.ann_index_file.stat().st_size
+                    if self.ann_index_file.exists()
+                    else 0
+                ),
+            }
+        return stats
+
+    def collect_garbage(
+        self, file_paths: List[str], max_bytes: int = 0
+    ) -> Dict[str, int]:
+        """
+        Drop entries of notes that no longer exist, then evict the least
+        recently processed notes until the cache fits its size budget
+
+        :param file_paths: Paths of every note currently in the vault
+        :param max_bytes: Size budget for cached entries (0 = unlimited)
+        :return: Number of removed entries per table
+        """
+        live_paths = {os.path.relpath(path, self.vault_path) for path in file_paths}
+        live_names = {os.path.basename(path) for path in file_paths}
+        tables = self._tables()
+        removed = defaultdict(int)
+
+        def drop(name: str, keys: List[str]):
+            for key in keys:
+                del tables[name][key]
+            removed[name] += len(keys)
+
+        drop("metadata", [key for key in self.file_metadata if key not in live_paths])
+        live_metadata = [metadata for _, metadata in self.file_metadata.items()]
+        live_chunks = {
+            f"{CHUNK_KEY_PREFIX}{chunk_hash}"
+            for metadata in live_metadata
+            for chunk_hash in metadata.get("chunks", ())
+        }
+        drop(
+            "embeddings",
+            [
+                key
+                for key in self.embeddings_cache
+                if key not in live_chunks
+                and not (self.is_document_key(key) and key in live_names)
+            ],
+        )
+        drop("tags", [key for key in self.tags_cache if key not in live_names])
+        drop(
+            "similarities",
+            [key for key in self.similarities_cache if key not in live_names],
+        )
+        live_hashes = {metadata.get("content_hash") for metadata in live_metadata}
+        drop("links", [key for key in self.links_cache if key not in live_hashes])
+
+        if self.ann_index is not None:
+            orphans = [
+                key for key in self.ann_index.key_to_row if key not in live_names
+            ]
+            self.ann_index.remove(orphans)
+            removed["ann_index"] += len(orphans)
+
+        if max_bytes:
+            self._evict_to_budget(max_bytes, removed)
+
+        # Rewrite the embedding matrix once most of it is free rows
+        store = self.embeddings_cache
+        store.save()
+        if store.matrix is not None and store.free_rows > store.matrix.shape[0] // 2:
+            store.compact()
+
+        removed = {name: count for name, count in removed.items() if count}
+        if removed:
+            logging.info(f"Cache garbage collection removed {removed}")
+        return removed
+
+    def _evict_to_budget(self, max_bytes: int, removed: Dict[str, int]):
+        """
+        Evict whole notes, least recently processed first, until the cached
+        entries fit in max_bytes
+
+        :param max_bytes: Size budget for cached entries
+        :param removed: Per-table removal counters to update
+        """
+        tables = self._tables()
+        sizes = {name: self._entry_sizes(name, table) for name, table in tables.items()}
+        total = sum(sum(table_sizes.values()) for table_sizes in sizes.values())
+        if total <= max_bytes:
+            return
+
+        # Group every entry under the note it belongs to
+        note_entries = defaultdict(list)
+        recency = {}
+        for rel_path, metadata in self.file_metadata.items():
+            name = os.path.basename(rel_path)
+            note_entries[name].append(("metadata", rel_path))
+            if metadata.get("content_hash") in sizes["links"]:
+                note_entries[name].append(("links", metadata["content_hash"]))
+            for chunk_hash in metadata.get("chunks", ()):
+                note_entries[name].append(
+                    ("embeddings", f"{CHUNK_KEY_PREFIX}{chunk_hash}")
+                )
+            recency[name] = max(
+                recency.get(name, ""), metadata.get("last_processed", "")
+            )
+        for table_name in ("tags", "similarities"):
+            for key in sizes[table_name]:
+                note_entries[key].append((table_name, key))
+        for key in sizes["embeddings"]:
+            if self.is_document_key(key):
+                note_entries[key].append(("embeddings", key))
+
+        for name in sorted(note_entries, key=lambda note: recency.get(note, "")):
+            if total <= max_bytes:
+                break
+            for table_name, key in note_entries[name]:
+                if key in sizes[table_name]:
+                    del tables[table_name][key]
+                    total -= sizes[table_name].pop(key)
+                    removed[table_name] += 1
+            if self.ann_index is not None and name in self.ann_index.key_to_row:
+                self.ann_index.remove([name])
+                removed["ann_index"] += 1
+
+    def invalidate_note(self, filename: str):
+        """
+        Drop the embeddings and similarities derived from a note's old content
+
+        :param filename: Filename
+        """
+        self.embeddings_cache.pop(filename, None)
+        self.similarities_cache.pop(filename, None)
 
     def get_embedding(self, filename: str) -> Optional[np.ndarray]:
         """
@@ -142,6 +442,42 @@ class ObsidianCache:
         """
         self.embeddings_cache[filename] = embedding
 
+    def get_chunk_embedding(self, chunk_hash: str) -> Optional[np.ndarray]:
+        """
+        Get the cached embedding of a chunk
+
+        :param chunk_hash: Content hash of the chunk
+        :return: Cached embedding or None
+        """
+        return self.embeddings_cache.get(f"{CHUNK_KEY_PREFIX}{chunk_hash}")
+
+    def set_chunk_embedding(self, chunk_hash: str, embedding: np.ndarray):
+        """
+        Cache the embedding of a chunk
+
+        :param chunk_hash: Content hash of the chunk
+        :param embedding: Chunk embedding
+        """
+        self.embeddings_cache[f"{CHUNK_KEY_PREFIX}{chunk_hash}"] = embedding
+
+    def set_note_chunks(self, file_path: str, chunk_hashes: List[str]):
+        """
+        Record which chunks a note's embedding was pooled from, so garbage
+        collection can tell live chunk embeddings from stale ones
+
+        :param file_path: Path to the file
+        :param chunk_hashes: Content hashes of the note's cached chunks, empty
+            for a note embedded as a single chunk
+        """
+        rel_path = os.path.relpath(file_path, self.vault_path)
+        metadata = self.file_metadata.get(rel_path)
+        if metadata is None or metadata.get("chunks", []) == chunk_hashes:
+            return
+        metadata = {**metadata, "chunks": chunk_hashes}
+        if not chunk_hashes:
+            del metadata["chunks"]
+        self.file_metadata[rel_path] = metadata
+
     def get_tags(self, filename: str) -> Optional[List[str]]:
         """
         Get cached tags for a file
@@ -178,12 +514,33 @@ class ObsidianCache:
         """
         self.similarities_cache[filename] = similarities
 
+    def get_links(self, content_hash: str) -> Optional[Set[str]]:
+        """
+        Get cached normalized link targets for a file's content
+
+        :param content_hash: Content hash from get_content_hash
+        :return: Cached link targets or None
+        """
+        links = self.links_cache.get(content_hash)
+        return set(links) if links is not None else None
+
+    def set_links(self, content_hash: str, links: Set[str]):
+        """
+        Cache normalized link targets for a file's content
+
+        :param content_hash: Content hash from get_content_hash
+        :param links: Normalized link targets
+        """
+        self.links_cache[content_hash] = sorted(links)
+
     def clear_cache(self):
         """Clear all caches"""
-        self.embeddings_cache = {}
+        self.embeddings_cache.clear()
         self.tags_cache = {}
         self.similarities_cache = {}
         self.file_metadata = {}
+        self.links_cache = {}
+        self.ann_index = None
 
         # Remove cache files
         if self.embeddings_cache_file.exists():
@@ -194,5 +551,13 @@ class ObsidianCache:
             self.similarities_cache_file.unlink()
         if self.metadata_cache_file.exists():
             self.metadata_cache_file.unlink()
+        if self.links_cache_file.exists():
+            self.links_cache_file.unlink()
+        if self.ann_index_file.exists():
+            self.ann_index_file.unlink()
 
         logging.info("Cache cleared")
+
+    def close(self):
+        """Write pending embeddings and unmap the embedding store"""
+        self.embeddings_cache.close()
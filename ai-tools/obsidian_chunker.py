@@ -0,0 +1,107 @@
+import re
+from typing import List
+
+HEADING_PATTERN = re.compile(r"^#{1,6}\s")
+FENCE_PATTERN = re.compile(r"^\s*(```|~~~)")
+PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n")
+
+
+class MarkdownChunker:
+    """Splits notes into heading- and paragraph-aligned chunks for embedding"""
+
+    def __init__(self, max_chars: int = 1000):
+        """
+        Initialize the chunker
+
+        :param max_chars: Largest chunk, in characters
+        """
+        self.max_chars = max(1, max_chars)
+
+    def split(self, content: str) -> List[str]:
+        """
+        Split a note into chunks
+
+        Chunks never span a heading, so an edit only changes the chunks of
+        its own section. Sections longer than max_chars are packed from
+        whole paragraphs; a paragraph that is still too long is cut at
+        whitespace.
+
+        :param content: Note content
+        :return: Chunks in note order; a short note is a single chunk
+        """
+        if len(content) <= self.max_chars:
+            return [content]
+
+        chunks = []
+        for section in self._sections(content):
+            chunks.extend(self._pack(section))
+        return chunks or [content[: self.max_chars]]
+
+    def _sections(self, content: str) -> List[str]:
+        """
+        Split content before every heading outside code fences
+
+        :param content: Note content
+        :return: Sections, each starting with its heading
+        """
+        sections = []
+        current = []
+        in_fence = False
+        for line in content.splitlines(keepends=True):
+            if FENCE_PATTERN.match(line):
+                in_fence = not in_fence
+            elif not in_fence and HEADING_PATTERN.match(line) and current:
+                sections.append("".join(current))
+                current = []
+            current.append(line)
+        if current:
+            sections.append("".join(current))
+        return sections
+
+    def _pack(self, section: str) -> List[str]:
+        """
+        Greedily pack the paragraphs of a section into chunks
+
+        :param section: Section text
+        :return: Non-empty chunks
+        """
+        section = section.strip()
+        if not section:
+            return []
+        if len(section) <= self.max_chars:
+            return [section]
+
+        chunks = []
+        current = ""
+        for paragraph in PARAGRAPH_BREAK.split(section):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            for piece in self._hard_split(paragraph):
+                if current and len(current) + 2 + len(piece) > self.max_chars:
+                    chunks.append(current)
+                    current = ""
+                current = f"{current}\n\n{piece}" if current else piece
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def _hard_split(self, paragraph: str) -> List[str]:
+        """
+        Cut an oversized paragraph at whitespace
+
+        :param paragraph: Paragraph text
+        :return: Pieces of at most max_chars
+        """
+        pieces = []
+        while len(paragraph) > self.max_chars:
+            cut = max(
+                paragraph.rfind(" ", 0, self.max_chars + 1),
+                paragraph.rfind("\n", 0, self.max_chars + 1),
+            )
+            cut = cut if cut > 0 else self.max_chars
+            pieces.append(paragraph[:cut].rstrip())
+            paragraph = paragraph[cut:].lstrip()
+        if paragraph:
+            pieces.append(paragraph)
+        return pieces
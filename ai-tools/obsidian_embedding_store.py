@@ -0,0 +1,263 @@
+import os
+import logging
+from collections.abc import MutableMapping
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set
+import numpy as np
+
+
+class EmbeddingMatrixStore(MutableMapping):
+    """Embeddings kept as rows of one memory-mapped float32 .npy matrix"""
+
+    def __init__(self, matrix_file: Path, index_file: Path, copy_block: int = 4096):
+        """
+        Open (or create) the store
+
+        :param matrix_file: .npy file holding one embedding per row
+        :param index_file: .npy file of (key, row) records sorted by key; free
+            rows are recorded under an empty key
+        :param copy_block: Rows copied at a time when the matrix is rewritten
+        """
+        self.matrix_file = Path(matrix_file)
+        self.index_file = Path(index_file)
+        self.copy_block = max(1, copy_block)
+
+        self.index: Optional[np.ndarray] = None
+        self.free_count = 0
+        self.pending: Dict[str, np.ndarray] = {}
+        self.deleted: Set[str] = set()
+        self.matrix: Optional[np.ndarray] = None
+        self.dirty = False
+        self._open()
+
+    def _open(self):
+        """Map the matrix and the row index read-only"""
+        if not (self.matrix_file.exists() and self.index_file.exists()):
+            return
+        try:
+            index = np.load(self.index_file, mmap_mode="r")
+            matrix = np.load(self.matrix_file, mmap_mode="r")
+            if index.dtype.names != ("key", "row") or len(index) != matrix.shape[0]:
+                raise ValueError("row index does not match the matrix")
+            self.index = index
+            self.matrix = matrix
+            self.free_count = int(np.searchsorted(index["key"], "", side="right"))
+        except Exception as e:
+            logging.warning(f"Error loading embedding store: {e}. Starting empty.")
+            self.index = None
+            self.matrix = None
+            self.free_count = 0
+
+    def _saved_row(self, key: str) -> Optional[int]:
+        """
+        Look up the matrix row of a saved key by binary search in the index
+
+        :param key: Embedding key
+        :return: Row index, or None if the key is not saved
+        """
+        if self.index is None or not key or key in self.deleted:
+            return None
+        keys = self.index["key"]
+        position = int(np.searchsorted(keys, key))
+        if position < len(keys) and keys[position] == key:
+            return int(self.index["row"][position])
+        return None
+
+    def _saved_rows(self) -> Dict[str, int]:
+        """Read the live part of the row index into a dict"""
+        if self.index is None:
+            return {}
+        live = self.index[self.free_count :]
+        return {
+            key: row
+            for key, row in zip(live["key"].tolist(), live["row"].tolist())
+            if key not in self.deleted
+        }
+
+    @property
+    def dim(self) -> Optional[int]:
+        """Embedding dimension, or None while the store is empty"""
+        if self.matrix is not None:
+            return self.matrix.shape[1]
+        if self.pending:
+            return len(next(iter(self.pending.values())))
+        return None
+
+    @property
+    def free_rows(self) -> int:
+        """Number of matrix rows not holding a saved embedding"""
+        return self.free_count + len(self.deleted)
+
+    def __getitem__(self, key: str) -> np.ndarray:
+        if key in self.pending:
+            return self.pending[key]
+        row = self._saved_row(key)
+        if row is None:
+            raise KeyError(key)
+        # A read-only view into the mapped file; nothing is copied
+        return self.matrix[row]
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.pending or self._saved_row(key) is not None
+
+    def __setitem__(self, key: str, value: np.ndarray):
+        vector = np.asarray(value, dtype=np.float32).ravel()
+        if self.dim is not None and len(vector) != self.dim:
+            raise ValueError(
+                f"Embedding for {key} has dimension {len(vector)}, store holds "
+                f"{self.dim}; run with --force-refresh after changing models"
+            )
+        self.pending[key] = vector
+        self.dirty = True
+
+    def __delitem__(self, key: str):
+        if key not in self:
+            raise KeyError(key)
+        self.pending.pop(key, None)
+        if self._saved_row(key) is not None:
+            self.deleted.add(key)
+        self.dirty = True
+
+    def __iter__(self) -> Iterator[str]:
+        saved = set()
+        if self.index is not None:
+            for key in self.index["key"][self.free_count :].tolist():
+                if key not in self.deleted:
+                    saved.add(key)
+                    yield key
+        yield from (key for key in self.pending if key not in saved)
+
+    def __len__(self) -> int:
+        saved = 0 if self.index is None else len(self.index) - self.free_count
+        return (
+            saved
+            - len(self.deleted)
+            + sum(1 for key in self.pending if self._saved_row(key) is None)
+        )
+
+    def row(self, key: str) -> Optional[int]:
+        """
+        Get the matrix row of a saved embedding
+
+        :param key: Embedding key
+        :return: Row index, or None if the key is unsaved or missing
+        """
+        return None if key in self.pending else self._saved_row(key)
+
+    def _write_matrix(self, capacity: int, dim: int, sources: Dict[int, int]):
+        """
+        Write a new matrix file and swap it in atomically
+
+        :param capacity: Rows in the new matrix
+        :param dim: Embedding dimension
+        :param sources: Mapping of new row to old row to copy
+        """
+        tmp_file = self.matrix_file.with_name(self.matrix_file.name + ".tmp")
+        out = np.lib.format.open_memmap(
+            tmp_file, mode="w+", dtype=np.float32, shape=(capacity, dim)
+        )
+        pairs = sorted(sources.items())
+        for start in range(0, len(pairs), self.copy_block):
+            block = pairs[start : start + self.copy_block]
+            out[[new for new, _ in block]] = self.matrix[[old for _, old in block]]
+        out.flush()
+        del out
+        os.replace(tmp_file, self.matrix_file)
+
+    def _write_index(self, rows: Dict[str, int], free: List[int]):
+        """
+        Write the row index atomically
+
+        :param rows: Mapping of key to row
+        :param free: Rows not holding an embedding
+        """
+        width = max((len(key) for key in rows), default=1)
+        index = np.empty(
+            len(free) + len(rows), dtype=[("key", f"U{width}"), ("row", "<i8")]
+        )
+        keys = sorted(rows)
+        index["key"] = [""] * len(free) + keys
+        index["row"] = sorted(free) + [rows[key] for key in keys]
+        tmp_file = self.index_file.with_name(self.index_file.name + ".tmp")
+        with open(tmp_file, "wb") as f:
+            np.save(f, index)
+        os.replace(tmp_file, self.index_file)
+
+    def save(self):
+        """Write pending embeddings, reusing free rows before growing the matrix"""
+        if not self.dirty:
+            return
+
+        rows = {}
+        free = []
+        if self.index is not None:
+            free.extend(self.index["row"][: self.free_count].tolist())
+            live = self.index[self.free_count :]
+            for key, row in zip(live["key"].tolist(), live["row"].tolist()):
+                if key in self.deleted:
+                    free.append(row)
+                else:
+                    rows[key] = row
+        if not rows and not self.pending:
+            self.clear()
+            return
+
+        dim = self.dim
+        capacity = self.matrix.shape[0] if self.matrix is not None else 0
+        new_keys = [key for key in self.pending if key not in rows]
+        # Reuse the lowest free rows first so the tail can be compacted away
+        free.sort(reverse=True)
+        while new_keys and free:
+            rows[new_keys.pop()] = free.pop()
+
+        if new_keys:
+            # Grow geometrically so appends rewrite the file only occasionally
+            new_capacity = max(capacity + len(new_keys), int(capacity * 1.5), 16)
+            sources = {row: row for row in rows.values()}
+            self._write_matrix(new_capacity, dim, sources)
+            for offset, key in enumerate(new_keys):
+                rows[key] = capacity + offset
+            free.extend(range(capacity + len(new_keys), new_capacity))
+
+        out = np.lib.format.open_memmap(self.matrix_file, mode="r+")
+        for key, vector in self.pending.items():
+            out[rows[key]] = vector
+        out.flush()
+        del out
+
+        self._write_index(rows, free)
+        self.pending.clear()
+        self.deleted.clear()
+        self.dirty = False
+        self._open()
+
+    def compact(self):
+        """Rewrite the matrix without free rows"""
+        self.save()
+        if self.matrix is None or not self.free_count:
+            return
+        ordered = sorted(self._saved_rows().items(), key=lambda item: item[1])
+        sources = {new: old for new, (_, old) in enumerate(ordered)}
+        self._write_matrix(len(ordered), self.matrix.shape[1], sources)
+        self._write_index({key: new for new, (key, _) in enumerate(ordered)}, [])
+        self._open()
+        logging.info(f"Compacted embedding store to {len(ordered)} rows")
+
+    def clear(self):
+        """Remove all embeddings and their files"""
+        self.index = None
+        self.free_count = 0
+        self.pending = {}
+        self.deleted = set()
+        self.matrix = None
+        self.dirty = False
+        for path in (self.matrix_file, self.index_file):
+            if path.exists():
+                path.unlink()
+
+    def close(self):
+        """Write pending embeddings and unmap the matrix and the index"""
+        self.save()
+        # Dropping the last references closes the memory maps
+        self.matrix = None
+        self.index = None
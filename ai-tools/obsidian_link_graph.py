@@ -0,0 +1,428 @@
+import os
+import re
+import logging
+from collections import defaultdict
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+from urllib.parse import unquote
+import numpy as np
+
+from obsidian_backlinks import BacklinkIndex
+from obsidian_markdown import MarkdownParser, parse_markdown
+
+URL_SCHEME_PATTERN = re.compile(r"^[a-zA-Z][a-zA-Z0-9+.-]*:")
+
+# Links to these are attachments, not notes, and stay out of the graph
+ATTACHMENT_EXTENSIONS = {
+    ".png",
+    ".jpg",
+    ".jpeg",
+    ".gif",
+    ".svg",
+    ".webp",
+    ".bmp",
+    ".pdf",
+    ".mp3",
+    ".wav",
+    ".ogg",
+    ".m4a",
+    ".mp4",
+    ".webm",
+    ".mov",
+    ".canvas",
+}
+
+
+@lru_cache(maxsize=262144)
+def note_key(path: str) -> str:
+    """
+    Get the name links use to refer to a note
+
+    :param path: Note path or filename
+    :return: Lowercased basename without the .md extension
+    """
+    name = path.replace("\\", "/").rsplit("/", 1)[-1]
+    if name.lower().endswith(".md"):
+        name = name[:-3]
+    return name.lower()
+
+
+@lru_cache(maxsize=65536)
+def link_key(target: str) -> Optional[str]:
+    """
+    Normalize a link target the way Obsidian resolves it
+
+    :param target: Link target without alias
+    :return: Note key, or None for heading-only, attachment and external links
+    """
+    target = target.split("#", 1)[0].strip()
+    if not target or URL_SCHEME_PATTERN.match(target):
+        return None
+    if os.path.splitext(target)[1].lower() in ATTACHMENT_EXTENSIONS:
+        return None
+    return note_key(target)
+
+
+def parse_links(content: str, parser: Optional[MarkdownParser] = None) -> List[str]:
+    """
+    Extract the note keys a note links to, ignoring links inside code
+
+    :param content: Note content
+    :param parser: Shared parser, so a note is only tokenized once per content
+    :return: Distinct note keys in order of first appearance
+    """
+    structure = parser.parse(content) if parser else parse_markdown(content)
+    targets = list(structure.wiki_links)
+    for _, url in structure.markdown_links:
+        url = url.strip()
+        if url.startswith("<") and url.endswith(">"):
+            url = url[1:-1]
+        elif url:
+            # Drop an optional "title"
+            url = url.split()[0]
+        targets.append(unquote(url))
+
+    keys = {}
+    for target in targets:
+        key = link_key(target)
+        if key is not None:
+            keys.setdefault(key, None)
+    return list(keys)
+
+
+class LinkGraph:
+    """Persistent graph of the links between notes, updated incrementally"""
+
+    def __init__(
+        self,
+        vault_path: str,
+        graph_file: Optional[Path] = None,
+        parser: Optional[MarkdownParser] = None,
+    ):
+        """
+        Load the graph
+
+        :param vault_path: Path to the Obsidian vault
+        :param graph_file: .npz file the graph is kept in (None = memory only)
+        :param parser: Markdown parser shared with the other processing stages
+        """
+        self.vault_path = vault_path
+        self.parser = parser or MarkdownParser()
+        self.vault_prefix = os.path.join(vault_path, "")
+        self.graph_file = Path(graph_file) if graph_file else None
+        self.dirty = False
+        self.clear()
+        if self.graph_file is not None and self.graph_file.exists():
+            self._load()
+
+    def clear(self):
+        """Forget every note"""
+        self.stats: Dict[str, Tuple[int, int, int]] = {}
+        self.links: Dict[str, List[str]] = {}
+        self.notes_by_key: Dict[str, Set[str]] = defaultdict(set)
+        self.index = BacklinkIndex()
+        self.dirty = True
+
+    def _load(self):
+        """Read the CSR arrays and rebuild the reverse index in one pass"""
+        try:
+            with np.load(self.graph_file, allow_pickle=False) as data:
+                paths = data["paths"].tolist()
+                stats = data["stats"].tolist()
+                offsets = data["link_offsets"]
+                targets = data["link_targets"]
+                keys = data["keys"].tolist()
+        except Exception as e:
+            logging.warning(f"Error loading link graph: {e}. Rebuilding it.")
+            return
+
+        link_names = np.array(keys, dtype=object)[targets].tolist()
+        bounds = offsets.tolist()
+        for row, path in enumerate(paths):
+            self.stats[path] = tuple(stats[row])
+            self.links[path] = link_names[bounds[row] : bounds[row + 1]]
+            self.notes_by_key[note_key(path)].add(path)
+        self.index.build_from_csr(paths, keys, offsets, targets)
+        self.dirty = False
+
+    def save(self):
+        """Write the graph as CSR arrays, atomically"""
+        if self.graph_file is None or not self.dirty:
+            return
+        paths = list(self.links)
+        keys: Dict[str, int] = {}
+        targets = [
+            keys.setdefault(key, len(keys))
+            for path in paths
+            for key in self.links[path]
+        ]
+        offsets = np.cumsum([0] + [len(self.links[path]) for path in paths])
+
+        tmp_file = self.graph_file.with_name(self.graph_file.name + ".tmp.npz")
+        np.savez(
+            tmp_file,
+            paths=np.array(paths, dtype=str),
+            stats=np.array(
+                [self.stats[path] for path in paths], dtype=np.int64
+            ).reshape(len(paths), 3),
+            link_offsets=offsets.astype(np.int64),
+            link_targets=np.array(targets, dtype=np.int32),
+            keys=np.array(list(keys), dtype=str),
+        )
+        os.replace(tmp_file, self.graph_file)
+        self.dirty = False
+
+    def relative(self, path: str) -> str:
+        """
+        Convert a note path to the vault-relative form used as node id
+
+        :param path: Full or vault-relative path
+        :return: Vault-relative path using "/" separators
+        """
+        if path.startswith(self.vault_prefix):
+            path = path[len(self.vault_prefix) :]
+        elif os.path.isabs(path):
+            path = os.path.relpath(path, self.vault_path)
+        return path.replace(os.sep, "/")
+
+    def find(self, note: str) -> Optional[str]:
+        """
+        Look up a note by path or by the name links use for it
+
+        :param note: Full or vault-relative path, or a link name
+        :return: Vault-relative path, or None if there is no such note
+        """
+        rel_path = self.relative(note)
+        if rel_path in self.links:
+            return rel_path
+        key = link_key(note)
+        return self.resolve(key) if key is not None else None
+
+    def refresh(
+        self,
+        vault_files: Sequence[str],
+        check: Optional[Sequence[str]] = None,
+        contents: Optional[Dict[str, str]] = None,
+        map_paths: Callable = map,
+        stats: Optional[Dict[str, Sequence[int]]] = None,
+    ) -> int:
+        """
+        Bring the graph up to date with the vault
+
+        Only notes whose stat changed are parsed again.
+
+        :param vault_files: Full paths of every note in the vault
+        :param check: Notes that may have changed (defaults to all of them)
+        :param contents: Already read contents of some notes, by full path
+        :param map_paths: map-like function used to read notes in parallel
+        :param stats: (size, mtime_ns, inode) of some notes, by full path, as
+            already taken by the caller; other notes are stat-ed here
+        :return: Number of notes parsed
+        """
+        contents = contents or {}
+        stats = stats or {}
+        live = {self.relative(path): path for path in vault_files}
+        removed = [path for path in self.links if path not in live]
+        for path in removed:
+            self._remove(path)
+
+        candidates = vault_files if check is None else check
+        stale = []
+        for full_path in candidates:
+            rel_path = self.relative(full_path)
+            if rel_path not in live:
+                continue
+            fingerprint = stats.get(full_path)
+            if fingerprint is not None:
+                fingerprint = tuple(fingerprint)
+            else:
+                try:
+                    stat = os.stat(full_path)
+                except OSError:
+                    continue
+                fingerprint = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+            if self.stats.get(rel_path) != fingerprint:
+                stale.append((full_path, rel_path, fingerprint))
+
+        def parse(item):
+            full_path = item[0]
+            content = contents.get(full_path)
+            if content is None:
+                try:
+                    with open(full_path, "r", encoding="utf-8") as f:
+                        content = f.read()
+                except Exception as e:
+                    logging.warning(f"Failed to read {full_path}: {e}")
+                    return None
+            return parse_links(content, self.parser)
+
+        outgoing = {}
+        parsed = map_paths(parse, stale) if stale else []
+        for (_, rel_path, fingerprint), keys in zip(stale, parsed):
+            if keys is None:
+                continue
+            self.stats[rel_path] = fingerprint
+            self.links[rel_path] = keys
+            self.notes_by_key[note_key(rel_path)].add(rel_path)
+            outgoing[rel_path] = keys
+        if outgoing:
+            self.index.update(outgoing)
+        if outgoing or removed:
+            self.dirty = True
+            logging.info(
+                f"Link graph: parsed {len(outgoing)} notes, removed {len(removed)}"
+            )
+        return len(outgoing)
+
+    def _remove(self, rel_path: str):
+        """Drop a note and its outgoing links"""
+        self.stats.pop(rel_path, None)
+        self.links.pop(rel_path, None)
+        notes = self.notes_by_key.get(note_key(rel_path))
+        if notes is not None:
+            notes.discard(rel_path)
+            if not notes:
+                del self.notes_by_key[note_key(rel_path)]
+        self.index.remove([rel_path])
+
+    def resolve(self, key: str) -> Optional[str]:
+        """
+        Find the note a link key points to
+
+        :param key: Note key from link_key
+        :return: Vault-relative path, preferring the shortest, or None if broken
+        """
+        notes = self.notes_by_key.get(key)
+        if not notes:
+            return None
+        return min(notes, key=lambda path: (path.count("/"), path))
+
+    def outgoing(self, note: str) -> List[str]:
+        """
+        Get the notes a note links to
+
+        :param note: Full or vault-relative path
+        :return: Vault-relative paths of the resolved targets
+        """
+        targets = [self.resolve(key) for key in self.links.get(self.relative(note), [])]
+        return [target for target in targets if target is not None]
+
+    def backlinks(self, note: str) -> List[str]:
+        """
+        Get the notes linking to a note
+
+        :param note: Full or vault-relative path
+        :return: Vault-relative paths of the linking notes
+        """
+        rel_path = self.relative(note)
+        key = note_key(rel_path)
+        if self.resolve(key) != rel_path:
+            # Links by this name resolve to another note
+            return []
+        return [
+            source
+            for source, _ in self.index.sources_of(key)
+            if source is not None and source != rel_path
+        ]
+
+    def _edge_flags(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Classify the edges of the reverse index
+
+        :return: Per-edge flags: the target exists, and the edge is not a
+            link from a note to its own name
+        """
+        index = self.index
+        resolved = np.array(
+            [name in self.notes_by_key for name in index.target_names], dtype=bool
+        )
+        own_key = np.array(
+            [
+                index.target_ids.get(note_key(source), -1) if source else -1
+                for source in index.sources
+            ],
+            dtype=np.int64,
+        )
+        return (
+            resolved[index.edge_targets],
+            own_key[index.edge_sources] != index.edge_targets,
+        )
+
+    def orphans(self) -> List[str]:
+        """
+        Find notes without resolved links in either direction
+
+        :return: Vault-relative paths, sorted
+        """
+        index = self.index
+        resolved, foreign = self._edge_flags()
+        linking = resolved & foreign
+        out_degree = np.bincount(
+            index.edge_sources[linking], minlength=len(index.sources)
+        )
+        in_degree = np.bincount(
+            index.edge_targets[linking], minlength=len(index.target_names)
+        )
+
+        orphans = []
+        for path, rows in index.source_rows.items():
+            if any(out_degree[row] for row in rows):
+                continue
+            key_id = index.target_ids.get(note_key(path))
+            if key_id is not None and in_degree[key_id]:
+                if self.resolve(note_key(path)) == path:
+                    continue
+            orphans.append(path)
+        return sorted(orphans)
+
+    def broken_links(self) -> Dict[str, List[str]]:
+        """
+        Find links to notes that do not exist
+
+        :return: Mapping of vault-relative path to its unresolved link keys
+        """
+        index = self.index
+        resolved, _ = self._edge_flags()
+        missing = np.flatnonzero(~resolved)
+        edges = sorted(
+            (
+                index.sources[row],
+                position,
+                index.target_names[target],
+            )
+            for row, position, target in zip(
+                index.edge_sources[missing].tolist(),
+                index.edge_positions[missing].tolist(),
+                index.edge_targets[missing].tolist(),
+            )
+        )
+        broken = defaultdict(list)
+        for path, _, key in edges:
+            broken[path].append(key)
+        return dict(broken)
+
+    def neighborhood(self, note: str, hops: int = 1) -> Dict[str, int]:
+        """
+        Find the notes within a number of links of a note, in either direction
+
+        :param note: Full or vault-relative path
+        :param hops: Maximum number of links followed
+        :return: Mapping of vault-relative path to its distance, nearest first
+        """
+        start = self.relative(note)
+        distances = {start: 0}
+        frontier = [start]
+        for distance in range(1, hops + 1):
+            next_frontier = []
+            for path in frontier:
+                for neighbor in self.outgoing(path) + self.backlinks(path):
+                    if neighbor not in distances:
+                        distances[neighbor] = distance
+                        next_frontier.append(neighbor)
+            frontier = next_frontier
+        del distances[start]
+        return dict(sorted(distances.items(), key=lambda item: (item[1], item[0])))
+
+    def __len__(self) -> int:
+        return len(self.links)
@@ -0,0 +1,698 @@
+import json
+import time
+import hashlib
+import sqlite3
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+import requests
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
+
+# Status codes worth retrying: rate limited and overloaded
+RETRYABLE_STATUS_CODES = {429, 529}
+
+# Response budget for single prompts
+DEFAULT_MAX_TOKENS = 1000
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at a fixed rate"""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        """
+        Initialize a full bucket
+
+        :param capacity: Maximum number of tokens held
+        :param refill_per_second: Tokens added per second
+        """
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.refill_per_second
+        )
+        self.updated = now
+
+    def acquire(self, amount: float = 1.0):
+        """
+        Block until the given number of tokens is available, then take them
+
+        Requests larger than the capacity wait for a full bucket.
+
+        :param amount: Number of tokens to take
+        """
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.refill_per_second
+            time.sleep(wait)
+
+    def consume(self, amount: float):
+        """
+        Take tokens without waiting, allowing the balance to go negative
+
+        :param amount: Number of tokens to take
+        """
+        with self.lock:
+            self._refill()
+            self.tokens -= amount
+
+
+class ConnectionStatsAdapter(HTTPAdapter):
+    """HTTP adapter that records how many requests each pooled connection served"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats_lock = threading.Lock()
+        self.connection_stats: Dict[int, Dict[str, object]] = {}
+
+    def build_response(self, req, resp):
+        connection = getattr(resp, "connection", None)
+        if connection is not None:
+            sock = getattr(connection, "sock", None)
+            local = sock.getsockname() if sock else None
+            now = time.time()
+            with self.stats_lock:
+                stats = self.connection_stats.setdefault(
+                    id(connection),
+                    {
+                        "host": connection.host,
+                        "local_address": f"{local[0]}:{local[1]}" if local else "",
+                        "requests": 0,
+                        "opened_at": now,
+                    },
+                )
+                stats["requests"] += 1
+                stats["last_used_at"] = now
+        return super().build_response(req, resp)
+
+
+class LLMResponseCache:
+    """Disk-backed, content-addressed cache of LLM responses with an LRU size cap"""
+
+    def __init__(self, path: Path, max_bytes: int = 100 * 1024 * 1024):
+        """
+        Open (or create) the response cache
+
+        :param path: SQLite database file
+        :param max_bytes: Total response size kept before evicting least recently
+            used entries (0 disables the cap)
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self.connection = sqlite3.connect(
+            str(self.path), check_same_thread=False, isolation_level=None
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+            "size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)"
+        )
+        self.total_bytes = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+    @staticmethod
+    def make_key(model: str, prompt: str, max_tokens: int) -> str:
+        """
+        Build the cache key for a request
+
+        :param model: Model name
+        :param prompt: Prompt text
+        :param max_tokens: Maximum tokens in the response
+        :return: Hex digest identifying the request
+        """
+        payload = json.dumps([model, prompt, max_tokens], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, model: str, prompt: str, max_tokens: int) -> Optional[str]:
+        """
+        Look up a cached response and mark it as recently used
+
+        :param model: Model name
+        :param prompt: Prompt text
+        :param max_tokens: Maximum tokens in the response
+        :return: Cached response or None
+        """
+        key = self.make_key(model, prompt, max_tokens)
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT response FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.connection.execute(
+                "UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+            return row[0]
+
+    def contains(self, model: str, prompt: str, max_tokens: int) -> bool:
+        """
+        Check for a cached response without touching counters or recency
+
+        :param model: Model name
+        :param prompt: Prompt text
+        :param max_tokens: Maximum tokens in the response
+        :return: True if a response is cached
+        """
+        key = self.make_key(model, prompt, max_tokens)
+        with self.lock:
+            return (
+                self.connection.execute(
+                    "SELECT 1 FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                is not None
+            )
+
+    def put(self, model: str, prompt: str, max_tokens: int, response: str):
+        """
+        Store a response, evicting least recently used entries over the size cap
+
+        :param model: Model name
+        :param prompt: Prompt text
+        :param max_tokens: Maximum tokens in the response
+        :param response: Response text
+        """
+        key = self.make_key(model, prompt, max_tokens)
+        size = len(response.encode("utf-8"))
+        with self.lock:
+            previous = self.connection.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, response, size, time.time()),
+            )
+            self.total_bytes += size - (previous[0] if previous else 0)
+            if self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits its budget"""
+        while self.total_bytes > self.max_bytes:
+            rows = self.connection.execute(
+                "SELECT key, size FROM responses ORDER BY last_used LIMIT 100"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if self.total_bytes <= self.max_bytes:
+                    break
+                self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.total_bytes -= size
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Report cache usage
+
+        :return: Hit and miss counters plus stored entries and bytes
+        """
+        with self.lock:
+            entries = self.connection.execute(
+                "SELECT COUNT(*) FROM responses"
+            ).fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": entries,
+            "bytes": self.total_bytes,
+        }
+
+    def close(self):
+        """Close the database"""
+        self.connection.close()
+
+
+class ClaudeClient:
+    """Claude Messages API client with bounded concurrency, rate limits and retries"""
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        api_base_url: str = "https://api.anthropic.com",
+        max_in_flight: int = 4,
+        requests_per_minute: float = 50,
+        tokens_per_minute: float = 40000,
+        max_retries: int = 5,
+        timeout: float = 30,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        pool_size: Optional[int] = None,
+        response_cache: Optional[LLMResponseCache] = None,
+    ):
+        """
+        Initialize the client
+
+        :param api_key: Anthropic API key
+        :param model: Model name
+        :param api_base_url: Base URL of the API (point at a local server for testing)
+        :param max_in_flight: Maximum number of concurrent requests
+        :param requests_per_minute: Request rate limit (0 disables it)
+        :param tokens_per_minute: Estimated token rate limit (0 disables it)
+        :param max_retries: Retries on 429, 529 and timeouts
+        :param timeout: Per-request timeout in seconds
+        :param backoff_base: First retry delay in seconds, doubled per attempt
+        :param backoff_max: Maximum retry delay in seconds
+        :param pool_size: Keep-alive connections kept open (defaults to max_in_flight)
+        :param response_cache: Optional persistent cache shared by all calls
+        """
+        self.logger = logging.getLogger("ObsidianTagger")
+        self.api_key = api_key
+        self.model = model
+        self.api_base_url = api_base_url.rstrip("/")
+        self.messages_url = f"{self.api_base_url}/v1/messages"
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.response_cache = response_cache
+
+        self.in_flight = threading.BoundedSemaphore(self.max_in_flight)
+
+        # One long-lived session so every call reuses pooled keep-alive connections
+        self.adapter = ConnectionStatsAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size or self.max_in_flight,
+            pool_block=True,
+        )
+        self.session = requests.Session()
+        self.session.headers.update(self._headers())
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+
+        self.request_bucket = (
+            TokenBucket(requests_per_minute, requests_per_minute / 60)
+            if requests_per_minute
+            else None
+        )
+        self.token_bucket = (
+            TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+            if tokens_per_minute
+            else None
+        )
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """
+        Roughly estimate the number of tokens in a text
+
+        :param text: Text to measure
+        :return: Estimated token count
+        """
+        return len(text) // 4 + 1
+
+    def _headers(self) -> dict:
+        return {
+            "Content-Type": "application/json",
+            "X-API-Key": self.api_key,
+            "Anthropic-Version": "2023-06-01",
+        }
+
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Exponential backoff with full jitter, honouring Retry-After"""
+        delay = min(self.backoff_max, self.backoff_base * (2**attempt))
+        delay = random.uniform(0, delay)
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        return delay
+
+    def _post(self, payload: dict, estimated_tokens: int) -> requests.Response:
+        """
+        Send one request, waiting for rate-limit capacity and retrying on
+        transient failures
+
+        :param payload: JSON payload
+        :param estimated_tokens: Estimated prompt tokens for the token bucket
+        :return: Final response (may be an error response)
+        """
+        attempt = 0
+        while True:
+            if self.request_bucket:
+                self.request_bucket.acquire()
+            if self.token_bucket:
+                self.token_bucket.acquire(estimated_tokens)
+
+            try:
+                with self.in_flight:
+                    response = self.session.post(
+                        self.messages_url,
+                        data=json.dumps(payload),
+                        timeout=self.timeout,
+                    )
+            except (requests.Timeout, requests.ConnectionError) as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                self.logger.debug(f"Request failed ({e}), retrying in {delay:.1f}s")
+            else:
+                if (
+                    response.status_code not in RETRYABLE_STATUS_CODES
+                    or attempt >= self.max_retries
+                ):
+                    return response
+                delay = self._backoff(attempt, response.headers.get("retry-after"))
+                self.logger.debug(
+                    f"API returned {response.status_code}, retrying in {delay:.1f}s"
+                )
+
+            attempt += 1
+            time.sleep(delay)
+
+    def complete(self, prompt: str, max_tokens: int = DEFAULT_MAX_TOKENS) -> str:
+        """
+        Call Claude with a single prompt
+
+        :param prompt: Prompt to send to Claude
+        :param max_tokens: Maximum tokens in the response
+        :return: API response text, or a placeholder on failure
+        """
+        if self.response_cache:
+            cached_response = self.response_cache.get(self.model, prompt, max_tokens)
+            if cached_response is not None:
+                return cached_response
+
+        if not self.api_key:
+            self.logger.warning("No API key provided, using placeholder text")
+            return f"Related content for {prompt[:20]}..."
+
+        try:
+            payload = {
+                "model": self.model,
+                "max_tokens": max_tokens,
+                "messages": [{"role": "user", "content": prompt}],
+            }
+            estimated_tokens = self.estimate_tokens(prompt)
+
+            self.logger.debug(f"Calling Claude API with model: {self.model}")
+            response = self._post(payload, estimated_tokens)
+
+            if response.status_code != 200:
+                self.logger.error(
+                    f"API call failed: {response.status_code} - {response.text}"
+                )
+                return f"Related content (API error)"
+
+            body = response.json()
+            # Charge the token bucket for anything the estimate missed
+            usage = body.get("usage", {})
+            actual_tokens = usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+            if self.token_bucket and actual_tokens > estimated_tokens:
+                self.token_bucket.consume(actual_tokens - estimated_tokens)
+
+            text = body["content"][0]["text"]
+            if self.response_cache:
+                self.response_cache.put(self.model, prompt, max_tokens, text)
+            return text
+
+        except Exception as e:
+            self.logger.error(f"Error calling Claude API: {e}")
+            return f"Related content (error: {str(e)[:50]})"
+
+    def complete_many(
+        self,
+        prompts: Sequence[str],
+        max_tokens: Union[int, Sequence[int]] = DEFAULT_MAX_TOKENS,
+        desc: str = "Calling Claude",
+    ) -> List[str]:
+        """
+        Call Claude with many prompts concurrently
+
+        :param prompts: Prompts to send
+        :param max_tokens: Maximum tokens in each response, or one value per prompt
+        :param desc: Progress bar description
+        :return: Responses in prompt order
+        """
+        results = [""] * len(prompts)
+        if not prompts:
+            return results
+        if isinstance(max_tokens, int):
+            max_tokens = [max_tokens] * len(prompts)
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            futures = {
+                executor.submit(self.complete, prompt, limit): i
+                for i, (prompt, limit) in enumerate(zip(prompts, max_tokens))
+            }
+            for future in tqdm(as_completed(futures), total=len(futures), desc=desc):
+                results[futures[future]] = future.result()
+        return results
+
+    def connection_stats(self) -> List[Dict[str, object]]:
+        """
+        Report per-connection usage of the pooled session
+
+        :return: One entry per connection opened, busiest first
+        """
+        with self.adapter.stats_lock:
+            stats = [dict(entry) for entry in self.adapter.connection_stats.values()]
+        return sorted(stats, key=lambda entry: entry["requests"], reverse=True)
+
+    def log_connection_stats(self):
+        """Log how well connections and cached responses were reused"""
+        if self.response_cache:
+            cache_stats = self.response_cache.stats()
+            self.logger.info(
+                f"LLM response cache: {cache_stats['hits']} hits, "
+                f"{cache_stats['misses']} misses, {cache_stats['entries']} entries "
+                f"({cache_stats['bytes']} bytes)"
+            )
+
+        stats = self.connection_stats()
+        if not stats:
+            return
+        total = sum(entry["requests"] for entry in stats)
+        self.logger.info(
+            f"Claude API: {total} requests over {len(stats)} pooled connections"
+        )
+        for entry in stats:
+            self.logger.debug(
+                f"  {entry['local_address']} -> {entry['host']}: "
+                f"{entry['requests']} requests"
+            )
+
+    def close(self):
+        """Close pooled connections and the response cache"""
+        self.session.close()
+        if self.response_cache:
+            self.response_cache.close()
+
+
+class MessageBatchRunner:
+    """Answers prompts through the Message Batches API into the response cache"""
+
+    def __init__(
+        self,
+        client: ClaudeClient,
+        state_file: Path,
+        poll_interval: float = 30,
+        poll_timeout: float = 3600,
+    ):
+        """
+        Initialize the batch runner
+
+        :param client: Client whose session, model and response cache are used
+        :param state_file: JSON file recording the pending batch between runs
+        :param poll_interval: Seconds between status checks
+        :param poll_timeout: Seconds to wait for completion before leaving the
+            batch pending for the next run (0 checks once)
+        """
+        self.logger = logging.getLogger("ObsidianTagger")
+        self.client = client
+        self.state_file = Path(state_file)
+        self.poll_interval = poll_interval
+        self.poll_timeout = poll_timeout
+        self.batches_url = f"{client.api_base_url}/v1/messages/batches"
+
+    def _load_state(self) -> Optional[dict]:
+        if not self.state_file.exists():
+            return None
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            self.logger.warning(f"Ignoring unreadable batch state: {e}")
+            return None
+
+    def _save_state(self, state: dict):
+        with open(self.state_file, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+
+    def _submit(self, requests_to_send: Sequence[Tuple[str, int]]) -> dict:
+        """
+        Create a batch job and persist its pending items
+
+        :param requests_to_send: List of (prompt, max_tokens)
+        :return: Saved batch state
+        """
+        items = {}
+        batch_requests = []
+        for prompt, max_tokens in requests_to_send:
+            custom_id = LLMResponseCache.make_key(self.client.model, prompt, max_tokens)
+            if custom_id in items:
+                continue
+            items[custom_id] = {"prompt": prompt, "max_tokens": max_tokens}
+            batch_requests.append(
+                {
+                    "custom_id": custom_id,
+                    "params": {
+                        "model": self.client.model,
+                        "max_tokens": max_tokens,
+                        "messages": [{"role": "user", "content": prompt}],
+                    },
+                }
+            )
+
+        response = self.client.session.post(
+            self.batches_url,
+            data=json.dumps({"requests": batch_requests}),
+            timeout=self.client.timeout,
+        )
+        response.raise_for_status()
+
+        state = {
+            "batch_id": response.json()["id"],
+            "model": self.client.model,
+            "submitted_at": time.time(),
+            "items": items,
+        }
+        self._save_state(state)
+        self.logger.info(
+            f"Submitted batch {state['batch_id']} with {len(items)} requests"
+        )
+        return state
+
+    def _wait(self, state: dict) -> Optional[dict]:
+        """
+        Poll the batch until it ends or the timeout expires
+
+        :param state: Batch state
+        :return: Final batch object, or None if still processing
+        """
+        deadline = time.monotonic() + self.poll_timeout
+        while True:
+            response = self.client.session.get(
+                f"{self.batches_url}/{state['batch_id']}", timeout=self.client.timeout
+            )
+            if response.status_code == 404:
+                raise LookupError(f"Batch {state['batch_id']} no longer exists")
+            response.raise_for_status()
+            batch = response.json()
+            if batch.get("processing_status") == "ended":
+                return batch
+            if time.monotonic() + self.poll_interval > deadline:
+                return None
+            self.logger.debug(f"Batch {state['batch_id']} still processing")
+            time.sleep(self.poll_interval)
+
+    def _collect(self, state: dict, batch: dict):
+        """
+        Download batch results into the response cache
+
+        :param state: Batch state
+        :param batch: Final batch object
+        """
+        response = self.client.session.get(
+            batch["results_url"], timeout=self.client.timeout
+        )
+        response.raise_for_status()
+
+        succeeded = failed = 0
+        for line in response.text.splitlines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            item = state["items"].get(result.get("custom_id"))
+            outcome = result.get("result", {})
+            if item is None or outcome.get("type") != "succeeded":
+                failed += 1
+                continue
+            self.client.response_cache.put(
+                state["model"],
+                item["prompt"],
+                item["max_tokens"],
+                outcome["message"]["content"][0]["text"],
+            )
+            succeeded += 1
+
+        self.logger.info(
+            f"Batch {state['batch_id']} finished: "
+            f"{succeeded} succeeded, {failed} failed"
+        )
+
+    def run(self, requests_to_send: Sequence[Tuple[str, int]]) -> bool:
+        """
+        Make sure every request has a cached response, resuming a pending batch
+        from a previous run if there is one
+
+        Requests that fail in the batch are left to regular calls.
+
+        :param requests_to_send: List of (prompt, max_tokens)
+        :return: False if a batch is still processing and the run should stop
+        """
+        if not self.client.response_cache:
+            self.logger.warning("Batch mode needs the response cache; calling directly")
+            return True
+
+        try:
+            state = self._load_state()
+            if state is None:
+                missing = [
+                    (prompt, max_tokens)
+                    for prompt, max_tokens in requests_to_send
+                    if not self.client.response_cache.contains(
+                        self.client.model, prompt, max_tokens
+                    )
+                ]
+                if not missing or not self.client.api_key:
+                    return True
+                state = self._submit(missing)
+            else:
+                self.logger.info(f"Resuming batch {state['batch_id']}")
+
+            batch = self._wait(state)
+            if batch is None:
+                self.logger.info(
+                    f"Batch {state['batch_id']} is still processing; "
+                    "run again to resume"
+                )
+                return False
+
+            self._collect(state, batch)
+            self.state_file.unlink()
+            return True
+        except LookupError as e:
+            self.logger.warning(f"{e}; discarding pending batch state")
+            self.state_file.unlink()
+            return True
+        except Exception as e:
+            self.logger.error(f"Batch processing failed, calling directly: {e}")
+            return True
@@ -0,0 +1,241 @@
+import re
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+import yaml
+
+from obsidian_cache import ObsidianCache
+
+# The libyaml loader is an order of magnitude faster when PyYAML was built with it
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+FRONTMATTER_PATTERN = re.compile(r"---\s*\n(.*?)\n---", re.DOTALL)
+
+# Generated sections live between these markers and are replaced in place
+MANAGED_BEGIN = "<!-- ai-tagger:begin -->"
+MANAGED_END = "<!-- ai-tagger:end -->"
+MANAGED_PATTERN = re.compile(
+    r"^<!-- ai-tagger:begin -->\n.*?(?:^<!-- ai-tagger:end -->[ \t]*\n?|\Z)",
+    re.MULTILINE | re.DOTALL,
+)
+
+# Link sections appended by versions without markers, only ever at the end
+LEGACY_SECTIONS_PATTERN = re.compile(
+    r"(?:\n*^\#\# (?:Suggested Related Documents|Backlinks)\n"
+    r"(?:(?:- )?\[\[[^\]\n]*\]\][ \t]*(?:\n|\Z))*)+\s*\Z",
+    re.MULTILINE,
+)
+
+# A top-level "tags:" or "tag:" key with its indented or dash-list value lines
+FRONTMATTER_TAGS_PATTERN = re.compile(
+    r"^(?P<key>tags?)[ \t]*:[^\n]*(?:\n(?:[ \t]*\n)*(?:[ \t]+\S|-)[^\n]*)*",
+    re.MULTILINE,
+)
+
+# One alternation scanned left to right; the managed section and fenced and
+# inline code are consumed whole, so nothing inside them is reported. A
+# heading only consumes its "#" markers, so tags and links in its title are
+# still found. The unnamed last branch skips plain text up to the next
+# character that can start a token, which keeps the scanner from retrying
+# every branch at every offset.
+TOKEN_PATTERN = re.compile(
+    r"""
+    (?P<managed>^<!--\ ai-tagger:begin\ -->\n
+        .*?(?:^<!--\ ai-tagger:end\ -->|\Z))
+    |(?P<fence>^[ \t]*(?P<fence_mark>`{3,}|~{3,})[^\n]*\n
+        .*?(?:^[ \t]*(?P=fence_mark)[ \t]*$|\Z))
+    |(?P<code>`[^`\n]+`)
+    |(?P<heading>^\#{1,6}[ \t]+)
+    |(?P<wiki>!?\[\[(?P<wiki_target>[^\]|\n]+)(?:\|[^\]\n]*)?\]\])
+    |(?P<markdown>!?\[(?P<link_text>[^\]\n]*)\]\((?P<link_url>[^)\n]+)\))
+    |(?P<tag>(?<!\S)\#(?P<tag_name>[a-zA-Z0-9_/-]+))
+    |[^`~\#!\[\n]+
+    """,
+    re.MULTILINE | re.DOTALL | re.VERBOSE,
+)
+
+
+class MarkdownStructure(NamedTuple):
+    """Everything the processing stages need to know about a note's Markdown"""
+
+    frontmatter: Optional[Dict[str, Any]]  # Parsed YAML; None without frontmatter
+    frontmatter_text: Optional[str]  # Raw YAML between the --- lines
+    body_start: int  # Offset just after the closing ---, 0 without frontmatter
+    tags: List[str]  # Frontmatter tags, then inline tags, without "#"
+    wiki_links: List[str]  # [[target]] targets without alias
+    markdown_links: List[Tuple[str, str]]  # [text](url) as (text, url)
+
+
+def _frontmatter_tags(frontmatter: Dict[str, Any]) -> List[str]:
+    """
+    Read the tags of parsed frontmatter
+
+    :param frontmatter: Parsed YAML mapping
+    :return: Tags from the "tags" and "tag" keys
+    """
+    tags = []
+    for key in ("tags", "tag"):
+        value = frontmatter.get(key)
+        if value is None:
+            continue
+        if isinstance(value, str):
+            # Obsidian accepts "tags: a, b" and "tags: a b"
+            value = re.split(r"[,\s]+", value)
+        elif not isinstance(value, list):
+            value = [value]
+        for tag in value:
+            tag = str(tag).strip().lstrip("#") if tag is not None else ""
+            if tag:
+                tags.append(tag)
+    return tags
+
+
+def parse_markdown(content: str) -> MarkdownStructure:
+    """
+    Tokenize a note in a single pass
+
+    :param content: Note content
+    :return: Structure of the note
+    """
+    frontmatter = frontmatter_text = None
+    body_start = 0
+    tags = {}
+
+    match = FRONTMATTER_PATTERN.match(content)
+    if match:
+        frontmatter_text = match.group(1)
+        body_start = match.end()
+        try:
+            frontmatter = yaml.load(frontmatter_text, Loader=YAML_LOADER) or {}
+        except yaml.YAMLError as e:
+            logging.debug(f"Invalid frontmatter: {e}")
+            frontmatter = {}
+        if not isinstance(frontmatter, dict):
+            frontmatter = {}
+        tags.update(dict.fromkeys(_frontmatter_tags(frontmatter)))
+
+    wiki_links = []
+    markdown_links = []
+    for token in TOKEN_PATTERN.finditer(content, body_start):
+        kind = token.lastgroup
+        if kind is None:
+            continue
+        if kind == "tag":
+            tags.setdefault(token.group("tag_name"))
+        elif kind == "wiki":
+            wiki_links.append(token.group("wiki_target"))
+        elif kind == "markdown":
+            markdown_links.append((token.group("link_text"), token.group("link_url")))
+
+    return MarkdownStructure(
+        frontmatter=frontmatter,
+        frontmatter_text=frontmatter_text,
+        body_start=body_start,
+        tags=list(tags),
+        wiki_links=wiki_links,
+        markdown_links=markdown_links,
+    )
+
+
+def add_frontmatter_tags(
+    frontmatter_text: str, frontmatter: Dict[str, Any], new_tags: List[str]
+) -> str:
+    """
+    Add tags to the frontmatter as a YAML list, leaving every other key as written
+
+    The "tags" (or "tag") key is rewritten as a block list holding its
+    current tags followed by the new ones; a second tag key is merged into it.
+
+    :param frontmatter_text: Raw YAML between the --- lines
+    :param frontmatter: Parsed frontmatter
+    :param new_tags: Tags to add, without "#"
+    :return: New frontmatter text
+    """
+    tags = list(dict.fromkeys(_frontmatter_tags(frontmatter) + new_tags))
+    matches = list(FRONTMATTER_TAGS_PATTERN.finditer(frontmatter_text))
+    key = matches[0].group("key") if matches else "tags"
+    items = yaml.safe_dump(
+        tags, allow_unicode=True, default_flow_style=False, width=float("inf")
+    )
+    block = f"{key}:\n" + "".join(
+        f"  {line}" for line in items.rstrip("\n").splitlines(keepends=True)
+    )
+    if not matches:
+        if not frontmatter_text.strip():
+            return block
+        return f"{frontmatter_text.rstrip()}\n{block}"
+
+    # Replace the first tag key in place and drop any other with its line break
+    parts = [frontmatter_text[: matches[0].start()], block]
+    position = matches[0].end()
+    for match in matches[1:]:
+        parts.append(frontmatter_text[position : match.start() - 1])
+        position = match.end()
+    parts.append(frontmatter_text[position:])
+    return "".join(parts)
+
+
+def strip_managed_section(content: str) -> str:
+    """
+    Remove the generated section, and link sections left by older versions
+
+    :param content: Note content
+    :return: Content as written by the user
+    """
+    content = MANAGED_PATTERN.sub("", content)
+    return LEGACY_SECTIONS_PATTERN.sub("", content)
+
+
+def replace_managed_section(content: str, section: str) -> str:
+    """
+    Put a generated section at the end of a note, replacing the previous one
+
+    Rendering the same section again returns the content unchanged.
+
+    :param content: Note content
+    :param section: Section body; empty removes the section
+    :return: New note content
+    """
+    body = strip_managed_section(content)
+    if not section.strip():
+        return content if body == content else body.rstrip("\n") + "\n"
+    return f"{body.rstrip()}\n\n{MANAGED_BEGIN}\n{section.strip()}\n{MANAGED_END}\n"
+
+
+class MarkdownParser:
+    """Parses notes once per content hash and shares the result between stages"""
+
+    def __init__(self, max_entries: int = 4096):
+        """
+        Initialize the parser
+
+        :param max_entries: Structures kept, least recently used dropped first
+        """
+        self.max_entries = max(1, max_entries)
+        self.entries: "OrderedDict[str, MarkdownStructure]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def parse(
+        self, content: str, content_hash: Optional[str] = None
+    ) -> MarkdownStructure:
+        """
+        Get the structure of a note, parsing it only on first use
+
+        :param content: Note content
+        :param content_hash: Optional precomputed content hash
+        :return: Structure of the note
+        """
+        content_hash = content_hash or ObsidianCache.get_content_hash(content)
+        with self.lock:
+            structure = self.entries.get(content_hash)
+            if structure is not None:
+                self.entries.move_to_end(content_hash)
+                return structure
+
+        structure = parse_markdown(content)
+        with self.lock:
+            self.entries[content_hash] = structure
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return structure
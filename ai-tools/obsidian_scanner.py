@@ -0,0 +1,212 @@
+import os
+import re
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence, TypeVar
+from tqdm import tqdm
+
+T = TypeVar("T")
+
+# Directories that never contain notes worth processing
+DEFAULT_EXCLUDES = [".obsidian/", ".git/", ".trash/"]
+DEFAULT_INCLUDES = ["*.md"]
+
+
+class IgnorePattern:
+    """A single .gitignore-style glob matched against vault-relative paths"""
+
+    def __init__(self, pattern: str):
+        """
+        Compile a pattern
+
+        Supports "*", "?", "[...]", "**", a trailing "/" for directories only,
+        a leading "!" to re-include, and a "/" anywhere but the end to anchor
+        the pattern at the vault root.
+
+        :param pattern: Glob pattern
+        """
+        self.pattern = pattern
+        self.negated = pattern.startswith("!")
+        pattern = pattern[1:] if self.negated else pattern
+        self.dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        anchored = "/" in pattern
+        pattern = pattern.lstrip("/")
+
+        regex = "" if anchored else "(?:.*/)?"
+        i = 0
+        while i < len(pattern):
+            if pattern.startswith("**/", i):
+                regex += "(?:.*/)?"
+                i += 3
+            elif pattern.startswith("**", i):
+                regex += ".*"
+                i += 2
+            elif pattern[i] == "*":
+                regex += "[^/]*"
+                i += 1
+            elif pattern[i] == "?":
+                regex += "[^/]"
+                i += 1
+            elif pattern[i] == "[" and "]" in pattern[i + 1 :]:
+                end = pattern.index("]", i + 1)
+                body = pattern[i + 1 : end]
+                # Only a leading "!" negates the class; elsewhere it is literal
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                regex += "[" + body + "]"
+                i = end + 1
+            else:
+                regex += re.escape(pattern[i])
+                i += 1
+        self.regex = re.compile(regex + "$")
+
+    def matches(self, rel_path: str, is_dir: bool) -> bool:
+        """
+        Check whether the pattern matches a path
+
+        :param rel_path: Vault-relative path using "/" separators
+        :param is_dir: Whether the path is a directory
+        :return: True on a match
+        """
+        if self.dir_only and not is_dir:
+            return False
+        return self.regex.match(rel_path) is not None
+
+
+class VaultScanner:
+    """Discovers vault files with os.scandir and processes them in a thread pool"""
+
+    def __init__(
+        self,
+        vault_path: str,
+        include: Optional[Sequence[str]] = None,
+        exclude: Optional[Sequence[str]] = None,
+        max_workers: int = 8,
+    ):
+        """
+        Initialize the scanner
+
+        :param vault_path: Path to the Obsidian vault
+        :param include: File globs to process (defaults to Markdown files)
+        :param exclude: Ignore globs, added after the built-in excludes
+        :param max_workers: Threads used to read and hash files
+        """
+        self.vault_path = vault_path
+        self.include = [IgnorePattern(p) for p in (include or DEFAULT_INCLUDES)]
+        self.exclude = [
+            IgnorePattern(p) for p in DEFAULT_EXCLUDES + list(exclude or [])
+        ]
+        self.max_workers = max(1, max_workers)
+
+    def is_excluded(self, rel_path: str, is_dir: bool) -> bool:
+        """
+        Apply the ignore rules in order; the last matching rule wins
+
+        :param rel_path: Vault-relative path using "/" separators
+        :param is_dir: Whether the path is a directory
+        :return: True if the path is ignored
+        """
+        excluded = False
+        for pattern in self.exclude:
+            if pattern.matches(rel_path, is_dir):
+                excluded = not pattern.negated
+        return excluded
+
+    def is_included(self, rel_path: str) -> bool:
+        """
+        Check a file against the include globs
+
+        :param rel_path: Vault-relative path using "/" separators
+        :return: True if the file should be processed
+        """
+        return any(pattern.matches(rel_path, False) for pattern in self.include)
+
+    def relative(self, path: str) -> str:
+        """
+        Convert a path to the vault-relative form the patterns match against
+
+        :param path: Full path
+        :return: Relative path using "/" separators
+        """
+        return os.path.relpath(path, self.vault_path).replace(os.sep, "/")
+
+    def accepts(self, path: str, is_dir: bool = False) -> bool:
+        """
+        Check a single path against the rules discover() applies while walking
+
+        :param path: Full path
+        :param is_dir: Whether the path is a directory
+        :return: True if discover() would visit (directory) or return (file) it
+        """
+        parts = self.relative(path).split("/")
+        for depth in range(1, len(parts)):
+            if self.is_excluded("/".join(parts[:depth]), True):
+                return False
+        rel_path = "/".join(parts)
+        if self.is_excluded(rel_path, is_dir):
+            return False
+        return is_dir or self.is_included(rel_path)
+
+    def sort_key(self, path: str) -> List[tuple]:
+        """
+        Sort key reproducing discover() order: files of a directory come
+        before its subdirectories, each in name order
+
+        :param path: Full path
+        :return: Sort key
+        """
+        parts = self.relative(path).split("/")
+        return [(1, part) for part in parts[:-1]] + [(0, parts[-1])]
+
+    def discover(self) -> List[str]:
+        """
+        Walk the vault, pruning ignored directories before descending
+
+        :return: Full paths of matching files
+        """
+        paths = []
+        pending = [(self.vault_path, "")]
+        while pending:
+            directory, rel_directory = pending.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    entries = sorted(entries, key=lambda entry: entry.name)
+            except OSError as e:
+                logging.warning(f"Failed to scan {directory}: {e}")
+                continue
+
+            subdirectories = []
+            for entry in entries:
+                rel_path = f"{rel_directory}{entry.name}"
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    continue
+                if self.is_excluded(rel_path, is_dir):
+                    continue
+                if is_dir:
+                    subdirectories.append((entry.path, f"{rel_path}/"))
+                elif self.is_included(rel_path):
+                    paths.append(entry.path)
+
+            # Reversed so directories are visited in name order
+            pending.extend(reversed(subdirectories))
+        return paths
+
+    def map(
+        self,
+        func: Callable[[str], T],
+        paths: Sequence[str],
+        desc: str = "Reading Files",
+    ) -> List[T]:
+        """
+        Apply a function to every path in the thread pool
+
+        :param func: Function taking a full path
+        :param paths: Paths to process
+        :param desc: Progress bar description
+        :return: Results in path order
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(tqdm(executor.map(func, paths), total=len(paths), desc=desc))
@@ -0,0 +1,158 @@
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+# Bumped whenever readers of the database need to change
+SCHEMA_VERSION = 1
+
+
+class SidecarStore:
+    """Generated tags, links and backlinks of every note, kept outside the notes"""
+
+    def __init__(self, path: Path):
+        """
+        Open (or create) the sidecar database
+
+        Each note is one row keyed by its vault-relative path with "/"
+        separators. The tags, suggested_links and backlinks columns hold JSON
+        arrays, so other tools (such as an Obsidian plugin) can read them
+        while the processor runs.
+
+        :param path: SQLite database file
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(
+            str(self.path), check_same_thread=False, isolation_level=None
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS notes ("
+            "path TEXT PRIMARY KEY, tags TEXT NOT NULL, "
+            "suggested_links TEXT NOT NULL, backlinks TEXT NOT NULL, "
+            "updated REAL NOT NULL)"
+        )
+        self.connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    @staticmethod
+    def _key(rel_path: str) -> str:
+        """Use the same separators on every platform"""
+        return rel_path.replace("\\", "/")
+
+    def update(self, entries: Dict[str, Dict[str, List[Any]]]) -> int:
+        """
+        Insert or replace the entries of some notes in one transaction
+
+        Rows whose content is unchanged are not rewritten.
+
+        :param entries: Mapping of vault-relative path to a dictionary with
+            "tags", "suggested_links" and "backlinks" lists
+        :return: Number of rows inserted or changed
+        """
+        now = time.time()
+        rows = [
+            (
+                self._key(rel_path),
+                json.dumps(entry.get("tags", []), ensure_ascii=False),
+                json.dumps(entry.get("suggested_links", []), ensure_ascii=False),
+                json.dumps(entry.get("backlinks", []), ensure_ascii=False),
+                now,
+            )
+            for rel_path, entry in entries.items()
+        ]
+        if not rows:
+            return 0
+
+        with self.lock:
+            before = self.connection.total_changes
+            self.connection.execute("BEGIN")
+            try:
+                self.connection.executemany(
+                    "INSERT INTO notes VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(path) DO UPDATE SET "
+                    "tags = excluded.tags, "
+                    "suggested_links = excluded.suggested_links, "
+                    "backlinks = excluded.backlinks, "
+                    "updated = excluded.updated "
+                    "WHERE tags != excluded.tags "
+                    "OR suggested_links != excluded.suggested_links "
+                    "OR backlinks != excluded.backlinks",
+                    rows,
+                )
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+            return self.connection.total_changes - before
+
+    def remove(self, rel_paths: Iterable[str]) -> int:
+        """
+        Delete the entries of some notes
+
+        :param rel_paths: Vault-relative paths
+        :return: Number of rows deleted
+        """
+        keys = [(self._key(rel_path),) for rel_path in rel_paths]
+        if not keys:
+            return 0
+        with self.lock:
+            before = self.connection.total_changes
+            self.connection.execute("BEGIN")
+            try:
+                self.connection.executemany("DELETE FROM notes WHERE path = ?", keys)
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+            return self.connection.total_changes - before
+
+    def prune(self, live_paths: Iterable[str]) -> int:
+        """
+        Delete the entries of notes that no longer exist
+
+        :param live_paths: Vault-relative paths of every note in the vault
+        :return: Number of rows deleted
+        """
+        live = {self._key(rel_path) for rel_path in live_paths}
+        return self.remove([path for path in self.paths() if path not in live])
+
+    def get(self, rel_path: str) -> Optional[Dict[str, Any]]:
+        """
+        Read the entry of a note
+
+        :param rel_path: Vault-relative path
+        :return: Dictionary with tags, suggested_links, backlinks and the
+            time the entry last changed, or None
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT tags, suggested_links, backlinks, updated "
+                "FROM notes WHERE path = ?",
+                (self._key(rel_path),),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "tags": json.loads(row[0]),
+            "suggested_links": json.loads(row[1]),
+            "backlinks": json.loads(row[2]),
+            "updated": row[3],
+        }
+
+    def paths(self) -> List[str]:
+        """
+        List the notes with an entry
+
+        :return: Vault-relative paths
+        """
+        with self.lock:
+            return [row[0] for row in self.connection.execute("SELECT path FROM notes")]
+
+    def close(self):
+        """Close the database"""
+        self.connection.close()
@@ -0,0 +1,197 @@
+import logging
+from collections import defaultdict
+from typing import Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+import numpy as np
+
+
+class SimilarityEngine:
+    """Blocked cosine-similarity search over stacked embedding matrices"""
+
+    def __init__(self, block_size: int = 1024):
+        """
+        Initialize the similarity engine
+
+        :param block_size: Number of query rows scored per matrix product; peak
+            memory is roughly block_size * corpus_size * 4 bytes
+        """
+        self.block_size = max(1, block_size)
+
+    @staticmethod
+    def stack(vectors: Sequence[np.ndarray]) -> np.ndarray:
+        """
+        Stack embeddings into a contiguous float32 matrix
+
+        :param vectors: Sequence of 1-D embeddings
+        :return: Matrix with one row per embedding
+        """
+        if len(vectors) == 0:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.ascontiguousarray(np.vstack(vectors), dtype=np.float32)
+
+    @staticmethod
+    def gather(matrix: np.ndarray, rows: Sequence[int]) -> np.ndarray:
+        """
+        Select rows of a (memory-mapped) embedding matrix
+
+        Contiguous rows come back as a view of the matrix; other rows are
+        copied in one fancy-indexing pass.
+
+        :param matrix: Embedding matrix
+        :param rows: Row indices in the order wanted
+        :return: Matrix with the selected rows
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return np.zeros((0, matrix.shape[1]), dtype=np.float32)
+        first = int(rows[0])
+        if np.array_equal(rows, np.arange(first, first + len(rows))):
+            return matrix[first : first + len(rows)]
+        return matrix[rows]
+
+    @staticmethod
+    def inverse_norms(matrix: np.ndarray) -> np.ndarray:
+        """
+        Compute inverse row norms, mapping zero-length rows to zero
+
+        :param matrix: Embedding matrix
+        :return: Vector of inverse norms
+        """
+        norms = np.linalg.norm(matrix, axis=1).astype(np.float32)
+        inverse = np.zeros_like(norms)
+        np.divide(1.0, norms, out=inverse, where=norms > 0)
+        return inverse
+
+    def iter_blocks(self, queries: np.ndarray, corpus: np.ndarray):
+        """
+        Yield cosine-similarity blocks between queries and the corpus
+
+        The corpus is never copied; normalization is applied to the product.
+
+        :param queries: Query matrix
+        :param corpus: Corpus matrix
+        :return: Iterator of (first query row, block of scores)
+        """
+        corpus_scale = self.inverse_norms(corpus)
+        for start in range(0, queries.shape[0], self.block_size):
+            block = np.asarray(
+                queries[start : start + self.block_size], dtype=np.float32
+            )
+            scores = block @ corpus.T
+            scores *= self.inverse_norms(block)[:, None]
+            scores *= corpus_scale[None, :]
+            yield start, scores
+
+    def neighbors(
+        self,
+        queries: np.ndarray,
+        corpus: np.ndarray,
+        threshold: float,
+        top_k: Optional[int] = None,
+        exclude: Optional[Sequence[Set[int]]] = None,
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        Find the corpus rows most similar to each query row
+
+        :param queries: Query matrix
+        :param corpus: Corpus matrix
+        :param threshold: Only scores strictly above this are returned
+        :param top_k: Optional cap on neighbors per query
+        :param exclude: Optional per-query sets of corpus rows to skip
+        :return: Per-query lists of (corpus row, score), best first
+        """
+        results = []
+        if queries.shape[0] == 0 or corpus.shape[0] == 0:
+            return [[] for _ in range(queries.shape[0])]
+
+        for start, scores in self.iter_blocks(queries, corpus):
+            for offset, row_scores in enumerate(scores):
+                if exclude is not None and exclude[start + offset]:
+                    row_scores[list(exclude[start + offset])] = -np.inf
+                results.append(self.select(row_scores, threshold, top_k))
+
+        logging.debug(f"Scored {queries.shape[0]} queries against {corpus.shape[0]}")
+        return results
+
+    @staticmethod
+    def select(
+        row_scores: np.ndarray, threshold: float, top_k: Optional[int] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Select the above-threshold (or top-k) entries of a score row
+
+        Ties keep corpus order, matching a stable sort over the full row.
+
+        :param row_scores: Scores against every corpus row
+        :param threshold: Only scores strictly above this are returned
+        :param top_k: Optional cap on the number of entries
+        :return: List of (corpus row, score), best first
+        """
+        if top_k is not None and top_k <= 0:
+            return []
+
+        candidates = np.flatnonzero(row_scores > threshold)
+        if top_k is not None and len(candidates) > top_k:
+            kept = np.argpartition(-row_scores[candidates], top_k - 1)[:top_k]
+            candidates = np.sort(candidates[kept])
+
+        order = np.argsort(-row_scores[candidates], kind="stable")
+        return [(int(candidates[i]), float(row_scores[candidates[i]])) for i in order]
+
+    def threshold_pairs(
+        self, matrix: np.ndarray, threshold: float
+    ) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Yield the edges of the thresholded similarity graph of a matrix
+
+        :param matrix: Embedding matrix
+        :param threshold: Only pairs scoring strictly above this are edges
+        :return: Iterator of (rows, columns) arrays with row < column
+        """
+        scale = self.inverse_norms(matrix)
+        for start in range(0, matrix.shape[0], self.block_size):
+            end = min(start + self.block_size, matrix.shape[0])
+            # Only columns from the block onwards can hold pairs with row < column
+            scores = matrix[start:end] @ matrix[start:].T
+            scores *= scale[start:end, None]
+            scores *= scale[None, start:]
+            rows, columns = np.nonzero(scores > threshold)
+            rows += start
+            columns += start
+            upper = columns > rows
+            yield rows[upper], columns[upper]
+
+    @staticmethod
+    def connected_components(
+        count: int, pairs: Iterable[Tuple[Sequence[int], Sequence[int]]]
+    ) -> List[List[int]]:
+        """
+        Group rows into the connected components of a graph with union-find
+
+        The components depend only on the edges, not on the order they
+        arrive in.
+
+        :param count: Number of rows
+        :param pairs: Iterable of (rows, columns) edge arrays
+        :return: Components of two or more rows, each sorted, ordered by
+            their first row
+        """
+        parent = list(range(count))
+
+        def find(row: int) -> int:
+            while parent[row] != row:
+                # Path halving keeps the trees shallow
+                parent[row] = parent[parent[row]]
+                row = parent[row]
+            return row
+
+        for rows, columns in pairs:
+            for a, b in zip(np.asarray(rows).tolist(), np.asarray(columns).tolist()):
+                root_a, root_b = find(a), find(b)
+                if root_a != root_b:
+                    # The smaller row becomes the root, so roots are minima
+                    parent[max(root_a, root_b)] = min(root_a, root_b)
+
+        components = defaultdict(list)
+        for row in range(count):
+            components[find(row)].append(row)
+        return [rows for rows in components.values() if len(rows) > 1]
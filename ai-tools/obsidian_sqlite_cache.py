@@ -0,0 +1,319 @@
+import json
+import pickle
+import sqlite3
+import logging
+import threading
+from collections.abc import MutableMapping
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from obsidian_ann import IVFIndex
+from obsidian_cache import ObsidianCache
+
+# Marks a buffered delete
+_DELETED = object()
+
+
+def _encode_pickle(value: Any) -> bytes:
+    return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _encode_json(value: Any) -> str:
+    return json.dumps(value)
+
+
+class SQLiteTable(MutableMapping):
+    """Dict-like key/value table with lazy per-key reads and buffered writes"""
+
+    def __init__(
+        self,
+        connection: sqlite3.Connection,
+        lock: threading.RLock,
+        name: str,
+        encode: Callable[[Any], Any] = _encode_pickle,
+        decode: Callable[[Any], Any] = pickle.loads,
+        commit_every: int = 500,
+    ):
+        """
+        Open (or create) a table
+
+        :param connection: Shared SQLite connection in autocommit mode
+        :param lock: Lock serializing access to the connection
+        :param name: Table name
+        :param encode: Converts values to a storable form
+        :param decode: Converts stored values back
+        :param commit_every: Buffered writes flushed per transaction
+        """
+        self.connection = connection
+        self.lock = lock
+        self.name = name
+        self.encode = encode
+        self.decode = decode
+        self.commit_every = max(1, commit_every)
+        self.pending = {}
+
+        with self.lock:
+            self.connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {name} "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL)"
+            )
+
+    def __getitem__(self, key: str) -> Any:
+        with self.lock:
+            if key in self.pending:
+                value = self.pending[key]
+                if value is _DELETED:
+                    raise KeyError(key)
+                return value
+            row = self.connection.execute(
+                f"SELECT value FROM {self.name} WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return self.decode(row[0])
+
+    def __contains__(self, key: object) -> bool:
+        with self.lock:
+            if key in self.pending:
+                return self.pending[key] is not _DELETED
+            return (
+                self.connection.execute(
+                    f"SELECT 1 FROM {self.name} WHERE key = ?", (key,)
+                ).fetchone()
+                is not None
+            )
+
+    def __setitem__(self, key: str, value: Any):
+        with self.lock:
+            self.pending[key] = value
+            if len(self.pending) >= self.commit_every:
+                self.flush()
+
+    def __delitem__(self, key: str):
+        with self.lock:
+            if key not in self:
+                raise KeyError(key)
+            self.pending[key] = _DELETED
+            if len(self.pending) >= self.commit_every:
+                self.flush()
+
+    def __iter__(self) -> Iterator[str]:
+        with self.lock:
+            self.flush()
+            keys = [
+                row[0]
+                for row in self.connection.execute(f"SELECT key FROM {self.name}")
+            ]
+        return iter(keys)
+
+    def __len__(self) -> int:
+        with self.lock:
+            self.flush()
+            return self.connection.execute(
+                f"SELECT COUNT(*) FROM {self.name}"
+            ).fetchone()[0]
+
+    def items(self) -> List[Tuple[str, Any]]:
+        """
+        Read every entry with a single query
+
+        :return: List of (key, value)
+        """
+        with self.lock:
+            self.flush()
+            rows = self.connection.execute(
+                f"SELECT key, value FROM {self.name}"
+            ).fetchall()
+        return [(key, self.decode(value)) for key, value in rows]
+
+    def clear(self):
+        with self.lock:
+            self.pending.clear()
+            self.connection.execute(f"DELETE FROM {self.name}")
+
+    def flush(self):
+        """Write all buffered changes in one transaction"""
+        with self.lock:
+            if not self.pending:
+                return
+            upserts = [
+                (key, self.encode(value))
+                for key, value in self.pending.items()
+                if value is not _DELETED
+            ]
+            deletes = [
+                (key,) for key, value in self.pending.items() if value is _DELETED
+            ]
+            self.connection.execute("BEGIN")
+            try:
+                self.connection.executemany(
+                    f"INSERT OR REPLACE INTO {self.name} VALUES (?, ?)", upserts
+                )
+                self.connection.executemany(
+                    f"DELETE FROM {self.name} WHERE key = ?", deletes
+                )
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.pending.clear()
+
+
+class SQLiteObsidianCache(ObsidianCache):
+    """ObsidianCache stored in one SQLite database instead of whole-dict pickles"""
+
+    def __init__(self, cache_dir: str, vault_path: str, commit_every: int = 500):
+        """
+        Initialize the cache system
+
+        :param cache_dir: Directory to store cache files
+        :param vault_path: Path to the Obsidian vault (used for cache key generation)
+        :param commit_every: Buffered writes per table flushed in one transaction
+        """
+        self.commit_every = commit_every
+        super().__init__(cache_dir, vault_path)
+
+    def _load_caches(self):
+        """Open the database, migrating existing pickle caches on first use"""
+        self.database_file = self.cache_dir / "cache.sqlite"
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(
+            str(self.database_file), check_same_thread=False, isolation_level=None
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache_info (key TEXT PRIMARY KEY, value TEXT)"
+        )
+
+        def table(name, **codec):
+            return SQLiteTable(
+                self.connection,
+                self.lock,
+                name,
+                commit_every=self.commit_every,
+                **codec,
+            )
+
+        self.tags_cache = table("tags")
+        self.similarities_cache = table("similarities")
+        self.file_metadata = table("metadata", encode=_encode_json, decode=json.loads)
+        self.links_cache = table("links")
+        self.tables = [
+            self.tags_cache,
+            self.similarities_cache,
+            self.file_metadata,
+            self.links_cache,
+        ]
+
+        migrated = self.connection.execute(
+            "SELECT value FROM cache_info WHERE key = 'migrated_pickles'"
+        ).fetchone()
+        if migrated is None:
+            self._migrate_pickles()
+
+        try:
+            if self.ann_index_file.exists():
+                self.ann_index = IVFIndex.load(self.ann_index_file)
+        except Exception as e:
+            logging.warning(f"Error loading ANN index: {e}. Starting without it.")
+            self.ann_index = None
+
+    def _load_embedding_store(self):
+        """Map the embedding matrix, migrating embeddings kept in the database"""
+        super()._load_embedding_store()
+        exists = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'embeddings'"
+        ).fetchone()
+        if exists is None:
+            return
+        entries = SQLiteTable(self.connection, self.lock, "embeddings").items()
+        for key, embedding in entries:
+            self.embeddings_cache[key] = embedding
+        self.embeddings_cache.save()
+        self.connection.execute("DROP TABLE embeddings")
+        if entries:
+            logging.info(f"Migrated {len(entries)} SQLite embeddings to the matrix")
+
+    def _migrate_pickles(self):
+        """Copy the pickle and JSON caches of the default backend into the database"""
+        # Pickled embeddings are migrated by _load_embedding_store
+        sources = [
+            (self.tags_cache_file, self.tags_cache),
+            (self.similarities_cache_file, self.similarities_cache),
+            (self.metadata_cache_file, self.file_metadata),
+            (self.links_cache_file, self.links_cache),
+        ]
+        migrated = 0
+        for path, table in sources:
+            if not path.exists():
+                continue
+            try:
+                if path.suffix == ".json":
+                    with open(path, "r", encoding="utf-8") as f:
+                        entries = json.load(f)
+                else:
+                    with open(path, "rb") as f:
+                        entries = pickle.load(f)
+            except Exception as e:
+                logging.warning(f"Skipping migration of {path}: {e}")
+                continue
+            for key, value in entries.items():
+                table[key] = value
+            table.flush()
+            migrated += len(entries)
+
+        self.connection.execute(
+            "INSERT OR REPLACE INTO cache_info VALUES ('migrated_pickles', '1')"
+        )
+        if migrated:
+            logging.info(f"Migrated {migrated} pickled cache entries to SQLite")
+
+    def _entry_sizes(self, name: str, table: Any) -> Dict[str, int]:
+        """
+        Read stored entry sizes from the database without decoding values
+
+        :param name: Table name from _tables
+        :param table: Cache container
+        :return: Mapping of key to bytes
+        """
+        if not isinstance(table, SQLiteTable):
+            return super()._entry_sizes(name, table)
+        with self.lock:
+            table.flush()
+            return dict(
+                self.connection.execute(
+                    f"SELECT key, LENGTH(value) FROM {table.name}"
+                ).fetchall()
+            )
+
+    def save_caches(self):
+        """Commit all buffered writes and save the embeddings and ANN index"""
+        try:
+            self.embeddings_cache.save()
+            for table in self.tables:
+                table.flush()
+
+            if self.ann_index is not None:
+                self.ann_index.save(self.ann_index_file)
+
+            logging.info(f"Cache saved to {self.database_file}")
+        except Exception as e:
+            logging.error(f"Error saving cache: {e}")
+
+    def clear_cache(self):
+        """Clear all caches"""
+        self.embeddings_cache.clear()
+        for table in self.tables:
+            table.clear()
+        self.ann_index = None
+        if self.ann_index_file.exists():
+            self.ann_index_file.unlink()
+
+        logging.info("Cache cleared")
+
+    def close(self):
+        """Commit buffered writes, close the database and the embedding store"""
+        for table in self.tables:
+            table.flush()
+        self.connection.close()
+        super().close()
@@ -0,0 +1,235 @@
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+from typing import Dict, List, Optional, Set
+
+from obsidian_scanner import VaultScanner
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# struct inotify_event header: wd, mask, cookie, len
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class InotifyBackend:
+    """Reports changed notes from Linux inotify events, read through ctypes"""
+
+    def __init__(self, scanner: VaultScanner):
+        """
+        Watch every non-ignored directory of the vault
+
+        :param scanner: Scanner whose ignore rules select the watched paths
+        """
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self.libc = libc
+        self.scanner = scanner
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories: Dict[int, str] = {}
+        self._watch_tree(scanner.vault_path)
+
+    def _watch_tree(self, root: str) -> List[str]:
+        """
+        Add watches for a directory and its non-ignored subdirectories
+
+        :param root: Directory to watch
+        :return: Notes already inside, which were created before the watch
+        """
+        notes = []
+        pending = [root]
+        while pending:
+            directory = pending.pop()
+            wd = self.libc.inotify_add_watch(
+                self.fd, os.fsencode(directory), WATCH_MASK
+            )
+            if wd < 0:
+                logging.warning(
+                    f"Cannot watch {directory}: {os.strerror(ctypes.get_errno())}"
+                )
+                continue
+            self.directories[wd] = directory
+            try:
+                with os.scandir(directory) as entries:
+                    entries = list(entries)
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.is_dir():
+                    if self.scanner.accepts(entry.path, is_dir=True):
+                        pending.append(entry.path)
+                elif self.scanner.accepts(entry.path):
+                    notes.append(entry.path)
+        return notes
+
+    def read(self, timeout: Optional[float]) -> Optional[Set[str]]:
+        """
+        Wait for events
+
+        :param timeout: Seconds to wait, or None to block
+        :return: Paths of touched notes and removed directories; None if the
+            kernel queue overflowed and the vault must be rescanned
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        paths = set()
+        overflow = False
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            start = offset + _EVENT_HEADER.size
+            name = data[start : start + length].rstrip(b"\0")
+            offset = start + length
+
+            if mask & IN_Q_OVERFLOW:
+                overflow = True
+                continue
+            if mask & IN_IGNORED:
+                self.directories.pop(wd, None)
+                continue
+            directory = self.directories.get(wd)
+            if directory is None or not name:
+                continue
+
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    if self.scanner.accepts(path, is_dir=True):
+                        paths.update(self._watch_tree(path))
+                else:
+                    paths.add(path)
+            elif self.scanner.accepts(path):
+                paths.add(path)
+        return None if overflow else paths
+
+    def close(self):
+        """Stop watching"""
+        os.close(self.fd)
+
+
+class PollingBackend:
+    """Reports changed notes by comparing stat snapshots of the vault"""
+
+    def __init__(self, scanner: VaultScanner, interval: float = 2.0):
+        """
+        Take the initial snapshot
+
+        :param scanner: Scanner listing the notes to poll
+        :param interval: Seconds between snapshots while idle
+        """
+        self.scanner = scanner
+        self.interval = interval
+        self.snapshot = self._snapshot()
+
+    def _snapshot(self) -> Dict[str, tuple]:
+        """Stat every note of the vault"""
+        snapshot = {}
+        for path in self.scanner.discover():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            snapshot[path] = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        return snapshot
+
+    def read(self, timeout: Optional[float]) -> Optional[Set[str]]:
+        """
+        Sleep, then report notes whose stat changed
+
+        :param timeout: Seconds to wait, or None for the polling interval
+        :return: Paths of touched notes
+        """
+        time.sleep(self.interval if timeout is None else timeout)
+        snapshot = self._snapshot()
+        changed = {
+            path for path, stat in snapshot.items() if self.snapshot.get(path) != stat
+        }
+        changed.update(set(self.snapshot) - set(snapshot))
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        """Stop watching"""
+
+
+class VaultWatcher:
+    """Waits for notes to change and debounces bursts of saves into one batch"""
+
+    def __init__(
+        self,
+        scanner: VaultScanner,
+        debounce: float = 0.3,
+        poll_interval: float = 2.0,
+        max_delay: float = 5.0,
+    ):
+        """
+        Start watching the vault with inotify, falling back to polling
+
+        :param scanner: Scanner whose ignore rules select the watched notes
+        :param debounce: Quiet seconds that end a burst of events
+        :param poll_interval: Seconds between snapshots when polling
+        :param max_delay: Longest a burst may delay processing
+        """
+        self.debounce = debounce
+        self.max_delay = max_delay
+        try:
+            self.backend = InotifyBackend(scanner)
+            self.backend_name = "inotify"
+        except (OSError, AttributeError) as e:
+            logging.info(f"inotify unavailable ({e}); polling every {poll_interval}s")
+            self.backend = PollingBackend(scanner, poll_interval)
+            self.backend_name = "polling"
+
+    def wait(self) -> Optional[Set[str]]:
+        """
+        Block until notes change, then collect events until saves pause
+
+        :return: Touched paths, or None if the whole vault must be rescanned
+        """
+        paths = set()
+        while not paths:
+            batch = self.backend.read(None)
+            if batch is None:
+                return None
+            paths |= batch
+
+        deadline = time.monotonic() + self.max_delay
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            batch = self.backend.read(min(self.debounce, remaining))
+            if batch is None:
+                return None
+            if not batch:
+                break
+            paths |= batch
+        return paths
+
+    def close(self):
+        """Stop watching"""
+        self.backend.close()
@@ -0,0 +1,173 @@
+import os
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Sequence, Tuple
+from tqdm import tqdm
+
+FSYNC_MODES = ("none", "file", "batch")
+
+
+class DocumentWriter:
+    """Renders note updates on a thread pool and replaces notes atomically"""
+
+    def __init__(self, max_workers: int = 8, fsync: str = "batch"):
+        """
+        Initialize the writer
+
+        :param max_workers: Threads rendering and writing notes
+        :param fsync: "none" leaves flushing to the OS, "file" syncs every note
+            before it replaces the original, "batch" syncs all notes once at
+            the end before any original is replaced
+        """
+        if fsync not in FSYNC_MODES:
+            raise ValueError(
+                f"Unknown fsync mode {fsync!r}, "
+                f"expected one of {', '.join(FSYNC_MODES)}"
+            )
+        self.max_workers = max(1, max_workers)
+        self.fsync = fsync
+
+    def write(
+        self,
+        paths: Sequence[str],
+        render: Callable[[str, str], str],
+        desc: str = "Updating Documents",
+    ) -> Dict[str, str]:
+        """
+        Render and write notes, skipping those whose content would not change
+
+        Each note is written to a temporary sibling which then replaces it
+        with os.replace, so a crash leaves either the old or the new note,
+        never a truncated one.
+
+        :param paths: Full paths of the notes
+        :param render: Function taking (path, current content) and returning
+            the new content; runs on the thread pool
+        :param desc: Progress bar description
+        :return: Mapping of touched path to the content written, in path order
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            staged = list(
+                tqdm(
+                    executor.map(lambda path: self._stage(path, render), paths),
+                    total=len(paths),
+                    desc=desc,
+                )
+            )
+            staged = [entry for entry in staged if entry is not None]
+
+            if self.fsync == "batch" and staged:
+                # One pass of syncs in parallel, before anything is replaced
+                synced = list(executor.map(self._sync_staged, staged))
+                staged = [entry for entry, ok in zip(staged, synced) if ok]
+
+        touched = {}
+        for path, temp_path, content in staged:
+            if temp_path is None or self._replace(path, temp_path):
+                touched[path] = content
+
+        if self.fsync == "batch":
+            self._sync_directories(touched)
+        return touched
+
+    def _stage(
+        self, path: str, render: Callable[[str, str], str]
+    ) -> Optional[Tuple[str, Optional[str], str]]:
+        """
+        Render one note and write it next to the original
+
+        :param path: Full path of the note
+        :param render: Function returning the new content
+        :return: (path, temporary path, content), with no temporary path
+            unless the replace waits for the batch sync; None if the note is
+            unchanged or failed
+        """
+        temp_path = None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                content = f.read()
+            updated = render(path, content)
+            if updated == content:
+                return None
+
+            # Replace the file a symlinked note points to, not the link
+            directory, name = os.path.split(os.path.realpath(path))
+            fd, temp_path = tempfile.mkstemp(
+                prefix=f".{name}.", suffix=".tmp", dir=directory
+            )
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(updated)
+                if self.fsync == "file":
+                    f.flush()
+                    os.fsync(f.fileno())
+            # Keep the note's permissions instead of mkstemp's 0600
+            os.chmod(temp_path, os.stat(path).st_mode & 0o7777)
+
+            if self.fsync == "batch":
+                return path, temp_path, updated
+            os.replace(temp_path, os.path.join(directory, name))
+            if self.fsync == "file":
+                self._sync_directory(directory)
+            return path, None, updated
+        except Exception as e:
+            logging.error(f"Could not update {os.path.basename(path)}: {e}")
+            if temp_path is not None:
+                self._discard(temp_path)
+            return None
+
+    def _sync_staged(self, entry: Tuple[str, str, str]) -> bool:
+        """Flush a staged note to disk, discarding it on failure"""
+        path, temp_path, _ = entry
+        try:
+            # Windows only syncs handles opened for writing
+            fd = os.open(temp_path, os.O_RDWR)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            return True
+        except OSError as e:
+            logging.error(f"Could not sync {os.path.basename(path)}: {e}")
+            self._discard(temp_path)
+            return False
+
+    def _replace(self, path: str, temp_path: str) -> bool:
+        """Move a staged note over the original"""
+        try:
+            os.replace(temp_path, os.path.realpath(path))
+            return True
+        except OSError as e:
+            logging.error(f"Could not replace {os.path.basename(path)}: {e}")
+            self._discard(temp_path)
+            return False
+
+    def _sync_directories(self, paths: Sequence[str]):
+        """Make the renames of some notes durable, once per directory"""
+        for directory in sorted(
+            {os.path.dirname(os.path.realpath(path)) for path in paths}
+        ):
+            self._sync_directory(directory)
+
+    @staticmethod
+    def _sync_directory(directory: str):
+        """Flush a directory entry to disk where the platform allows it"""
+        try:
+            fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            # Not supported for directories on every platform
+            pass
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _discard(temp_path: str):
+        """Remove a temporary file, ignoring errors"""
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass